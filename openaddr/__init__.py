@@ -3,21 +3,25 @@ import logging; _L = logging.getLogger('openaddr')
 
 from tempfile import mkdtemp, mkstemp
 from os.path import realpath, join, basename, splitext, exists, dirname, abspath, relpath
-from shutil import copy, move, rmtree
+from shutil import copy, move, rmtree, copyfileobj
+from contextlib import ExitStack, contextmanager
 from os import close, utime, remove
 from urllib.parse import urlparse
 from datetime import datetime, date
 from calendar import timegm
+from zipfile import ZipFile, ZIP_DEFLATED
 import json
 
 from osgeo import ogr
-from requests import get
 from boto.s3.connection import S3Connection
 from dateutil.parser import parse
 from .sample import sample_geojson
+from .util import package_output_stream
+from .http_session import get
 
 from .cache import (
     CacheResult,
+    CacheValidators,
     compare_cache_details,
     DownloadTask,
     URLDownloadTask,
@@ -25,6 +29,8 @@ from .cache import (
 
 from .conform import (
     ConformResult,
+    ConformStats,
+    ConformProfile,
     DecompressionTask,
     ExcerptDataTask,
     ConvertToCsvTask,
@@ -32,8 +38,12 @@ from .conform import (
     conform_license,
     conform_attribution,
     conform_sharealike,
+    VSIZIP_CONFORM_TYPES,
 )
 
+from .conform_cache import conform_cache_key
+from . import columnar as columnar_output
+
 with open(join(dirname(__file__), 'VERSION')) as file:
     __version__ = file.read().strip()
 
@@ -82,7 +92,14 @@ def cache(srcjson, destdir, extras):
           version: data version as date?
           elapsed: elapsed time as timedelta object
           output: subprocess output as string
+          validators: CacheValidators with HTTP ETag and Last-Modified
         
+        When extras include a remote cache URL and fingerprint from a previous
+        run with its validators, a single HTTP source URL is requested with
+        If-None-Match and If-Modified-Since, and the previous cache is reused
+        if the server responds 304 Not Modified. Validators are only sent
+        back to the same URL they came from.
+
         Creates and destroys a subdirectory in destdir.
     '''
     start = datetime.now()
@@ -101,7 +118,32 @@ def cache(srcjson, destdir, extras):
         source_urls = [source_urls]
 
     task = DownloadTask.from_type_string(data.get('type'), source)
-    downloaded_files = task.download(source_urls, workdir, data.get('conform'))
+    previous = CacheValidators.fromdict(data)
+
+    # Only the first downloaded file is cached, so only one URL can be revalidated.
+    if previous and isinstance(task, URLDownloadTask) and len(source_urls) == 1 \
+    and urlparse(data.get('cache') or '').scheme in ('http', 'https') and data.get('fingerprint'):
+        if previous.url == source_urls[0]:
+            validators = {source_urls[0]: previous}
+        else:
+            _L.info('Not revalidating cache from {} at {}'.format(previous.url, source_urls[0]))
+            validators = None
+    else:
+        validators = None
+
+    if validators:
+        downloaded_files = task.download(source_urls, workdir, data.get('conform'), validators)
+    else:
+        downloaded_files = task.download(source_urls, workdir, data.get('conform'))
+
+    if validators and not downloaded_files:
+        _L.info('Reusing unchanged cache {}'.format(data['cache']))
+        rmtree(workdir)
+
+        return CacheResult(data['cache'], data['fingerprint'],
+                           data.get('version', None),
+                           datetime.now() - start,
+                           task.validators.get(source_urls[0]))
 
     # FIXME: I wrote the download stuff to assume multiple files because
     # sometimes a Shapefile fileset is splayed across multiple files instead
@@ -115,36 +157,169 @@ def cache(srcjson, destdir, extras):
     #
     resultdir = join(destdir, 'cached')
     data['cache'], data['fingerprint'] \
-        = compare_cache_details(filepath_to_upload, resultdir, data)
+        = compare_cache_details(filepath_to_upload, resultdir, data,
+                                task.fingerprints.get(downloaded_files[0]))
 
     rmtree(workdir)
 
     return CacheResult(data.get('cache', None),
                        data.get('fingerprint', None),
                        data.get('version', None),
-                       datetime.now() - start)
+                       datetime.now() - start,
+                       getattr(task, 'validators', {}).get(source_urls[0]))
 
-def conform(srcjson, destdir, extras):
+def conform(srcjson, destdir, extras, workers=1, profile=False, output_cache=None, package_name=None,
+            columnar=False, compatible_hash=True):
     ''' Python wrapper for openaddresses-conform.
     
+        Conform transforms run in this many worker processes. With profile,
+        time spent in each conform function is collected in stats.profile.
+
+        With output_cache from conform_cache.from_location(), output is looked
+        up by a key from the data fingerprint, conform object, and code version,
+        and saved there after a successful conform. Profiled conforms always run.
+
+        With package_name, like "us/ca/oakland", output is written only into
+        a distribution zip file as with util.package_output() while conforming,
+        and no out.csv is left on disk.
+
+        With columnar, an Arrow IPC copy of the output is also written if
+        the optional pyarrow package is installed, and added to the package.
+
+        HASH values are compatible with earlier releases unless compatible_hash
+        is False, when they are canonical and stable, see conform.RowHasher.
+
         Return a ConformResult object:
 
           processed: URL of processed data CSV
-          path: local path to CSV of processed data
+          path: local path to CSV of processed data, or to package if there is one
           geometry_type: typically Point or Polygon
           elapsed: elapsed time as timedelta object
           output: subprocess output as string
+          stats: ConformStats object with row counts and stage times
+          package: local path to distribution zip of processed data
+          columnar: local path to Arrow IPC copy of processed data
         
         Creates and destroys a subdirectory in destdir.
     '''
     start = datetime.now()
     source, _ = splitext(basename(srcjson))
-    workdir = mkdtemp(prefix='conform-', dir=destdir)
     
     with open(srcjson, 'r') as src_file:
         data = json.load(src_file)
         data.update(extras)
     
+    if package_name:
+        package_args = (package_name, data.get('website') or 'Unknown',
+                        conform_license(data.get('license')) or 'Unknown')
+    else:
+        package_args = None
+    
+    cache_key = conform_cache_key(data, __version__, compatible_hash)
+    cached = None
+
+    if output_cache and cache_key and not profile:
+        try:
+            cached = output_cache.get(cache_key, destdir)
+        except Exception as e:
+            _L.warning("Error reading conform cache; skipping", exc_info=True)
+
+    if cached:
+        _L.info("Found cached conform output %s", cache_key)
+        data_sample, geometry_type = cached.sample, cached.geometry_type
+        conform_stats = ConformStats.fromdict(cached.stats)
+        addr_count = conform_stats.rows_written
+        out_path = realpath(cached.path)
+        package_path = package_args and join(destdir, 'out.zip')
+
+        if package_path:
+            with open(out_path, 'rb') as out_file, \
+                 package_output_stream(package_path, *package_args) as package_file:
+                copyfileobj(out_file, package_file)
+
+            # Output is kept only in the package, as when conforming.
+            remove(out_path)
+            out_path = package_path = realpath(package_path)
+    else:
+        data_sample, geometry_type, addr_count, conform_stats, out_path, package_path \
+            = _conform_source(source, data, destdir, extras, workers, profile, package_args,
+                              compatible_hash)
+
+    if output_cache and cache_key and out_path and not cached:
+        try:
+            with open_output_csv(out_path) as out_file:
+                output_cache.put(cache_key, out_file, data_sample, geometry_type, conform_stats)
+        except Exception as e:
+            _L.warning("Error writing conform cache; skipping", exc_info=True)
+    
+    columnar_path = None
+
+    if columnar and out_path:
+        if not columnar_output.is_available():
+            _L.warning('Install pyarrow for columnar output; skipping')
+        else:
+            columnar_path = _write_columnar(out_path, destdir, package_path, package_name)
+    
+    sharealike_flag = conform_sharealike(data.get('license'))
+    attr_flag, attr_name = conform_attribution(data.get('license'), data.get('attribution'))
+
+    return ConformResult(data.get('processed', None),
+                         data_sample,
+                         data.get('website'),
+                         conform_license(data.get('license')),
+                         geometry_type,
+                         addr_count,
+                         out_path,
+                         datetime.now() - start,
+                         sharealike_flag,
+                         attr_flag,
+                         attr_name,
+                         conform_stats,
+                         package_path,
+                         columnar_path)
+
+def _write_columnar(out_path, destdir, package_path, package_name):
+    ''' Write out.arrow next to output and add it to an optional package.
+
+        Return path to out.arrow, or None if it could not be written.
+    '''
+    columnar_path = join(destdir, 'out' + columnar_output.COLUMNAR_EXT)
+
+    try:
+        with open_output_csv(out_path) as out_file:
+            columnar_output.write_columnar(out_file, columnar_path)
+    except Exception as e:
+        _L.warning("Error writing columnar output; skipping", exc_info=True)
+        return None
+
+    if package_path:
+        with ZipFile(package_path, mode='a', compression=ZIP_DEFLATED) as zip_file:
+            zip_file.write(columnar_path, package_name + columnar_output.COLUMNAR_EXT)
+
+    return realpath(columnar_path)
+
+@contextmanager
+def open_output_csv(out_path):
+    ''' Open conform output CSV bytes from out.csv or a package zip, return a binary file.
+    '''
+    if splitext(out_path)[1].lower() != '.zip':
+        with open(out_path, 'rb') as out_file:
+            yield out_file
+    else:
+        with ZipFile(out_path) as zip_file:
+            csv_names = [name for name in zip_file.namelist() if name.endswith('.csv')]
+            with zip_file.open(csv_names[0]) as out_file:
+                yield out_file
+
+def _conform_source(source, data, destdir, extras, workers, profile, package_args, compatible_hash):
+    ''' Download, decompress, excerpt and convert cached source data.
+
+        Return sample, geometry type, address count, ConformStats, path to
+        output, and path to out.zip if there are package_output_stream() args.
+        Output is out.csv, or only out.zip when there is a package.
+    '''
+    workdir = mkdtemp(prefix='conform-', dir=destdir)
+    
     #
     # The cached data will be a local path.
     #
@@ -160,7 +335,9 @@ def conform(srcjson, destdir, extras):
     downloaded_path = task1.download(source_urls, workdir)
     _L.info("Downloaded to %s", downloaded_path)
 
-    task2 = DecompressionTask.from_type_string(data.get('compression'))
+    # Only Python-read sources need source files extracted to disk.
+    in_place = data.get('conform', {}).get('type') in VSIZIP_CONFORM_TYPES
+    task2 = DecompressionTask.from_type_string(data.get('compression'), in_place)
     names = elaborate_filenames(data.get('conform', {}).get('file', None))
     decompressed_paths = task2.decompress(downloaded_path, workdir, names)
     _L.info("Decompressed to %d files", len(decompressed_paths))
@@ -175,39 +352,42 @@ def conform(srcjson, destdir, extras):
         data_sample = None
         geometry_type = None
 
-    task4 = ConvertToCsvTask()
+    package_path = package_args and join(destdir, 'out.zip')
+
     try:
-        csv_path, addr_count = task4.convert(data, decompressed_paths, workdir)
+        with ExitStack() as stack:
+            if package_path:
+                package_file = stack.enter_context(package_output_stream(package_path, *package_args))
+            else:
+                package_file = None
+
+            task4 = ConvertToCsvTask(workers, profile, package_file, compatible_hash)
+            csv_path, conform_stats = task4.convert(data, decompressed_paths, workdir)
+        addr_count = conform_stats.rows_written if conform_stats else 0
         if addr_count > 0:
-            _L.info("Converted to %s with %d addresses", csv_path, addr_count)
+            _L.info("Converted to %s with %d addresses", csv_path or package_path, addr_count)
         else:
             _L.warning('Found no addresses in source data')
-            csv_path = None
     except Exception as e:
         _L.warning("Error doing conform; skipping", exc_info=True)
-        csv_path, addr_count = None, 0
+        csv_path, addr_count, conform_stats = None, 0, None
 
     out_path = None
-    if csv_path is not None and exists(csv_path):
+    if addr_count > 0 and package_path:
+        # Output was written only into the package.
+        out_path = package_path = realpath(package_path)
+    elif addr_count > 0 and csv_path is not None and exists(csv_path):
         move(csv_path, join(destdir, 'out.csv'))
         out_path = realpath(join(destdir, 'out.csv'))
 
+    if package_path and not out_path:
+        if exists(package_path):
+            remove(package_path)
+        package_path = None
+
     rmtree(workdir)
     
-    sharealike_flag = conform_sharealike(data.get('license'))
-    attr_flag, attr_name = conform_attribution(data.get('license'), data.get('attribution'))
-
-    return ConformResult(data.get('processed', None),
-                         data_sample,
-                         data.get('website'),
-                         conform_license(data.get('license')),
-                         geometry_type,
-                         addr_count,
-                         out_path,
-                         datetime.now() - start,
-                         sharealike_flag,
-                         attr_flag,
-                         attr_name)
+    return data_sample, geometry_type, addr_count, conform_stats, out_path, package_path
 
 def iterate_local_processed_files(runs, sort_on='datetime_tz'):
     ''' Yield a stream of local processed result files for a list of runs.
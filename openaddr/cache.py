@@ -9,6 +9,7 @@ import mimetypes
 import shutil
 import re
 import csv
+import threading
 import simplejson as json
 
 from os import mkdir
@@ -19,17 +20,18 @@ from subprocess import check_output
 from tempfile import mkstemp
 from hashlib import sha1
 from shutil import move
+from concurrent.futures import ThreadPoolExecutor
 from shapely.geometry import shape
 from esridump import EsriDumper
 from esridump.errors import EsriDownloadError
 
 import requests
 
-# HTTP timeout in seconds, used in various calls to requests.get() and requests.post()
+# HTTP timeout in seconds, used in various calls to http_session.request()
 _http_timeout = 180
 
 from .conform import X_FIELDNAME, Y_FIELDNAME, GEOM_FIELDNAME, attrib_types
-from . import util
+from . import util, http_session
 
 def mkdirsp(path):
     try:
@@ -57,22 +59,76 @@ def request(method, url, **kwargs):
 
     try:
         _L.debug("Requesting %s with args %s", url, kwargs.get('params') or kwargs.get('data'))
-        return requests.request(method, url, timeout=_http_timeout, **kwargs)
+        return http_session.request(method, url, timeout=_http_timeout, **kwargs)
     except requests.exceptions.SSLError as e:
         _L.warning("Retrying %s without SSL verification", url)
-        return requests.request(method, url, timeout=_http_timeout, verify=False, **kwargs)
+        return http_session.request(method, url, timeout=_http_timeout, verify=False, **kwargs)
+
+class CacheValidators:
+    ''' HTTP validators of downloaded source data, for conditional requests.
+
+        Kept in run state as "cache etag", "cache last modified", and
+        "cache content length" alongside the cache fingerprint, with the
+        "cache url" they came from so they are only sent back to that URL.
+    '''
+    etag = None
+    last_modified = None
+    content_length = None
+    url = None
+
+    def __init__(self, etag=None, last_modified=None, content_length=None, url=None):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_length = content_length
+        self.url = url
+
+    def __bool__(self):
+        return bool(self.etag or self.last_modified)
+
+    @staticmethod
+    def fromresponse(response, content_length=None, previous=None, url=None):
+        ''' Return validators from response headers, or from previous ones they leave out.
+        '''
+        previous = previous or CacheValidators()
+        return CacheValidators(response.headers.get('ETag', previous.etag),
+                               response.headers.get('Last-Modified', previous.last_modified),
+                               content_length or previous.content_length,
+                               url or previous.url)
+
+    @staticmethod
+    def fromdict(data):
+        ''' Return validators from a run state or source data dictionary.
+        '''
+        return CacheValidators(data.get('cache etag'), data.get('cache last modified'),
+                               data.get('cache content length'), data.get('cache url'))
+
+    def todict(self):
+        return {'cache etag': self.etag, 'cache last modified': self.last_modified,
+                'cache content length': self.content_length, 'cache url': self.url}
+
+    def request_headers(self):
+        ''' Return If-None-Match and If-Modified-Since headers for a conditional GET.
+        '''
+        headers = dict()
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
 
 class CacheResult:
     cache = None
     fingerprint = None
     version = None
     elapsed = None
+    validators = None
 
-    def __init__(self, cache, fingerprint, version, elapsed):
+    def __init__(self, cache, fingerprint, version, elapsed, validators=None):
         self.cache = cache
         self.fingerprint = fingerprint
         self.version = version
         self.elapsed = elapsed
+        self.validators = validators or CacheValidators()
 
     @staticmethod
     def empty():
@@ -82,23 +138,22 @@ class CacheResult:
         return dict(cache=self.cache, fingerprint=self.fingerprint, version=self.version)
 
 
-def compare_cache_details(filepath, resultdir, data):
+def compare_cache_details(filepath, resultdir, data, fingerprint=None):
     ''' Compare cache file with known source data, return cache and fingerprint.
     
         Checks if fresh data is already cached, returns a new file path if not.
+        The file is only read to compute its md5 fingerprint if a hex digest
+        from the download is not passed in.
     '''
     if not exists(filepath):
         raise Exception('cached file {} is missing'.format(filepath))
-        
-    fingerprint = md5()
-
-    with open(filepath, 'rb') as file:
-        for line in file:
-            fingerprint.update(line)
+    
+    if fingerprint is None:
+        fingerprint = file_fingerprint(filepath)
     
     # Determine if anything needs to be done at all.
-    if urlparse(data.get('cache', '')).scheme == 'http' and 'fingerprint' in data:
-        if fingerprint.hexdigest() == data['fingerprint']:
+    if urlparse(data.get('cache', '')).scheme in ('http', 'https') and 'fingerprint' in data:
+        if fingerprint == data['fingerprint']:
             return data['cache'], data['fingerprint']
     
     cache_name = basename(filepath)
@@ -109,7 +164,30 @@ def compare_cache_details(filepath, resultdir, data):
     move(filepath, join(resultdir, cache_name))
     data_cache = 'file://' + join(abspath(resultdir), cache_name)
     
-    return data_cache, fingerprint.hexdigest()
+    return data_cache, fingerprint
+
+def file_fingerprint(filepath, block_size=1024*1024):
+    ''' Return the md5 hex digest of a file, read in blocks.
+    '''
+    fingerprint = md5()
+
+    with open(filepath, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            fingerprint.update(block)
+
+    return fingerprint.hexdigest()
+
+class _FingerprintedFile:
+    ''' Text file wrapper writing UTF-8 to a binary file and updating an md5 digest.
+    '''
+    def __init__(self, file):
+        self.file = file
+        self.fingerprint = md5()
+
+    def write(self, text):
+        data = text.encode('utf-8')
+        self.fingerprint.update(data)
+        return self.file.write(data)
 
 class DownloadError(Exception):
     pass
@@ -130,6 +208,9 @@ class DownloadTask(object):
         self.headers.update(dict(**headers))
         self.query_params = dict(**params)
 
+        # md5 hex digests of downloaded file paths, computed while writing.
+        self.fingerprints = dict()
+
 
     @classmethod
     def from_type_string(clz, type_string, source_prefix=None):
@@ -225,9 +306,39 @@ def get_content_mimetype(chunk):
 
     return mime_type.decode('utf-8')
 
+def _content_range_start(response):
+    ''' Return the first byte position from a Content-Range response header, or None.
+    '''
+    match = re.match(r'^bytes (\d+)-\d+/(\d+|\*)$', response.headers.get('Content-Range', ''))
+    return int(match.group(1)) if match else None
+
+def _resume_validator(response):
+    ''' Return a strong ETag or Last-Modified value for an If-Range request header, or None.
+    '''
+    etag = response.headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return response.headers.get('Last-Modified')
+
 class URLDownloadTask(DownloadTask):
     CHUNK = 16 * 1024
 
+    # Requests made to finish one download, resuming where servers allow it.
+    ATTEMPTS = 5
+
+    # URLs of one source downloaded at once, and at most this many from one host.
+    THREADS = 4
+    HOST_CONNECTIONS = 2
+
+    # Bytes between progress messages for a single large download.
+    PROGRESS_BYTES = 64 * 1024 * 1024
+
+    def __init__(self, *args, **kwargs):
+        DownloadTask.__init__(self, *args, **kwargs)
+
+        # CacheValidators for each URL requested by download().
+        self.validators = dict()
+
     def get_file_path(self, url, dir_path):
         ''' Return a local file path in a directory for a URL.
 
@@ -249,45 +360,177 @@ class URLDownloadTask(DownloadTask):
 
         return os.path.join(dir_path, name_base + path_ext)
 
-    def download(self, source_urls, workdir, conform=None):
-        output_files = []
+    def download(self, source_urls, workdir, conform=None, validators=None):
+        ''' Download source URLs to workdir, return a list of local file paths.
+
+            URLs are downloaded in up to THREADS threads, with no more than
+            HOST_CONNECTIONS from any one host at once. Paths are returned
+            in the order of source_urls, so the first file stays first.
+
+            With validators, a dictionary of CacheValidators from an earlier
+            download of each URL, unchanged URLs are left out of the list.
+        '''
         download_path = os.path.join(workdir, 'http')
         mkdirsp(download_path)
 
-        for source_url in source_urls:
-            file_path = self.get_file_path(source_url, download_path)
+        hosts = {urlparse(source_url).netloc for source_url in source_urls}
+        host_slots = {host: threading.BoundedSemaphore(self.HOST_CONNECTIONS) for host in hosts}
+        path_locks, path_locks_lock = dict(), threading.Lock()
 
-            # FIXME: For URLs with file:// scheme, simply copy the file
-            # to the expected location so that os.path.exists() returns True.
-            # Instead, implement a FileDownloadTask class?
-            scheme, _, path, _, _, _ = urlparse(source_url)
-            if scheme == 'file':
-                shutil.copy(path, file_path)
+        def download_url(numbered_url):
+            number, source_url = numbered_url
 
-            if os.path.exists(file_path):
-                output_files.append(file_path)
-                _L.debug("File exists %s", file_path)
-                continue
+            with host_slots[urlparse(source_url).netloc]:
+                file_path = self.get_file_path(source_url, download_path)
+
+                # Different URLs can share a file path, so only one may write it.
+                with path_locks_lock:
+                    path_lock = path_locks.setdefault(file_path, threading.Lock())
+
+                with path_lock:
+                    _L.info("Downloading %s (%d of %d)", source_url, number, len(source_urls))
+                    previous = (validators or {}).get(source_url)
+                    return self.download_url(source_url, file_path, previous)
+
+        if len(source_urls) > 1:
+            with ThreadPoolExecutor(self.THREADS) as pool:
+                file_paths = list(pool.map(download_url, enumerate(source_urls, 1)))
+        else:
+            file_paths = list(map(download_url, enumerate(source_urls, 1)))
+
+        return [file_path for file_path in file_paths if file_path is not None]
+
+    def download_url(self, source_url, file_path, previous=None):
+        ''' Download one URL to a local file path, return the path or None if unchanged.
+        '''
+        # FIXME: For URLs with file:// scheme, simply copy the file
+        # to the expected location so that os.path.exists() returns True.
+        # Instead, implement a FileDownloadTask class?
+        scheme, _, path, _, _, _ = urlparse(source_url)
+        if scheme == 'file':
+            shutil.copy(path, file_path)
+
+        if os.path.exists(file_path):
+            _L.debug("File exists %s", file_path)
+            return file_path
+
+        size = self.download_file(source_url, file_path, previous)
+
+        if size is None:
+            _L.info("Not modified since last download: %s", source_url)
+            return None
+
+        _L.info("Downloaded %s bytes from %s for file %s", size, source_url, file_path)
+        return file_path
+
+    def download_file(self, source_url, file_path, previous=None):
+        ''' Download a URL to a local file path, return its size in bytes.
+
+            Bytes are written to a ".partial" file which is renamed to file_path
+            once it's complete, checked against Content-Length if there is one.
+            Broken downloads are resumed with Range requests if the server
+            advertises Accept-Ranges, or started over, up to ATTEMPTS times.
+            Error responses are not retried here, see http_session.new_session().
+
+            With previous CacheValidators the first request is conditional,
+            and None is returned if the server responds 304 Not Modified.
+        '''
+        partial_path = file_path + '.partial'
+        size, resumable, validator = 0, False, None
+        fingerprint, progress = md5(), self.PROGRESS_BYTES
+
+        for attempt in range(1, self.ATTEMPTS + 1):
+            headers = dict(self.headers)
+
+            if previous and not size:
+                headers.update(previous.request_headers())
+
+            if size and resumable:
+                headers['Range'] = 'bytes={}-'.format(size)
+                if validator:
+                    headers['If-Range'] = validator
+                _L.info("Resuming %s from byte %d", source_url, size)
 
             try:
-                resp = request('GET', source_url, headers=self.headers, stream=True)
+                resp = request('GET', source_url, headers=headers, stream=True)
             except Exception as e:
-                raise DownloadError("Could not connect to URL", e)
+                # Only the first connection fails right away, reconnects are retried.
+                if attempt == 1:
+                    raise DownloadError("Could not connect to URL", e)
+                _L.warning("Could not reconnect to %s: %s", source_url, e)
+                continue
+
+            if resp.status_code == 304 and previous:
+                resp.close()
+                self.validators[source_url] = CacheValidators.fromresponse(resp, previous=previous, url=source_url)
+                return None
+
+            if resp.status_code == 416 and 'Range' in headers:
+                # Resumed range is no longer valid, so start over.
+                resp.close()
+                size, resumable = 0, False
+                continue
 
-            if resp.status_code in range(400, 499):
+            # Server errors were already retried with backoff by http_session.
+            if resp.status_code >= 400:
+                resp.close()
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
                 raise DownloadError('{} response from {}'.format(resp.status_code, source_url))
-            
-            size = 0
-            with open(file_path, 'wb') as fp:
-                for chunk in resp.iter_content(self.CHUNK):
-                    size += len(chunk)
-                    fp.write(chunk)
 
-            output_files.append(file_path)
+            if resp.status_code == 206 and 'Range' in headers:
+                if _content_range_start(resp) != size:
+                    _L.warning('Unexpected Content-Range from %s, starting over', source_url)
+                    resp.close()
+                    size, resumable = 0, False
+                    continue
+                mode = 'ab'
+            else:
+                # A full response, perhaps because the resource changed since If-Range.
+                mode, size, fingerprint = 'wb', 0, md5()
+
+            # Encoded responses are decoded by iter_content(), so their byte
+            # ranges and lengths don't match the bytes written to the file.
+            identity = resp.headers.get('Content-Encoding', 'identity').lower() == 'identity'
+            resumable = identity and (resp.status_code == 206 or
+                                      resp.headers.get('Accept-Ranges', '').lower() == 'bytes')
+            validator = _resume_validator(resp) if resumable else None
+
+            if identity and 'Content-Length' in resp.headers:
+                expected_size = size + int(resp.headers['Content-Length'])
+            else:
+                expected_size = None
+
+            try:
+                with open(partial_path, mode) as fp:
+                    for chunk in resp.iter_content(self.CHUNK):
+                        size += len(chunk)
+                        fingerprint.update(chunk)
+                        fp.write(chunk)
+
+                        if size >= progress:
+                            _L.info("Downloaded %d bytes so far from %s", size, source_url)
+                            progress = size + self.PROGRESS_BYTES
+            except (requests.exceptions.RequestException, requests.packages.urllib3.exceptions.HTTPError) as e:
+                _L.warning('Download of %s broke after %d bytes: %s', source_url, size, e)
+            else:
+                if expected_size is None or size == expected_size:
+                    os.rename(partial_path, file_path)
+                    self.fingerprints[file_path] = fingerprint.hexdigest()
+                    self.validators[source_url] = CacheValidators.fromresponse(resp, size, url=source_url)
+                    return size
 
-            _L.info("Downloaded %s bytes for file %s", size, file_path)
+                _L.warning('Download of %s ended after %d of %d bytes', source_url, size, expected_size)
+            finally:
+                resp.close()
 
-        return output_files
+            if not resumable or (expected_size is not None and size > expected_size):
+                size = 0
+
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+        raise DownloadError('Could not download {} in {} attempts'.format(source_url, self.ATTEMPTS))
 
 
 class EsriRestDownloadTask(DownloadTask):
@@ -372,7 +615,8 @@ class EsriRestDownloadTask(DownloadTask):
             except EsriDownloadError:
                 _L.info("Source doesn't support count")
 
-            with open(file_path, 'w', encoding='utf-8') as f:
+            with open(file_path, 'wb') as file:
+                f = _FingerprintedFile(file)
                 writer = csv.DictWriter(f, fieldnames=field_names)
                 writer.writeheader()
 
@@ -407,6 +651,7 @@ class EsriRestDownloadTask(DownloadTask):
                     except TypeError:
                         _L.debug("Skipping a geometry", exc_info=True)
 
+            self.fingerprints[file_path] = f.fingerprint.hexdigest()
             _L.info("Downloaded %s ESRI features for file %s", size, file_path)
             output_files.append(file_path)
         return output_files
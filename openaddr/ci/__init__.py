@@ -1,6 +1,7 @@
 import logging; _L = logging.getLogger('openaddr.ci')
 
 from .. import jobs, render, util, __version__
+from ..http_session import get, post
 
 from .objects import (
     add_job, write_job, read_job, complete_set, update_set_renders,
@@ -23,7 +24,7 @@ import json, os, re
 import socket
 
 from flask import Flask, request, Response, jsonify, render_template
-from requests import get, post, ConnectionError
+from requests import ConnectionError
 from uritemplate import expand as expand_uri
 from dateutil.tz import tzutc
 from psycopg2 import connect
@@ -961,8 +962,9 @@ def pop_task_from_taskqueue(s3, task_queue, done_queue, due_queue, heartbeat_que
             # Don't send a due task, since we will not be doing any actual work.
         
         else:
-            # Reserve space for a new run.
+            # Reserve space for a new run, and find cached data to revalidate.
             passed_on_kwargs['run_id'] = objects.add_run(db)
+            previous_state = objects.get_latest_source_state(db, taskdata.name)
 
             # Send a Due task, possibly for later.
             due_task = queuedata.Due(**passed_on_kwargs)
@@ -987,7 +989,7 @@ def pop_task_from_taskqueue(s3, task_queue, done_queue, due_queue, heartbeat_que
             result = work.do_work(s3, passed_on_kwargs['run_id'], source_name,
                                   passed_on_kwargs['content_b64'],
                                   taskdata.render_preview, output_dir,
-                                  mapzen_key)
+                                  mapzen_key, previous_state)
         
         work_wait.join()
 
@@ -84,7 +84,9 @@ class RunState:
         'output', 'process time', 'website', 'skipped', 'license',
         'share-alike', 'attribution required', 'attribution name',
         'attribution flag', 'process hash', 'preview', 'slippymap',
-        'source problem', 'code version', 'tests passed', 'run id')}
+        'source problem', 'code version', 'tests passed', 'run id',
+        'conform stats', 'cache etag', 'cache last modified',
+        'cache content length', 'cache url')}
 
     def __init__(self, json_blob):
         blob_dict = dict(json_blob or {})
@@ -98,6 +100,10 @@ class RunState:
         self.address_count = blob_dict.get('address count')
         self.version = blob_dict.get('version')
         self.fingerprint = blob_dict.get('fingerprint')
+        self.cache_etag = blob_dict.get('cache etag')
+        self.cache_last_modified = blob_dict.get('cache last modified')
+        self.cache_content_length = blob_dict.get('cache content length')
+        self.cache_url = blob_dict.get('cache url')
         self.cache_time = blob_dict.get('cache time')
         self.processed = blob_dict.get('processed')
         self.output = blob_dict.get('output')
@@ -114,6 +120,7 @@ class RunState:
         self.attribution_flag = blob_dict.get('attribution flag')
         self.code_version = blob_dict.get('code version')
         self.tests_passed = blob_dict.get('tests passed')
+        self.conform_stats = blob_dict.get('conform stats')
         
         raw_problem = blob_dict.get('source problem', None)
         self.source_problem = None if (raw_problem is None) else SourceProblem(raw_problem)
@@ -429,6 +436,23 @@ def get_completed_file_run(db, file_id, interval):
     _L.debug('Found previous run {run_id} ({status}) for file {file_id}'.format(**locals()))
     return run_id, RunState(state_dict), status
 
+def get_latest_source_state(db, source_path):
+    ''' Look for the latest successful run of a source path, return its RunState or None.
+    '''
+    db.execute('''SELECT state FROM runs
+                  WHERE source_path = %s
+                    AND status = true
+                  ORDER BY id DESC LIMIT 1''',
+               (source_path, ))
+    
+    previous_run = db.fetchone()
+    
+    if previous_run is None:
+        return None
+
+    (state_dict, ) = previous_run
+    return RunState(state_dict)
+
 def get_completed_run(db, run_id, min_dtz):
     '''
     '''
@@ -13,8 +13,9 @@ from flask import (
     )
 
 from itsdangerous import URLSafeSerializer
-import requests, uritemplate, boto
+import uritemplate, boto
 
+from .. import http_session
 from . import setup_logger
 from .webcommon import log_application_errors, flask_log_level
 
@@ -53,8 +54,8 @@ def exchange_tokens(code, client_id, secret):
         http://developer.github.com/v3/oauth/#parameters-1
     '''
     data = dict(client_id=client_id, code=code, client_secret=secret)
-    resp = requests.post(github_exchange_url, urlencode(data),
-                         headers={'Accept': 'application/json'})
+    resp = http_session.post(github_exchange_url, urlencode(data),
+                             headers={'Accept': 'application/json'})
     auth = resp.json()
 
     if 'error' in auth:
@@ -69,7 +70,7 @@ def user_information(token, org_name='openaddresses'):
     '''
     '''
     header = {'Authorization': 'token {}'.format(token)}
-    resp1 = requests.get(github_user_url, headers=header)
+    resp1 = http_session.get(github_user_url, headers=header)
     
     if resp1.status_code != 200:
         return None, None, None
@@ -78,7 +79,7 @@ def user_information(token, org_name='openaddresses'):
     
     membership_args = dict(org=org_name, username=login)
     membership_url = uritemplate.expand(github_membership_url, membership_args)
-    resp2 = requests.get(membership_url, headers=header)
+    resp2 = http_session.get(membership_url, headers=header)
 
     return login, avatar_url, bool(resp2.status_code in range(200, 299))
 
@@ -12,7 +12,7 @@ from csv import DictWriter
 import json, os, base64
 import hashlib, hmac, time
 
-import memcache, requests
+import memcache
 from jinja2 import Environment, FileSystemLoader
 from flask import (
     Flask, Blueprint, request, Response, current_app, jsonify, render_template,
@@ -30,6 +30,7 @@ from .objects import (
     read_completed_set_runs_count
     )
 
+from .. import http_session
 from ..summarize import summarize_runs, GLASS_HALF_FULL, GLASS_HALF_EMPTY, nice_integer, break_state
 from .webcommon import log_application_errors, nice_domain, flask_log_level
 
@@ -274,15 +275,15 @@ def app_get_run_sample(run_id):
     
     try:
         # Failed sample data requests sometimes result in S3 or HTTP errors.
-        sample_data = requests.get(sample_url).json()
+        sample_data = http_session.get(sample_url).json()
     except:
         try:
             # Try again in case of transient S3 or HTTP problem.
-            sample_data = requests.get(sample_url).json()
+            sample_data = http_session.get(sample_url).json()
         except:
             # Try a third and last time after a short sleep.
             time.sleep(.2)
-            sample_data = requests.get(sample_url).json()
+            sample_data = http_session.get(sample_url).json()
     
     return render_template('run-sample.html', sample_data=sample_data or [])
 
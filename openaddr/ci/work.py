@@ -28,10 +28,14 @@ def make_source_filename(source_name):
 def assemble_runstate(s3, input, source_name, run_id, index_dirname):
     ''' Convert worker index dictionary to RunState.
     '''
-    output = {k: v for (k, v) in input.items()}
+    output = {k: v for (k, v) in input.items() if k not in ('package', 'columnar')}
     output['run id'] = run_id
     
-    if input['cache']:
+    if urlparse(input['cache'] or '').scheme in ('http', 'https'):
+        # Unchanged source data reused from a previous run's cache
+        output['cache'], output['fingerprint'] = input['cache'], input['fingerprint']
+    
+    elif input['cache']:
         # e.g. /runs/0/cache.zip
         cache_path = os.path.join(index_dirname, input['cache'])
         key_name = '/runs/{run}/{cache}'.format(run=run_id, **input)
@@ -47,9 +51,14 @@ def assemble_runstate(s3, input, source_name, run_id, index_dirname):
     
     if input['processed']:
         # e.g. /runs/0/fr/paris.zip
-        processed_path = os.path.join(index_dirname, input['processed'])
-        package_args = input.get('website') or 'Unknown', input.get('license') or 'Unknown'
-        archive_path = util.package_output(source_name, processed_path, *package_args)
+        if input.get('package'):
+            # Already packaged by openaddr-process-one while conforming
+            archive_path = os.path.join(index_dirname, input['package'])
+        else:
+            processed_path = os.path.join(index_dirname, input['processed'])
+            columnar_path = input.get('columnar') and os.path.join(index_dirname, input['columnar'])
+            package_args = input.get('website') or 'Unknown', input.get('license') or 'Unknown'
+            archive_path = util.package_output(source_name, processed_path, *package_args, columnar_path=columnar_path)
         key_name = u'/runs/{run}/{name}.zip'.format(run=run_id, name=source_name)
         url, hash = upload_file(s3, key_name, archive_path)
         output['processed'], output['process hash'] = url, hash
@@ -80,8 +89,11 @@ def assemble_runstate(s3, input, source_name, run_id, index_dirname):
     
     return RunState(output)
 
-def do_work(s3, run_id, source_name, job_contents_b64, render_preview, output_dir, mapzen_key=None):
+def do_work(s3, run_id, source_name, job_contents_b64, render_preview, output_dir, mapzen_key=None, previous_state=None):
     ''' Do the actual work of running a source file in job_contents.
+    
+        With previous_state, the RunState of an earlier successful run, its
+        cached source data is revalidated instead of downloaded again.
     '''
     _L.info('Doing work on source {}'.format(repr(source_name)))
 
@@ -99,12 +111,18 @@ def do_work(s3, run_id, source_name, job_contents_b64, render_preview, output_di
 
     # Invoke the job to do
     logfile_path = os.path.join(workdir, 'logfile.txt')
-    cmd = 'openaddr-process-one', '-l', logfile_path, out_fn, oa_dir
+    cmd = 'openaddr-process-one', '-l', logfile_path, out_fn, oa_dir, '--package-name', source_name
     
     if render_preview and mapzen_key:
         cmd += ('--render-preview', '--mapzen-key', mapzen_key)
     else:
         cmd += ('--skip-preview', )
+    
+    if previous_state and previous_state.cache:
+        state_path = os.path.join(workdir, 'previous-state.json')
+        with open(state_path, 'w') as state_file:
+            state_file.write(previous_state.to_json())
+        cmd += ('--previous-state', state_path)
 
     try:
         known_error, cmd_status = False, 0
@@ -0,0 +1,60 @@
+from __future__ import absolute_import, division, print_function
+import logging; _L = logging.getLogger('openaddr.columnar')
+
+from .conform import OPENADDR_CSV_SCHEMA
+
+try:
+    import pyarrow, pyarrow.csv, pyarrow.ipc
+except ImportError:
+    # pyarrow is an optional dependency for columnar output.
+    pyarrow = None
+
+# File extension for Arrow IPC files, which can be memory-mapped.
+COLUMNAR_EXT = '.arrow'
+
+# Output CSV columns read as numbers; all others are read as strings.
+FLOAT_FIELDNAMES = ('LON', 'LAT')
+
+def is_available():
+    ''' Return true if columnar output can be written with pyarrow.
+    '''
+    return pyarrow is not None
+
+def columnar_schema():
+    ''' Return a pyarrow schema for OPENADDR_CSV_SCHEMA with float64 coordinates.
+    '''
+    return pyarrow.schema([(name, pyarrow.float64() if name in FLOAT_FIELDNAMES else pyarrow.string())
+                           for name in OPENADDR_CSV_SCHEMA])
+
+def write_columnar(csv_file, columnar_path):
+    ''' Write an output CSV path or binary file to an Arrow IPC file, one record batch at a time.
+
+        Blank LON and LAT values become nulls, other blank values stay empty
+        strings. Return the number of rows written.
+    '''
+    schema = columnar_schema()
+    convert_options = pyarrow.csv.ConvertOptions(
+        column_types={field.name: field.type for field in schema},
+        include_columns=OPENADDR_CSV_SCHEMA, strings_can_be_null=False)
+
+    reader = pyarrow.csv.open_csv(csv_file, convert_options=convert_options)
+    row_count = 0
+
+    with pyarrow.ipc.new_file(columnar_path, schema) as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+            row_count += batch.num_rows
+
+    _L.info('Wrote %d rows to %s', row_count, columnar_path)
+    return row_count
+
+def read_columnar(columnar_path, columns=None):
+    ''' Read named columns from an Arrow IPC file into a pyarrow Table.
+
+        The file is memory-mapped, so only the requested columns are read.
+    '''
+    # Record batches share memory with the map, so it is left open for them.
+    source = pyarrow.memory_map(columnar_path, 'r')
+    table = pyarrow.ipc.open_file(source).read_all()
+
+    return table if columns is None else table.select(columns)
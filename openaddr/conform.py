@@ -3,6 +3,7 @@
 from __future__ import absolute_import, division, print_function
 import logging; _L = logging.getLogger('openaddr.conform')
 
+import io
 import os
 import errno
 import tempfile
@@ -13,16 +14,32 @@ import copy
 import sys
 import csv
 import re
+import time
+import math
+import struct
+import shutil
+import multiprocessing
 
+from array import array
 from zipfile import ZipFile
+from concurrent.futures import ThreadPoolExecutor
 from argparse import ArgumentParser
 from locale import getpreferredencoding
 from os.path import splitext
 from hashlib import sha1
 from uuid import uuid4
+from functools import partial
+from contextlib import contextmanager
+from json.encoder import encode_basestring_ascii as encode_json_string
 
 from .sample import sample_geojson, stream_geojson
 
+try:
+    import numpy
+except ImportError:
+    # NumPy is optional, for rounding coordinates in batches.
+    numpy = None
+
 from osgeo import ogr, osr, gdal
 ogr.UseExceptions()
 
@@ -49,6 +66,22 @@ OPENADDR_CSV_SCHEMA = ['LON', 'LAT', 'NUMBER', 'STREET', 'UNIT', 'CITY',
 # We add columns to the extracted CSV with our own data with these names.
 GEOM_FIELDNAME = 'OA:geom'
 X_FIELDNAME, Y_FIELDNAME = 'OA:x', 'OA:y'
+
+# Number of source CSV rows to reproject together.
+REPROJECT_BATCH_SIZE = 4096
+
+# Maximum number of OGR features to read together in columnar batches.
+OGR_BATCH_SIZE = 10000
+
+# Number of GeoJSON features to find centroids for together.
+GEOJSON_BATCH_SIZE = 4096
+
+# Number of threads extracting zip archive members at once; zlib releases the GIL.
+UNZIP_THREADS = 4
+
+# Bytes of a zip archive member to decompress and write at a time.
+UNZIP_CHUNK_SIZE = 1024 * 1024
+
 attrib_types = { 
     'street':   'OA:street',
     'number':   'OA:number',
@@ -61,11 +94,21 @@ attrib_types = {
 }
 
 float_pattern = re.compile('(?<=[0-9])\.0+(?![0-9])')
-
-var_types = attrib_types.copy()
+format_var_pattern = re.compile('\$([0-9]+)')
 
 UNZIPPED_DIRNAME = 'unzipped'
 
+# Conform types read by OGR, which can open zip members through /vsizip/.
+# GeoJSON and CSV are read in Python from real files instead.
+VSIZIP_CONFORM_TYPES = ('shapefile', 'shapefile-polygon', 'gdb', 'xml')
+
+# OGR data and sidecar file extensions for VSIZIP_CONFORM_TYPES, see is_vsizip_readable().
+VSIZIP_EXTENSIONS = ('.shp', '.shx', '.dbf', '.prj', '.cpg', '.qix', '.sbn', '.sbx',
+                     '.gml', '.gfs', '.xsd', '.xml')
+
+# Rows transformed together by ConformPlan.batch_transform().
+TRANSFORM_BATCH_SIZE = 1024
+
 geometry_types = {
     ogr.wkbPoint: 'Point',
     ogr.wkbPoint25D: 'Point 2.5D',
@@ -133,10 +176,14 @@ class ConformResult:
     sharealike_flag = None
     attribution_flag = None
     attribution_name = None
+    stats = None
+    package = None
+    columnar = None
     
     def __init__(self, processed, sample, website, license, geometry_type,
                  address_count, path, elapsed, sharealike_flag,
-                 attribution_flag, attribution_name):
+                 attribution_flag, attribution_name, stats=None, package=None,
+                 columnar=None):
         self.processed = processed
         self.sample = sample
         self.website = website
@@ -148,6 +195,9 @@ class ConformResult:
         self.sharealike_flag = sharealike_flag
         self.attribution_flag = attribution_flag
         self.attribution_name = attribution_name
+        self.stats = stats
+        self.package = package
+        self.columnar = columnar
 
     @staticmethod
     def empty():
@@ -156,17 +206,190 @@ class ConformResult:
     def todict(self):
         return dict(processed=self.processed, sample=self.sample)
 
+class ConformStats:
+    ''' Counts and timings collected while conforming one source.
+
+        rows_read: source rows or features read during extract
+        rows_written: rows written to the output CSV
+        rows_skipped: dictionary of source rows skipped during extract, by reason
+        rows_unlocated: dictionary of source rows extracted without coordinates,
+            by reason like 'blank coordinates' or 'bad coordinates'
+        null_geometry: rows written without a location, for any reason
+        extract_time, transform_time: wall time of each stage in seconds
+        profile: optional ConformProfile with time spent in each conform function
+    '''
+    def __init__(self, profile=None):
+        self.rows_read = 0
+        self.rows_written = 0
+        self.rows_skipped = dict()
+        self.rows_unlocated = dict()
+        self.null_geometry = 0
+        self.extract_time = 0.
+        self.transform_time = 0.
+        self.profile = profile
+
+    def skip(self, reason):
+        "Count one source row skipped for a reason like 'column count'"
+        self.rows_skipped[reason] = self.rows_skipped.get(reason, 0) + 1
+
+    def unlocated(self, reason):
+        "Count one source row extracted without coordinates for a reason like 'bad coordinates'"
+        self.rows_unlocated[reason] = self.rows_unlocated.get(reason, 0) + 1
+
+    def profiled(self, name, function):
+        "Return function, timed as a named stage if there is a profile."
+        return function if self.profile is None else self.profile.wrap(name, function)
+
+    def timed_rows(self, rows):
+        ''' Generate rows from an iterable, adding time spent reading them to extract_time.
+        '''
+        rows, clock = iter(rows), time.perf_counter
+
+        while True:
+            start = clock()
+            row = next(rows, None)
+            self.extract_time += clock() - start
+
+            if row is None:
+                break
+
+            yield row
+
+    def update(self, other):
+        "Add counts and stage times from another ConformStats, such as one for a source part."
+        self.rows_read += other.rows_read
+        self.rows_written += other.rows_written
+        self.null_geometry += other.null_geometry
+        self.extract_time += other.extract_time
+        self.transform_time += other.transform_time
+
+        for (reason, count) in other.rows_skipped.items():
+            self.rows_skipped[reason] = self.rows_skipped.get(reason, 0) + count
+
+        for (reason, count) in other.rows_unlocated.items():
+            self.rows_unlocated[reason] = self.rows_unlocated.get(reason, 0) + count
+
+        if self.profile is not None and other.profile is not None:
+            self.profile.update(other.profile)
+
+    def todict(self):
+        return dict(rows_read=self.rows_read, rows_written=self.rows_written,
+                    rows_skipped=dict(self.rows_skipped), rows_unlocated=dict(self.rows_unlocated),
+                    null_geometry=self.null_geometry,
+                    extract_time=round(self.extract_time, 3),
+                    transform_time=round(self.transform_time, 3))
+
+    @staticmethod
+    def fromdict(input):
+        "Return ConformStats from a dictionary made by todict()"
+        stats = ConformStats()
+        stats.rows_read = input.get('rows_read', 0)
+        stats.rows_written = input.get('rows_written', 0)
+        stats.rows_skipped = dict(input.get('rows_skipped', {}))
+        stats.rows_unlocated = dict(input.get('rows_unlocated', {}))
+        stats.null_geometry = input.get('null_geometry', 0)
+        stats.extract_time = input.get('extract_time', 0.)
+        stats.transform_time = input.get('transform_time', 0.)
+        return stats
+
+class ConformProfile:
+    ''' Call counts and accumulated wall time for named stages of a conform.
+
+        Stage names like "transform/street (regexp)" are nested under the
+        "extract" and "transform" totals. Batch stages like reprojection
+        count one call per batch. Functions are only wrapped when a profile
+        is requested, so unprofiled conforms run without timing overhead.
+    '''
+    def __init__(self):
+        self.calls = dict()
+        self.times = dict()
+
+    def add(self, name, elapsed, calls=1):
+        "Add time spent in some calls to a named stage"
+        self.calls[name] = self.calls.get(name, 0) + calls
+        self.times[name] = self.times.get(name, 0.) + elapsed
+
+    def wrap(self, name, function):
+        "Return a function that calls function, adding its time to a named stage."
+        clock, calls, times = time.perf_counter, self.calls, self.times
+        calls.setdefault(name, 0)
+        times.setdefault(name, 0.)
+
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                times[name] += clock() - start
+                calls[name] += 1
+
+        return timed
+
+    def update(self, other):
+        "Add counts and times from another profile, such as one from a worker process."
+        for (name, elapsed) in other.times.items():
+            self.add(name, elapsed, other.calls[name])
+
+    def report(self):
+        ''' Return a plain text report of stages in name order, with times.
+        '''
+        lines = ['{:<40} {:>12} {:>12} {:>12}'.format('stage', 'calls', 'seconds', 'usec/call')]
+
+        for name in sorted(self.times.keys()):
+            calls, elapsed = self.calls[name], self.times[name]
+            lines.append('{:<40} {:>12} {:>12.3f} {:>12.2f}'.format(name, calls, elapsed,
+                         elapsed * 1e6 / calls if calls else 0))
+
+        return '\n'.join(lines) + '\n'
+
+class ConformContext:
+    ''' Mutable state for conforming one source, instead of module globals.
+
+        Coordinate transformations are created once per SRS and kept here.
+        OGR transformations are not safe to share between threads, so each
+        source conformed in a thread pool should have its own context.
+    '''
+    def __init__(self):
+        self.transforms = dict()
+
+    def transform_to_4326(self, srs):
+        "Return an OGR transform object for a string like EPSG:2913, see _transform_to_4326()"
+        if srs not in self.transforms:
+            self.transforms[srs] = _transform_to_4326(srs)
+        return self.transforms[srs]
+
+@contextmanager
+def logged_gdal_errors():
+    ''' Log GDAL errors from the current thread with gdal_error_handler().
+
+        GDAL error handlers are kept per thread, so the one pushed
+        at import only applies to the importing thread.
+    '''
+    gdal.PushErrorHandler(gdal_error_handler)
+    try:
+        yield
+    finally:
+        gdal.PopErrorHandler()
+
 
 class DecompressionError(Exception):
     pass
 
 class DecompressionTask(object):
+    ''' Task for unpacking downloaded source data.
+
+        With in_place, archive members are returned as GDAL virtual file
+        paths where possible instead of being extracted into workdir.
+    '''
+    def __init__(self, in_place=False):
+        self.in_place = in_place
+
     @classmethod
-    def from_type_string(clz, type_string):
+    def from_type_string(clz, type_string, in_place=False):
         if type_string == None:
-            return GuessDecompressTask()
+            return GuessDecompressTask(in_place)
         elif type_string.lower() == 'zip':
-            return ZipDecompressTask()
+            return ZipDecompressTask(in_place)
         else:
             raise KeyError("I don't know how to decompress for type {}".format(type_string))
 
@@ -181,7 +404,7 @@ class GuessDecompressTask(DecompressionTask):
         types = {type for (type, _) in map(mimetypes.guess_type, source_paths)}
         
         if types == {'application/zip'}:
-            substitute_task = ZipDecompressTask()
+            substitute_task = ZipDecompressTask(self.in_place)
             _L.info('Guessing zip compression based on file names')
             return substitute_task.decompress(source_paths, workdir, filenames)
         
@@ -203,6 +426,101 @@ def is_in(path, names):
 
     return False
 
+def select_zip_members(names, filenames):
+    ''' Return archive member names matching a list of lowercase filenames.
+
+        Matches the same names as is_in(), but looks up each member and its
+        enclosing directories in a set instead of comparing every filename.
+    '''
+    if not filenames:
+        return list(names)
+
+    wanted = {os.path.normpath(filename) for filename in filenames}
+    selected = []
+
+    for name in names:
+        path = os.path.normpath(name.lower())
+
+        while path and path not in wanted and os.path.dirname(path) != path:
+            path = os.path.dirname(path)
+
+        if path in wanted:
+            selected.append(name)
+        else:
+            # Download only the named file, if any.
+            _L.debug("Skipped file {}".format(name))
+
+    return selected
+
+def extract_zip_member(zipfile, expand_path, info):
+    ''' Extract one member of an open ZipFile into expand_path, return its path.
+
+        Member names are cleaned up like ZipFile.extract(), and file contents
+        are copied in chunks of UNZIP_CHUNK_SIZE bytes.
+    '''
+    parts = [part for part in info.filename.split('/') if part not in ('', '.', '..')]
+
+    if not parts:
+        return None
+
+    target_path = os.path.join(expand_path, *parts)
+
+    if info.is_dir():
+        mkdirsp(target_path)
+        return target_path
+
+    mkdirsp(os.path.dirname(target_path))
+
+    with zipfile.open(info) as source, open(target_path, 'wb') as target:
+        shutil.copyfileobj(source, target, UNZIP_CHUNK_SIZE)
+
+    return target_path
+
+def is_vsi_path(path):
+    ''' Return true if path is in a GDAL virtual filesystem, like /vsizip/.
+    '''
+    return path.startswith('/vsi')
+
+def vsizip_paths(zip_path, names):
+    ''' Return GDAL /vsizip/ paths to files and .gdb directories in a zip file.
+    '''
+    vsizip_base = '/vsizip/' + os.path.abspath(zip_path)
+    output_files = []
+
+    for name in names:
+        parts = name.rstrip('/').split('/')
+        dir_parts = parts if name.endswith('/') else parts[:-1]
+
+        for (index, part) in enumerate(dir_parts):
+            if os.path.splitext(part)[-1].lower() == '.gdb':
+                gdb_path = '/'.join([vsizip_base] + parts[:index + 1])
+                if gdb_path not in output_files:
+                    output_files.append(gdb_path)
+                    _L.debug("Found directory {}".format(gdb_path))
+
+        if not name.endswith('/'):
+            output_files.append('/'.join([vsizip_base, name]))
+            _L.debug("Found file {}".format(output_files[-1]))
+
+    return output_files
+
+def is_vsizip_readable(names):
+    ''' Return True if OGR can read a list of zip member names through /vsizip/.
+
+        OGR finds sidecar files by lower or upper case extension, and
+        normalize_ogr_filename_case() needs a real file for any other case.
+        Every member with one of VSIZIP_EXTENSIONS must have it in one of
+        those two cases, and other members are not read by OGR.
+    '''
+    allowed = set(VSIZIP_EXTENSIONS) | {ext.upper() for ext in VSIZIP_EXTENSIONS}
+
+    for name in names:
+        ext = os.path.splitext(name)[-1]
+        if ext.lower() in VSIZIP_EXTENSIONS and ext not in allowed:
+            return False
+
+    return True
+
 class ZipDecompressTask(DecompressionTask):
     def decompress(self, source_paths, workdir, filenames):
         output_files = []
@@ -212,13 +530,19 @@ class ZipDecompressTask(DecompressionTask):
         # Extract contents of zip file into expand_path directory.
         for source_path in source_paths:
             with ZipFile(source_path, 'r') as z:
-                for name in z.namelist():
-                    if len(filenames) and not is_in(name, filenames):
-                        # Download only the named file, if any.
-                        _L.debug("Skipped file {}".format(name))
-                        continue
+                names = select_zip_members(z.namelist(), filenames)
                 
-                    z.extract(name, expand_path)
+                if self.in_place and is_vsizip_readable(names):
+                    _L.info("Reading {} in place".format(source_path))
+                    output_files.extend(vsizip_paths(source_path, names))
+                    continue
+
+                # Start with the largest members so threads finish together.
+                infos = sorted(map(z.getinfo, names), key=lambda info: -info.file_size)
+                extract = partial(extract_zip_member, z, expand_path)
+
+                with ThreadPoolExecutor(UNZIP_THREADS) as pool:
+                    list(pool.map(extract, infos))
         
         # Collect names of directories and files in expand_path directory.
         for (dirpath, dirnames, filenames) in os.walk(expand_path):
@@ -359,10 +683,13 @@ class ExcerptDataTask(object):
         unzipped_paths = dict([(os.path.relpath(source_path, unzipped_base), source_path)
                                for source_path in source_paths])
         
-        if conform['file'] not in unzipped_paths:
+        # Sample only the first of several files.
+        file = conform['file'][0] if isinstance(conform['file'], list) else conform['file']
+
+        if file not in unzipped_paths:
             return []
         
-        csv_path = ExcerptDataTask._make_csv_path(unzipped_paths.get(conform['file']))
+        csv_path = ExcerptDataTask._make_csv_path(unzipped_paths.get(file))
         return [csv_path]
 
     @staticmethod
@@ -380,7 +707,7 @@ class ExcerptDataTask(object):
     @staticmethod
     def _sample_geojson_file(data_path):
         # Sample a few GeoJSON features to save on memory for large datasets.
-        with open(data_path, 'r') as complete_layer:
+        with open(data_path, 'rb') as complete_layer:
             temp_dir = os.path.dirname(data_path)
             _, temp_path = tempfile.mkstemp(dir=temp_dir, suffix='.json')
 
@@ -411,6 +738,10 @@ def elaborate_filenames(filename):
     if filename is None:
         return []
     
+    if isinstance(filename, list):
+        # Several files conformed into one output, see find_source_parts().
+        return [name for each in filename for name in elaborate_filenames(each)]
+    
     filename = filename.lower()
     base, original_ext = splitext(filename)
     
@@ -481,9 +812,16 @@ def find_source_path(source_definition, source_paths):
         elif len(candidates) == 1:
             _L.debug("Selected %s for source", candidates[0])
             return candidates[0]
+        elif "file" in conform:
+            # Multiple candidates; look for the one named by the file attribute
+            source_file_name = conform["file"]
+            for c in candidates:
+                if source_file_name == os.path.basename(c):
+                    return c
+            _L.warning("Source names file %s but could not find it", source_file_name)
+            return None
         else:
             _L.warning("Found more than one JSON file in source, can't pick one")
-            # geojson spec currently doesn't include a file attribute. Maybe it should?
             return None
     elif conform["type"] == "geojson" and source_definition["type"] == "ESRI":
         # Old style ESRI conform: ESRI downloader should only give us a single cache.csv file
@@ -547,9 +885,57 @@ def find_source_path(source_definition, source_paths):
         _L.warning("Unknown source conform type %s", conform["type"])
         return None
 
+def find_source_parts(source_definition, source_paths):
+    ''' Figure out which paths and layers to conform into a single output.
+
+        Conform file and layer may be lists, to concatenate several files or
+        layers of one source. Return a list of (source_definition, source_path)
+        tuples with a single file and layer each, or an empty list if any part
+        can't be found.
+    '''
+    conform = source_definition.get('conform', {})
+    files, layers = conform.get('file'), conform.get('layer')
+
+    if not isinstance(files, list) and not isinstance(layers, list):
+        source_path = find_source_path(source_definition, source_paths)
+        return [] if source_path is None else [(source_definition, source_path)]
+
+    parts = []
+
+    for file in (files if isinstance(files, list) else [files]):
+        for layer in (layers if isinstance(layers, list) else [layers]):
+            part_conform = {k: v for (k, v) in conform.items() if k not in ('file', 'layer')}
+            if file is not None:
+                part_conform['file'] = file
+            if layer is not None:
+                part_conform['layer'] = layer
+
+            part_definition = dict(source_definition, conform=part_conform)
+            source_path = find_source_path(part_definition, source_paths)
+            if source_path is None:
+                return []
+
+            parts.append((part_definition, source_path))
+
+    return parts
+
 class ConvertToCsvTask(object):
     known_types = ('.shp', '.json', '.csv', '.kml', '.gdb')
 
+    def __init__(self, workers=1, profile=False, package_fp=None, compatible_hash=True):
+        ''' Prepare to convert source files to an output CSV with conform_cli().
+
+            workers: number of processes for conform_cli() or conform_parts_cli().
+            profile: True to collect a ConformProfile in returned stats.
+            package_fp: optional binary stream, like one from util.package_output_stream(),
+                to receive the output CSV as it's written instead of a file.
+            compatible_hash: False for canonical HASH values, see RowHasher.
+        '''
+        self.workers = workers
+        self.profile = profile
+        self.package_fp = package_fp
+        self.compatible_hash = compatible_hash
+
     def convert(self, source_definition, source_paths, workdir):
         "Convert a list of source_paths and write results in workdir"
         _L.debug("Converting to %s", workdir)
@@ -560,20 +946,27 @@ class ConvertToCsvTask(object):
         mkdirsp(convert_path)
 
         # Find the source and convert it
-        source_path = find_source_path(source_definition, source_paths)
-        if source_path is not None:
+        parts = find_source_parts(source_definition, source_paths)
+        if parts:
+            _, source_path = parts[0]
             basename, ext = os.path.splitext(os.path.basename(source_path))
             dest_path = os.path.join(convert_path, basename + ".csv")
-            rc = conform_cli(source_definition, source_path, dest_path)
-            if rc == 0:
-                with open(dest_path) as file:
-                    addr_count = sum(1 for line in file) - 1
-
-                # Success! Return the path of the output CSV
-                return dest_path, addr_count
+            if len(parts) == 1:
+                stats = conform_cli(source_definition, source_path, dest_path,
+                                    workers=self.workers, profile=self.profile,
+                                    package_fp=self.package_fp,
+                                    compatible_hash=self.compatible_hash)
+            else:
+                stats = conform_parts_cli(parts, dest_path,
+                                          workers=self.workers, profile=self.profile,
+                                          package_fp=self.package_fp,
+                                          compatible_hash=self.compatible_hash)
+            if stats is not None:
+                # Success! Return the path of the output CSV, if it wasn't packaged instead
+                return (dest_path if self.package_fp is None else None), stats
 
         # Conversion must have failed
-        return None, 0
+        return None, None
 
 def convert_regexp_replace(replace):
     ''' Convert regular expression replace string from $ syntax to slash-syntax.
@@ -603,6 +996,10 @@ def normalize_ogr_filename_case(source_path):
         # Extension is already lowercase, no need to do anything.
         return source_path
 
+    if is_vsi_path(source_path):
+        # Can't link inside a virtual filesystem, but OGR will find sidecars.
+        return source_path
+
     normal_path = base + ext.lower()
     
     if os.path.exists(normal_path):
@@ -621,9 +1018,233 @@ def normalize_ogr_filename_case(source_path):
 
     return normal_path
 
-def ogr_source_to_csv(source_definition, source_path, dest_path):
-    ''' Convert a single shapefile or GeoJSON in source_path and put it in dest_path
+def ogr_arrow_batches(in_layer):
+    ''' Return an iterator of columnar record batches from an OGR layer, or None.
+
+        Uses GDAL's Arrow stream interface, available since GDAL 3.6 with NumPy.
+        Only layers with plain string, integer and real fields are read this
+        way, so that batch values are identical to OGR feature field values.
+    '''
+    if numpy is None or not hasattr(in_layer, 'GetArrowStreamAsNumPy'):
+        return None
+
+    in_layer_defn = in_layer.GetLayerDefn()
+    plain_types = (ogr.OFTString, ogr.OFTInteger, ogr.OFTInteger64, ogr.OFTReal)
+
+    for i in range(0, in_layer_defn.GetFieldCount()):
+        field_defn = in_layer_defn.GetFieldDefn(i)
+        if field_defn.GetType() not in plain_types or field_defn.GetSubType() != ogr.OFSTNone:
+            _L.debug("Not reading batches with %s field %s",
+                     field_defn.GetFieldTypeName(field_defn.GetType()), repr(field_defn.GetName()))
+            return None
+
+    options = ['INCLUDE_FID=NO', 'USE_MASKED_ARRAYS=YES',
+               'MAX_FEATURES_IN_BATCH={:d}'.format(OGR_BATCH_SIZE)]
+
+    try:
+        return iter(in_layer.GetArrowStreamAsNumPy(options=options))
+    except (ImportError, RuntimeError) as e:
+        _L.debug("Not reading batches: %s", e)
+        return None
+
+def ogr_geometry_centroid(geom, coord_transform):
+    ''' Transform an OGR geometry to EPSG:4326 and return X and Y of its centroid.
+
+        Return None for both if there is no geometry.
+    '''
+    if geom is None:
+        return None, None
+
+    geom.Transform(coord_transform)
+
+    # Calculate the centroid of the geometry and write it as X and Y columns
+    try:
+        centroid = geom.Centroid()
+    except RuntimeError as e:
+        if 'Invalid number of points in LinearRing found' not in str(e):
+            raise
+        xmin, xmax, ymin, ymax = geom.GetEnvelope()
+        return xmin/2 + xmax/2, ymin/2 + ymax/2
+    else:
+        return centroid.GetX(), centroid.GetY()
+
+def polygon_centroids(geometries):
+    ''' Return X and Y centroids for a batch of polygon geometries, computed together.
+
+        Each geometry is a list of polygons, each a list of rings as NumPy
+        arrays of X and Y with the exterior ring first. Centroids follow GEOS,
+        which OGR uses: triangles fanned out from the first point of each
+        polygon are summed in order, exterior rings positive and holes
+        negative, so results match OGR's Centroid(). Ring orientation comes
+        from signed area, which agrees with GEOS for simple rings.
+
+        Return a list of (x, y) tuples, with None for geometries OGR must
+        handle instead, like ones with unclosed rings or no area.
+    '''
+    count = len(geometries)
+    rings, ring_geometries, ring_shells, shell_indexes = [], [], [], []
+
+    for (index, polygons) in enumerate(geometries):
+        for polygon in polygons:
+            for (ring_index, ring) in enumerate(polygon):
+                if ring_index == 0:
+                    shell_index = len(rings)
+                rings.append(ring)
+                ring_geometries.append(index)
+                ring_shells.append(ring_index == 0)
+                shell_indexes.append(shell_index)
+
+    if not rings or not any(len(ring) for ring in rings):
+        return [None] * count
+
+    points = numpy.concatenate(rings)
+    x, y, last = points[:, 0], points[:, 1], len(points) - 1
+    lengths = numpy.array([len(ring) for ring in rings])
+    ends = numpy.cumsum(lengths)
+    starts = ends - lengths
+    ring_geometries = numpy.array(ring_geometries)
+    ring_shells = numpy.array(ring_shells, dtype=bool)
+
+    # Rings must be closed with at least four points
+    short = lengths < 4
+    firsts, lasts = numpy.where(short, 0, starts), numpy.where(short, 0, ends - 1)
+    closed = ~short & (x[firsts] == x[lasts]) & (y[firsts] == y[lasts])
+
+    # Edges join each point to the next one in its ring
+    is_edge = numpy.ones(last, dtype=bool)
+    is_edge[(ends - 1)[(ends > 0) & (ends - 1 < last)]] = False
+    edges = numpy.flatnonzero(is_edge)
+    edge_rings = numpy.repeat(numpy.arange(len(rings)), lengths)[edges]
+    edge_geometries = ring_geometries[edge_rings]
+    x1, y1, x2, y2 = x[edges], y[edges], x[edges + 1], y[edges + 1]
+
+    # Triangles fan out from the first point of each polygon's exterior ring
+    has_rings = numpy.bincount(ring_geometries, minlength=count) > 0
+    bases = numpy.minimum(starts[numpy.array(shell_indexes)], last)[edge_rings]
+    bx, by = x[bases], y[bases]
+
+    ring_areas2 = numpy.bincount(edge_rings, weights=x1 * y2 - x2 * y1, minlength=len(rings))
+    signs = numpy.where(ring_shells != (ring_areas2 > 0), 1., -1.)
+    weights = signs[edge_rings] * ((x1 - bx) * (y2 - by) - (x2 - bx) * (y1 - by))
+
+    area_sums2 = numpy.bincount(edge_geometries, weights=weights, minlength=count)
+    cx3 = numpy.bincount(edge_geometries, weights=weights * ((bx + x1) + x2), minlength=count)
+    cy3 = numpy.bincount(edge_geometries, weights=weights * ((by + y1) + y2), minlength=count)
+
+    bad_rings = ~closed | (ring_areas2 == 0)
+    bad = (numpy.bincount(ring_geometries[bad_rings], minlength=count) > 0) \
+        | ~has_rings | (area_sums2 == 0)
+
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        cxs, cys = cx3 / 3 / area_sums2, cy3 / 3 / area_sums2
+
+    bad |= ~(numpy.isfinite(cxs) & numpy.isfinite(cys))
+
+    return [None if is_bad else (cx, cy) for (is_bad, cx, cy)
+            in zip(bad.tolist(), cxs.tolist(), cys.tolist())]
+
+def _wkb_shape(wkb):
+    ''' Return the type and coordinates of Point, Polygon or MultiPolygon WKB.
+
+        Points are returned as "point" with a 1x2 NumPy array, and polygons as
+        "polygon" with a list of polygons of 2D ring arrays for polygon_centroids().
+        Return None for other geometry types, which need OGR.
+    '''
+    def read_header(offset):
+        order = '<' if wkb[offset] == 1 else '>'
+        (code, ) = struct.unpack_from(order + 'I', wkb, offset + 1)
+        # EWKB flags and ISO thousands both add Z and M dimensions
+        dims = 2 + bool(code & 0x80000000) + bool(code & 0x40000000)
+        code &= 0x0fffffff
+        dims += (0, 1, 1, 2)[code // 1000] if code < 4000 else 0
+        return order, code % 1000 if code < 4000 else None, dims, offset + 5
+
+    def read_rings(order, dims, offset):
+        rings = []
+        (ring_count, ) = struct.unpack_from(order + 'I', wkb, offset)
+        offset += 4
+        for _ in range(ring_count):
+            (point_count, ) = struct.unpack_from(order + 'I', wkb, offset)
+            values = numpy.frombuffer(wkb, order + 'f8', point_count * dims, offset + 4)
+            rings.append(values.reshape(point_count, dims)[:, :2])
+            offset += 4 + point_count * dims * 8
+        return rings, offset
+
+    order, type, dims, offset = read_header(0)
+
+    if type == 1:
+        return 'point', numpy.frombuffer(wkb, order + 'f8', dims, offset)[:2].reshape(1, 2)
+    elif type == 3:
+        return 'polygon', [read_rings(order, dims, offset)[0]]
+    elif type == 6:
+        polygons = []
+        (part_count, ) = struct.unpack_from(order + 'I', wkb, offset)
+        offset += 4
+        for _ in range(part_count):
+            part_order, part_type, part_dims, offset = read_header(offset)
+            if part_type != 3:
+                return None
+            rings, offset = read_rings(part_order, part_dims, offset)
+            polygons.append(rings)
+        return 'polygon', polygons
+
+def ogr_wkb_centroids(wkbs, coord_transform):
+    ''' Return lists of X and Y centroids in EPSG:4326 for a batch of WKB geometries.
+
+        Point and polygon coordinates of the whole batch are transformed
+        with one TransformPoints() call, and polygon centroids are computed
+        together with polygon_centroids(). Other geometries, and any that
+        fail this way, are read into OGR one at a time for
+        ogr_geometry_centroid(). Missing geometries give None for X and Y.
+    '''
+    shapes = []
+    for wkb in wkbs:
+        try:
+            shapes.append(None if wkb is None else _wkb_shape(wkb))
+        except (IndexError, struct.error, ValueError):
+            shapes.append(None)
+
+    # Transform all point and ring coordinates of the batch together
+    arrays = [array for shape in shapes if shape is not None for array in
+              ([shape[1]] if shape[0] == 'point' else [r for p in shape[1] for r in p])]
+
+    if arrays and sum(map(len, arrays)):
+        points = numpy.concatenate(arrays)
+        transformed = numpy.array(coord_transform.TransformPoints(points.tolist()), dtype=numpy.float64)
+        arrays = iter(numpy.split(transformed[:, :2], numpy.cumsum([len(a) for a in arrays])[:-1]))
+    else:
+        arrays = iter(arrays)
+
+    centroids, polygon_indexes, polygons = [None] * len(wkbs), [], []
+
+    for (index, shape) in enumerate(shapes):
+        if shape is None:
+            continue
+        elif shape[0] == 'point':
+            x, y = next(arrays)[0].tolist()
+            if math.isfinite(x) and math.isfinite(y):
+                centroids[index] = x, y
+        else:
+            polygon_indexes.append(index)
+            polygons.append([[next(arrays) for _ in polygon] for polygon in shape[1]])
+
+    for (index, centroid) in zip(polygon_indexes, polygon_centroids(polygons)):
+        centroids[index] = centroid
+
+    for (index, wkb) in enumerate(wkbs):
+        if centroids[index] is None:
+            geom = None if wkb is None else ogr.CreateGeometryFromWkb(wkb)
+            centroids[index] = ogr_geometry_centroid(geom, coord_transform)
+
+    return [x for (x, _) in centroids], [y for (_, y) in centroids]
+
+def ogr_source_to_rows(source_definition, source_path, stats=None):
+    ''' Read a single shapefile or GeoJSON in source_path as extracted rows.
+
+        Return a list of field names and a generator of row lists.
+        Features read are counted in optional ConformStats stats.
     '''
+    stats = stats or ConformStats()
     in_datasource = ogr.Open(source_path, 0)
     layer_id = source_definition['conform'].get('layer', 0)
     if isinstance(layer_id, int):
@@ -636,7 +1257,7 @@ def ogr_source_to_csv(source_definition, source_path, dest_path):
     # Determine the appropriate SRS
     inSpatialRef = in_layer.GetSpatialRef()
     srs = source_definition["conform"].get("srs", None)
-    
+
     if srs is not None:
         # OGR may have a projection, but use the explicit SRS instead
         if srs.startswith(u"EPSG:"):
@@ -667,59 +1288,114 @@ def ogr_source_to_csv(source_definition, source_path, dest_path):
     for i in range(0, in_layer_defn.GetFieldCount()):
         field_defn = in_layer_defn.GetFieldDefn(i)
         out_fieldnames.append(field_defn.GetName())
+    field_count = len(out_fieldnames)
     out_fieldnames.append(X_FIELDNAME)
     out_fieldnames.append(Y_FIELDNAME)
 
+    # Repeated field names hold the value of the last field with that name.
+    last_indexes = {name: i for (i, name) in enumerate(out_fieldnames)}
+    value_indexes = [last_indexes[name] for name in out_fieldnames]
+    if value_indexes == list(range(len(out_fieldnames))):
+        value_indexes = None
+
     # Set up a transformation from the source SRS to EPSG:4326
     outSpatialRef = osr.SpatialReference()
     outSpatialRef.ImportFromEPSG(4326)
     coordTransform = osr.CoordinateTransformation(inSpatialRef, outSpatialRef)
 
-    # Write a CSV file with one row per feature in the OGR source
-    with open(dest_path, 'w', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=out_fieldnames)
-        writer.writeheader()
-
-        in_feature = in_layer.GetNextFeature()
-        while in_feature:
-            row = dict()
-
-            for i in range(0, in_layer_defn.GetFieldCount()):
-                field_defn = in_layer_defn.GetFieldDefn(i)
-                field_value = in_feature.GetField(i)
-                if isinstance(field_value, bytes):
-                    # Convert OGR's byte sequence strings to Python Unicode strings
-                    field_value = field_value.decode(shp_encoding) \
-                        if hasattr(field_value, 'decode') else field_value
-                row[field_defn.GetNameRef()] = field_value
-            geom = in_feature.GetGeometryRef()
-            if geom is not None:
-                geom.Transform(coordTransform)
-                # Calculate the centroid of the geometry and write it as X and Y columns
-                try:
-                    centroid = geom.Centroid()
-                except RuntimeError as e:
-                    if 'Invalid number of points in LinearRing found' not in str(e):
-                        raise
-                    xmin, xmax, ymin, ymax = geom.GetEnvelope()
-                    row[X_FIELDNAME] = xmin/2 + xmax/2
-                    row[Y_FIELDNAME] = ymin/2 + ymax/2
-                else:
-                    row[X_FIELDNAME] = centroid.GetX()
-                    row[Y_FIELDNAME] = centroid.GetY()
-            else:
-                row[X_FIELDNAME] = None
-                row[Y_FIELDNAME] = None
+    def decode_string(value):
+        ''' Convert a string field value from an Arrow batch like OGR's GetField().
+        '''
+        try:
+            return value.decode('utf-8')
+        except UnicodeDecodeError:
+            return value.decode(shp_encoding)
+
+    string_fields = {i for i in range(0, field_count)
+                     if in_layer_defn.GetFieldDefn(i).GetType() == ogr.OFTString}
 
-            writer.writerow(row)
+    centroid = stats.profiled('extract/centroid', ogr_geometry_centroid)
+    batch_centroids = stats.profiled('extract/centroids', ogr_wkb_centroids)
+
+    def batch_rows(batch):
+        ''' Generate one row per feature in a record batch from ogr_arrow_batches().
+        '''
+        columns = []
+        for (i, name) in enumerate(out_fieldnames[:field_count]):
+            values = batch[name].tolist()
+            if i in string_fields:
+                values = [decode_string(v) if isinstance(v, bytes) else v for v in values]
+            columns.append(values)
+
+        geometry_names = [name for name in batch.keys() if name not in out_fieldnames]
+        if geometry_names:
+            wkbs = [bytes(wkb) if wkb is not None else None for wkb in batch[geometry_names[0]].tolist()]
+        else:
+            wkbs = [None] * max([len(values) for values in batch.values()] + [0])
+
+        columns.extend(batch_centroids(wkbs, coordTransform))
+
+        for row in zip(*columns):
+            yield list(row)
+
+    def rows():
+        ''' Generate one row per feature in the OGR source.
+        '''
+        batch = batches = None
+        try:
+            batches = ogr_arrow_batches(in_layer) if value_indexes is None else None
+
+            if batches is not None:
+                _L.debug("Reading features in batches of up to %d", OGR_BATCH_SIZE)
+                for batch in batches:
+                    for row in batch_rows(batch):
+                        stats.rows_read += 1
+                        yield row
+                return
 
-            in_feature.Destroy()
             in_feature = in_layer.GetNextFeature()
+            while in_feature:
+                stats.rows_read += 1
+                row = list()
 
-    in_datasource.Destroy()
+                for i in range(0, field_count):
+                    field_value = in_feature.GetField(i)
+                    if isinstance(field_value, bytes):
+                        # Convert OGR's byte sequence strings to Python Unicode strings
+                        field_value = field_value.decode(shp_encoding) \
+                            if hasattr(field_value, 'decode') else field_value
+                    row.append(field_value)
 
-def csv_source_to_csv(source_definition, source_path, dest_path):
-    "Convert a source CSV file to an intermediate form, coerced to UTF-8 and EPSG:4326"
+                row.extend(centroid(in_feature.GetGeometryRef(), coordTransform))
+
+                if value_indexes is not None:
+                    row = [row[i] for i in value_indexes]
+
+                yield row
+
+                in_feature.Destroy()
+                in_feature = in_layer.GetNextFeature()
+        finally:
+            # GDAL requires an Arrow stream to be released before its dataset.
+            batch = batches = None
+            in_datasource.Destroy()
+
+    return out_fieldnames, rows()
+
+def ogr_source_to_csv(source_definition, source_path, dest_path):
+    ''' Convert a single shapefile or GeoJSON in source_path and put it in dest_path
+    '''
+    out_fieldnames, rows = ogr_source_to_rows(source_definition, source_path)
+    write_extracted_csv(out_fieldnames, rows, dest_path)
+
+def csv_source_to_rows(source_definition, source_path, stats=None, context=None):
+    ''' Read a source CSV file as extracted rows, reprojected to EPSG:4326.
+
+        Return a list of field names and a generator of row lists.
+        Rows read and skipped are counted in optional ConformStats stats,
+        and transforms are kept in optional ConformContext context.
+    '''
+    stats, context = stats or ConformStats(), context or ConformContext()
     _L.info("Converting source CSV %s", source_path)
 
     # Encoding processing tag
@@ -730,236 +1406,483 @@ def csv_source_to_csv(source_definition, source_path, dest_path):
 
     # Extract the source CSV, applying conversions to deal with oddball CSV formats
     # Also convert encoding to utf-8 and reproject to EPSG:4326 in X and Y columns
-    with open(source_path, 'r', encoding=enc) as source_fp:
-        in_fieldnames = None   # in most cases, we let the csv module figure these out
-
-        # headers processing tag
-        if "headers" in source_definition["conform"]:
-            headers = source_definition["conform"]["headers"]
-            if (headers == -1):
-                # Read a row off the file to see how many columns it has
-                temp_reader = csv.reader(source_fp, delimiter=str(delim))
-                first_row = next(temp_reader)
-                num_columns = len(first_row)
-                source_fp.seek(0)
-                in_fieldnames = ["COLUMN%d" % n for n in range(1, num_columns+1)]
-                _L.debug("Synthesized header %s", in_fieldnames)
-            else:
-                # partial implementation of headers and skiplines,
-                # matches the sources in our collection as of January 2015
-                # this code handles the case for Korean inputs where there are
-                # two lines of headers and we want to skip the first one
-                assert "skiplines" in source_definition["conform"]
-                assert source_definition["conform"]["skiplines"] == headers
-                # Skip N lines to get to the real header. headers=2 means we skip one line
-                for n in range(1, headers):
-                    next(source_fp)
+    source_fp = open(source_path, 'r', encoding=enc)
+    in_fieldnames = None   # in most cases, we let the csv module figure these out
+
+    # headers processing tag
+    if "headers" in source_definition["conform"]:
+        headers = source_definition["conform"]["headers"]
+        if (headers == -1):
+            # Read a row off the file to see how many columns it has
+            temp_reader = csv.reader(source_fp, delimiter=str(delim))
+            first_row = next(temp_reader)
+            num_columns = len(first_row)
+            source_fp.seek(0)
+            in_fieldnames = ["COLUMN%d" % n for n in range(1, num_columns+1)]
+            _L.debug("Synthesized header %s", in_fieldnames)
         else:
-            # check the source doesn't specify skiplines without headers
-            assert "skiplines" not in source_definition["conform"]
+            # partial implementation of headers and skiplines,
+            # matches the sources in our collection as of January 2015
+            # this code handles the case for Korean inputs where there are
+            # two lines of headers and we want to skip the first one
+            assert "skiplines" in source_definition["conform"]
+            assert source_definition["conform"]["skiplines"] == headers
+            # Skip N lines to get to the real header. headers=2 means we skip one line
+            for n in range(1, headers):
+                next(source_fp)
+    else:
+        # check the source doesn't specify skiplines without headers
+        assert "skiplines" not in source_definition["conform"]
 
-        reader = csv.DictReader(source_fp, delimiter=delim, fieldnames=in_fieldnames)
-        num_fields = len(reader.fieldnames)
+    reader = csv.reader(source_fp, delimiter=delim)
+    if in_fieldnames is None:
+        in_fieldnames = next(reader, None)
+    num_fields = len(in_fieldnames)
 
-        # Construct headers for the extracted CSV file
-        if source_definition["type"] == "ESRI":
-            # ESRI sources: just copy what the downloader gave us. (Already has OA:x and OA:y)
-            out_fieldnames = list(reader.fieldnames)
-        else:
-            # CSV sources: replace the source's lat/lon columns with OA:x and OA:y
-            old_latlon = [source_definition["conform"]["lat"], source_definition["conform"]["lon"]]
-            old_latlon.extend([s.upper() for s in old_latlon])
-            out_fieldnames = [fn for fn in reader.fieldnames if fn not in old_latlon]
-            out_fieldnames.append(X_FIELDNAME)
-            out_fieldnames.append(Y_FIELDNAME)
-
-        # Write the extracted CSV file
-        with open(dest_path, 'w', encoding='utf-8') as dest_fp:
-            writer = csv.DictWriter(dest_fp, out_fieldnames)
-            writer.writeheader()
-            # For every row in the source CSV
-            row_number = 0
-            for source_row in reader:
+    # Column indexes like keys of a csv.DictReader row, where later duplicates win.
+    in_indexes = {name: i for (i, name) in enumerate(in_fieldnames)}
+
+    # Construct headers for the extracted CSV file
+    if source_definition["type"] == "ESRI":
+        # ESRI sources: just copy what the downloader gave us. (Already has OA:x and OA:y)
+        out_fieldnames = list(in_fieldnames)
+    else:
+        # CSV sources: replace the source's lat/lon columns with OA:x and OA:y
+        old_latlon = [source_definition["conform"]["lat"], source_definition["conform"]["lon"]]
+        old_latlon.extend([s.upper() for s in old_latlon])
+        out_fieldnames = [fn for fn in in_fieldnames if fn not in old_latlon]
+        out_fieldnames.append(X_FIELDNAME)
+        out_fieldnames.append(Y_FIELDNAME)
+
+    # Find source lat/lon columns once, failing on the first row if they are missing.
+    lon_names, lat_names, removed_names = row_coordinate_names(source_definition)
+    x_index = next((in_indexes[n] for n in lon_names if n in in_indexes), None)
+    y_index = next((in_indexes[n] for n in lat_names if n in in_indexes), None)
+    missing_error = KeyError(lon_names[-1]) if x_index is None \
+        else (KeyError(lat_names[-1]) if y_index is None else None)
+
+    # Output values are taken from source columns, removed lat/lon columns
+    # are left blank, and X and Y are taken from after the last source column.
+    out_indexes = [num_fields + 1 if name == X_FIELDNAME else
+                   num_fields + 2 if name == Y_FIELDNAME else
+                   num_fields if name in removed_names else
+                   in_indexes[name] for name in out_fieldnames]
+
+    reproject = stats.profiled('extract/reproject', partial(reproject_coordinates, context=context, stats=stats))
+
+    def reprojected(extracted, row_numbers):
+        ''' Generate output rows for a batch of source rows and coordinates.
+        '''
+        coordinates = reproject(source_definition, [(x, y) for (_, x, y) in extracted],
+                                row_numbers=row_numbers)
+        for ((values, _, _), (x, y)) in zip(extracted, coordinates):
+            row = values + [None, x, y]
+            yield [row[i] for i in out_indexes]
+
+    def rows():
+        ''' Generate one row per row in the source CSV.
+        '''
+        with source_fp:
+            row_number, extracted, row_numbers = 0, [], []
+            for values in reader:
+                if not values:
+                    # csv.DictReader skips blank lines
+                    continue
                 row_number += 1
-                if len(source_row) != num_fields:
-                    _L.debug("Skipping row. Got %d columns, expected %d", len(source_row), num_fields)
+                stats.rows_read += 1
+                # Count columns like csv.DictReader, which collects extra values
+                # under one more key and keys repeated field names only once.
+                row_length = len(in_indexes) + (len(values) > num_fields)
+                if row_length != num_fields:
+                    _L.debug("Skipping row. Got %d columns, expected %d", row_length, num_fields)
+                    stats.skip('column count')
                     continue
+                if len(values) > num_fields:
+                    # Extra values under csv.DictReader's key would fail in csv.DictWriter
+                    raise ValueError("dict contains fields not in fieldnames: None")
+                if len(values) < num_fields:
+                    values += [None] * (num_fields - len(values))
                 try:
-                    out_row = row_extract_and_reproject(source_definition, source_row)
+                    if missing_error is not None:
+                        raise missing_error
+                    source_x, source_y = row_source_coordinates(values[x_index], values[y_index])
                 except Exception as e:
                     _L.error('Error in row {}: {}'.format(row_number, e))
                     raise
-                else:
-                    writer.writerow(out_row)
+                extracted.append((values, source_x, source_y))
+                row_numbers.append(row_number)
+                if len(extracted) == REPROJECT_BATCH_SIZE:
+                    yield from reprojected(extracted, row_numbers)
+                    extracted, row_numbers = [], []
+            yield from reprojected(extracted, row_numbers)
 
-def geojson_source_to_csv(source_path, dest_path):
+    return out_fieldnames, rows()
+
+def csv_source_to_csv(source_definition, source_path, dest_path):
+    "Convert a source CSV file to an intermediate form, coerced to UTF-8 and EPSG:4326"
+    out_fieldnames, rows = csv_source_to_rows(source_definition, source_path)
+    write_extracted_csv(out_fieldnames, rows, dest_path)
+
+# WKB is written in native byte order, which is flagged at the start of each geometry.
+_WKB_BYTE_ORDER = b'\x01' if sys.byteorder == 'little' else b'\x00'
+_WKB_COUNT = struct.Struct('=I')
+
+def _wkb_geometry(type_code, body):
+    "Return WKB bytes for a 2D geometry type code and its body."
+    return _WKB_BYTE_ORDER + _WKB_COUNT.pack(type_code) + body
+
+def _wkb_point(position):
+    "Return WKB bytes for a GeoJSON position as a 2D point."
+    return _wkb_geometry(1, array('d', (position[0], position[1])).tobytes())
+
+def _wkb_positions(positions):
+    "Return WKB bytes for a count of GeoJSON positions and their X and Y values."
+    values = array('d', itertools.chain.from_iterable((p[0], p[1]) for p in positions))
+    return _WKB_COUNT.pack(len(positions)) + values.tobytes()
+
+def _wkb_rings(rings):
+    "Return WKB bytes for a count of GeoJSON rings or lines and their positions."
+    return _WKB_COUNT.pack(len(rings)) + b''.join(map(_wkb_positions, rings))
+
+def _wkb_parts(parts):
+    "Return WKB bytes for a count of parts and their WKB geometries."
+    return _WKB_COUNT.pack(len(parts)) + b''.join(parts)
+
+def geojson_geometry_wkb(geometry):
+    ''' Return 2D WKB bytes for a parsed GeoJSON geometry, to read with OGR without JSON.
+
+        Raise ValueError for unknown geometry types, or an error from
+        indexing coordinates if they are not nested as the type requires.
     '''
+    type, coordinates = geometry['type'], geometry.get('coordinates')
+
+    if type == 'Point':
+        return _wkb_point(coordinates)
+    elif type == 'LineString':
+        return _wkb_geometry(2, _wkb_positions(coordinates))
+    elif type == 'Polygon':
+        return _wkb_geometry(3, _wkb_rings(coordinates))
+    elif type == 'MultiPoint':
+        return _wkb_geometry(4, _wkb_parts([_wkb_point(p) for p in coordinates]))
+    elif type == 'MultiLineString':
+        return _wkb_geometry(5, _wkb_parts([_wkb_geometry(2, _wkb_positions(l)) for l in coordinates]))
+    elif type == 'MultiPolygon':
+        return _wkb_geometry(6, _wkb_parts([_wkb_geometry(3, _wkb_rings(p)) for p in coordinates]))
+    elif type == 'GeometryCollection':
+        return _wkb_geometry(7, _wkb_parts([geojson_geometry_wkb(g) for g in geometry['geometries']]))
+
+    raise ValueError('Unknown GeoJSON geometry type {}'.format(type))
+
+def geojson_ogr_geometry(geometry):
+    ''' Return an OGR geometry for a parsed GeoJSON geometry.
+
+        Coordinates are packed straight into WKB. Geometries that can't be
+        packed are read by OGR from JSON instead, so they fail as they would.
     '''
-    # For every row in the source GeoJSON
-    with open(source_path) as file:
-        # Write the extracted CSV file
-        with open(dest_path, 'w', encoding='utf-8') as dest_fp:
-            writer = None
-            for (row_number, feature) in enumerate(stream_geojson(file)):
-                if writer is None:
-                    out_fieldnames = list(feature['properties'].keys())
-                    out_fieldnames.extend((X_FIELDNAME, Y_FIELDNAME))
-                    writer = csv.DictWriter(dest_fp, out_fieldnames)
-                    writer.writeheader()
-                
+    try:
+        wkb = geojson_geometry_wkb(geometry)
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        return ogr.CreateGeometryFromJson(json.dumps(geometry))
+    else:
+        return ogr.CreateGeometryFromWkb(wkb)
+
+def _geojson_ring_array(positions):
+    "Return a NumPy array of X and Y for GeoJSON positions, packed like _wkb_positions()."
+    values = array('d', itertools.chain.from_iterable((p[0], p[1]) for p in positions))
+    return numpy.frombuffer(values, dtype=numpy.float64).reshape(len(positions), 2)
+
+def _geojson_ogr_centroid(geometry):
+    "Return an X and Y centroid from OGR for a parsed GeoJSON geometry, or None."
+    geom = geojson_ogr_geometry(geometry)
+    if geom:
+        center = geom.Centroid()
+        return center.GetX(), center.GetY()
+
+def geojson_centroids(geometries):
+    ''' Return a list of X and Y centroids for a batch of parsed GeoJSON geometries.
+
+        Points are used as they are. With NumPy, polygon and multipolygon
+        centroids are computed together by polygon_centroids(), matching OGR.
+        Other geometries, and polygons it can't handle, are read into OGR
+        from their coordinates for Centroid(). Missing geometries are
+        returned as None.
+    '''
+    centroids, polygon_indexes, polygons = [], [], []
+
+    for (index, geometry) in enumerate(geometries):
+        centroids.append(None)
+
+        if geometry is None:
+            continue
+
+        type = geometry.get('type') if isinstance(geometry, dict) else None
+
+        if type == 'Point' and len(geometry.get('coordinates') or []) >= 2:
+            x, y = geometry['coordinates'][:2]
+            centroids[index] = (float(x), float(y))
+            continue
+
+        if numpy is not None and type in ('Polygon', 'MultiPolygon'):
+            try:
+                parts = [geometry['coordinates']] if type == 'Polygon' else geometry['coordinates']
+                polygons.append([[_geojson_ring_array(ring) for ring in part] for part in parts])
+            except (IndexError, KeyError, TypeError, ValueError):
+                pass
+            else:
+                polygon_indexes.append(index)
+                continue
+
+        centroids[index] = _geojson_ogr_centroid(geometry)
+
+    if polygons:
+        for (index, centroid) in zip(polygon_indexes, polygon_centroids(polygons)):
+            centroids[index] = centroid or _geojson_ogr_centroid(geometries[index])
+
+    return centroids
+
+def geojson_source_to_rows(source_path, stats=None):
+    ''' Read a GeoJSON file as a stream of extracted rows.
+
+        Return a list of field names taken from the first feature
+        and a generator of row lists. Features read and skipped are
+        counted in optional ConformStats stats.
+    '''
+    stats = stats or ConformStats()
+    file = open(source_path, 'rb')
+    features = stream_geojson(file)
+    first_feature = next(features, None)
+
+    # With no features there are no field names, like an empty extracted CSV.
+    property_names, out_fieldnames = [], []
+    if first_feature is not None:
+        property_names.extend(first_feature['properties'].keys())
+        out_fieldnames.extend(property_names + [X_FIELDNAME, Y_FIELDNAME])
+        features = itertools.chain([first_feature], features)
+    known_names = set(out_fieldnames)
+    batch_centroids = stats.profiled('extract/centroids', geojson_centroids)
+
+    def rows():
+        ''' Generate one row per feature in the source GeoJSON.
+        '''
+        with file:
+            row_number = 0
+            while True:
+                batch = list(itertools.islice(features, GEOJSON_BATCH_SIZE))
+                if not batch:
+                    break
                 try:
-                    row = feature['properties']
-                    geom = ogr.CreateGeometryFromJson(json.dumps(feature['geometry']))
-                    if not geom:
-                        continue
-                    center = geom.Centroid()
+                    centroids = batch_centroids([feature['geometry'] for feature in batch])
                 except Exception as e:
-                    _L.error('Error in row {}: {}'.format(row_number, e))
+                    _L.error('Error in rows {}-{}: {}'.format(row_number, row_number + len(batch) - 1, e))
                     raise
-                else:
-                    row.update({X_FIELDNAME: center.GetX(), Y_FIELDNAME: center.GetY()})
-                    writer.writerow(row)
 
-_transform_cache = {}
+                for (feature, centroid) in zip(batch, centroids):
+                    row_number += 1
+                    stats.rows_read += 1
+                    if centroid is None:
+                        stats.skip('no geometry')
+                        continue
+
+                    properties = feature['properties']
+
+                    # Fail on unexpected properties like csv.DictWriter
+                    wrong_fields = properties.keys() - known_names
+                    if wrong_fields:
+                        raise ValueError("dict contains fields not in fieldnames: "
+                                         + ", ".join([repr(x) for x in wrong_fields]))
+                    row = [properties.get(name) for name in property_names]
+                    row.extend(centroid)
+                    yield row
+
+    return out_fieldnames, rows()
+
+def geojson_source_to_csv(source_path, dest_path):
+    '''
+    '''
+    out_fieldnames, rows = geojson_source_to_rows(source_path)
+    write_extracted_csv(out_fieldnames, rows, dest_path)
+
+def write_extracted_csv(fieldnames, rows, dest_path):
+    ''' Write extracted rows to an intermediate CSV file in UTF-8.
+
+        With no field names, the file is left empty.
+    '''
+    with open(dest_path, 'w', encoding='utf-8') as dest_fp:
+        writer = csv.writer(dest_fp)
+        if fieldnames:
+            writer.writerow(fieldnames)
+        writer.writerows(rows)
+
+def row_as_extracted(row):
+    ''' Return an extracted row just as csv.reader would read it from a file.
+
+        Values are written by csv.writer in write_extracted_csv() as strings,
+        with None written as an empty string and carriage returns read back as
+        newlines, so streamed rows are conformed exactly like rows from a file.
+    '''
+    extracted = []
+    for value in row:
+        if value is None:
+            value = ''
+        elif type(value) is not str:
+            value = str(value)
+        elif '\r' in value:
+            value = value.replace('\r\n', '\n').replace('\r', '\n')
+        extracted.append(value)
+    return extracted
+
 def _transform_to_4326(srs):
     "Given a string like EPSG:2913, return an OGR transform object to turn it in to EPSG:4326"
-    if srs not in _transform_cache:
-        epsg_id = int(srs[5:]) if srs.startswith("EPSG:") else int(srs)
-        # Manufacture a transform object if it's not in the cache
-        in_spatial_ref = osr.SpatialReference()
-        in_spatial_ref.ImportFromEPSG(epsg_id)
-        out_spatial_ref = osr.SpatialReference()
-        out_spatial_ref.ImportFromEPSG(4326)
-        _transform_cache[srs] = osr.CoordinateTransformation(in_spatial_ref, out_spatial_ref)
-    return _transform_cache[srs]
-
-def row_extract_and_reproject(source_definition, source_row):
+    epsg_id = int(srs[5:]) if srs.startswith("EPSG:") else int(srs)
+    in_spatial_ref = osr.SpatialReference()
+    in_spatial_ref.ImportFromEPSG(epsg_id)
+    out_spatial_ref = osr.SpatialReference()
+    out_spatial_ref.ImportFromEPSG(4326)
+    return osr.CoordinateTransformation(in_spatial_ref, out_spatial_ref)
+
+def row_extract_and_reproject(source_definition, source_row, context=None):
     ''' Find lat/lon in source CSV data and store it in ESPG:4326 in X/Y in the row
     '''
+    extracted = row_extract_coordinates(source_definition, source_row)
+    return reproject_extracted_rows(source_definition, [extracted], context)[0]
+
+def row_coordinate_names(source_definition):
+    ''' Return names of source CSV columns with longitude and latitude.
+
+        Return tuples of lon and lat names to look for in order, and
+        a set of all lat/lon names to delete from the extracted row.
+    '''
     # Ignore any lat/lon names for natively geographic sources.
     ignore_conform_names = bool(source_definition['conform']['type'] != 'csv')
 
     # ESRI-derived source CSV is synthetic; we should ignore any lat/lon names.
     ignore_conform_names |= bool(source_definition['type'] == 'ESRI')
 
-    # Set local variables lon_name, source_x, lat_name, source_y
     if ignore_conform_names:
         # Use our own X_FIELDNAME convention
         lat_name = Y_FIELDNAME
         lon_name = X_FIELDNAME
-        source_x = source_row[lon_name]
-        source_y = source_row[lat_name]
+        lon_names, lat_names = (lon_name, ), (lat_name, )
     else:
         # Conforms can name the lat/lon columns from the original source data
         lat_name = source_definition["conform"]["lat"]
         lon_name = source_definition["conform"]["lon"]
-        if lon_name in source_row:
-            source_x = source_row[lon_name]
-        else:
-            source_x = source_row[lon_name.upper()]
-        if lat_name in source_row:
-            source_y = source_row[lat_name]
-        else:
-            source_y = source_row[lat_name.upper()]
+        lon_names, lat_names = (lon_name, lon_name.upper()), (lat_name, lat_name.upper())
 
-    # Prepare an output row with the source lat and lon columns deleted
-    out_row = copy.deepcopy(source_row)
-    for n in lon_name, lon_name.upper(), lat_name, lat_name.upper():
-        if n in out_row: del out_row[n]
+    return lon_names, lat_names, {lon_name, lon_name.upper(), lat_name, lat_name.upper()}
+
+def row_source_coordinates(source_x, source_y):
+    ''' Convert commas to periods for decimal numbers in source x and y strings.
 
-    # Convert commas to periods for decimal numbers. (Not using locale.)
+        Return None for both if either one is missing.
+    '''
+    # (Not using locale.)
     try:
-        source_x = source_x.replace(',', '.')
-        source_y = source_y.replace(',', '.')
+        return source_x.replace(',', '.'), source_y.replace(',', '.')
     except AttributeError:
-        # Add blank data to the output CSV and get out
-        out_row[X_FIELDNAME] = None
-        out_row[Y_FIELDNAME] = None
-        return out_row
-
-    # Reproject the coordinates if necessary
-    if "srs" not in source_definition["conform"]:
-        out_x = source_x
-        out_y = source_y
-    else:
-        try:
-            srs = source_definition["conform"]["srs"]
-            source_x = float(source_x)
-            source_y = float(source_y)
-            point = ogr.Geometry(ogr.wkbPoint)
-            point.AddPoint_2D(float(source_x), float(source_y))
-
-            point.Transform(_transform_to_4326(srs))
-            out_x = "%.7f" % point.GetX()
-            out_y = "%.7f" % point.GetY()
-        except (TypeError, ValueError) as e:
-            if not (source_x == "" or source_y == ""):
-                _L.debug("Could not reproject %s %s in SRS %s", source_x, source_y, srs)
-            out_x = ""
-            out_y = ""
+        return None, None
 
-    # Add the reprojected data to the output CSV
-    out_row[X_FIELDNAME] = out_x
-    out_row[Y_FIELDNAME] = out_y
-    return out_row
+def row_extract_coordinates(source_definition, source_row):
+    ''' Find lat/lon in source CSV data, without reprojecting it.
 
+        Return a copy of the row with source lat and lon columns deleted, and
+        source x and y from row_source_coordinates().
+    '''
+    lon_names, lat_names, removed_names = row_coordinate_names(source_definition)
+    source_x = source_row[next((n for n in lon_names if n in source_row), lon_names[-1])]
+    source_y = source_row[next((n for n in lat_names if n in source_row), lat_names[-1])]
 
-def row_function(sd, row, key, fxn):
-    function = fxn["function"]
-    if function == "join":
-        row = row_fxn_join(sd, row, key, fxn)
-    elif function == "regexp":
-        row = row_fxn_regexp(sd, row, key, fxn)
-    elif function == "format":
-        row = row_fxn_format(sd, row, key, fxn)
-    elif function == "prefixed_number":
-        row = row_fxn_prefixed_number(sd, row, key, fxn)
-    elif function == "postfixed_street":
-        row = row_fxn_postfixed_street(sd, row, key, fxn)
-    elif function == "remove_prefix":
-        row = row_fxn_remove_prefix(sd, row, key, fxn)
-    elif function == "remove_postfix":
-        row = row_fxn_remove_postfix(sd, row, key, fxn)
-    elif function == "chain":
-        row = row_fxn_chain(sd, row, key, fxn)
+    # Prepare an output row with the source lat and lon columns deleted
+    out_row = {k: v for (k, v) in source_row.items() if k not in removed_names}
+    source_x, source_y = row_source_coordinates(source_x, source_y)
 
-    return row
+    return out_row, source_x, source_y
 
+def reproject_extracted_rows(source_definition, extracted, context=None):
+    ''' Store ESPG:4326 X/Y in a batch of rows from row_extract_coordinates().
 
+        Return a list of the output rows.
+    '''
+    coordinates = reproject_coordinates(source_definition, [(x, y) for (_, x, y) in extracted], context)
 
-### Row-level conform code. Inputs and outputs are individual rows in a CSV file.
-### The input row may or may not be modified in place. The output row is always returned.
+    for ((out_row, _, _), (x, y)) in zip(extracted, coordinates):
+        out_row[X_FIELDNAME] = x
+        out_row[Y_FIELDNAME] = y
 
-def row_transform_and_convert(sd, row):
-    "Apply the full conform transform and extract operations to a row"
+    return [out_row for (out_row, _, _) in extracted]
 
-    # Some conform specs have fields named with a case different from the source
-    row = row_smash_case(sd, row)
+def reproject_coordinates(source_definition, coordinates, context=None, row_numbers=None, stats=None):
+    ''' Reproject a batch of source x, y strings from row_source_coordinates().
 
-    c = sd["conform"]
+        Points in a conform with an SRS are reprojected together with a single
+        call to TransformPoints(), using a transform from optional ConformContext
+        context. Return a list of ESPG:4326 x, y strings, blank strings for
+        bad coordinates or None for missing ones. Optional row_numbers are
+        source row numbers of the coordinates, to log with any error.
+        Missing or blank and bad coordinates are counted in optional
+        ConformStats stats as "blank coordinates" and "bad coordinates".
+    '''
+    stats = stats or ConformStats()
+    srs = source_definition["conform"].get("srs", None)
+    transform, points, point_indexes, reprojected = None, [], [], []
 
-    "Attribute tags can utilize processing fxns"
-    for k, v in c.items():
-        if k in attrib_types and type(v) is list:
-            "Lists are a concat shortcut to concat fields with spaces"
-            row = row_merge(sd, row, k)
-        if k in attrib_types and type(v) is dict:
-            "Dicts are custom processing functions"
-            row = row_function(sd, row, k, v)
+    for (source_x, source_y) in coordinates:
+        if source_x is None or source_y is None:
+            # Add blank data to the output CSV
+            stats.unlocated('blank coordinates')
+            reprojected.append((None, None))
+            continue
 
-    if "advanced_merge" in c:
-        raise ValueError('Found unsupported "advanced_merge" option in conform')
-    if "split" in c:
-        raise ValueError('Found unsupported "split" option in conform')
-    
-    # Make up a random fingerprint if none exists
-    cache_fingerprint = sd.get('fingerprint', str(uuid4()))
-    
-    row2 = row_convert_to_out(sd, row)
-    row3 = row_canonicalize_unit_and_number(sd, row2)
-    row4 = row_round_lat_lon(sd, row3)
-    row5 = row_calculate_hash(cache_fingerprint, row4)
-    return row5
+        if "srs" not in source_definition["conform"]:
+            if source_x == "" or source_y == "":
+                stats.unlocated('blank coordinates')
+            reprojected.append((source_x, source_y))
+            continue
+
+        try:
+            point = float(source_x), float(source_y)
+            transform = transform or (context or ConformContext()).transform_to_4326(srs)
+        except (TypeError, ValueError) as e:
+            if source_x == "" or source_y == "":
+                stats.unlocated('blank coordinates')
+            else:
+                _L.debug("Could not reproject %s %s in SRS %s", source_x, source_y, srs)
+                stats.unlocated('bad coordinates')
+            reprojected.append(("", ""))
+        else:
+            point_indexes.append(len(reprojected))
+            points.append(point)
+            reprojected.append(None)
+
+    if points:
+        for (index, point, (x, y, _)) in zip(point_indexes, points, transform.TransformPoints(points)):
+            if not (math.isfinite(x) and math.isfinite(y)):
+                # Transform the failed point alone, to raise OGR's own error.
+                try:
+                    geom = ogr.Geometry(ogr.wkbPoint)
+                    geom.AddPoint_2D(*point)
+                    geom.Transform(transform)
+                    x, y = geom.GetX(), geom.GetY()
+                except Exception as e:
+                    row_number = row_numbers[index] if row_numbers else index + 1
+                    _L.error('Error in row {}: {}'.format(row_number, e))
+                    raise
+            reprojected[index] = ("%.7f" % x, "%.7f" % y)
+
+    return reprojected
+
+
+def row_function(sd, row, key, fxn):
+    return apply_to_dict_row(partial(compile_row_function, key, fxn), row)
+
+
+
+### Row-level conform code. Inputs and outputs are individual rows in a CSV file.
+### The input row may or may not be modified in place. The output row is always returned.
+
+def row_transform_and_convert(sd, row):
+    "Apply the full conform transform and extract operations to a row"
+    return ConformPlan(sd).transform(row)
 
 def conform_smash_case(source_definition):
     "Convert all named fields in source_definition object to lowercase. Returns new object."
@@ -991,142 +1914,112 @@ def row_smash_case(sd, input):
 
 def row_merge(sd, row, key):
     "Merge multiple columns like 'Maple','St' to 'Maple St'"
-    merge_data = [row[field] for field in sd["conform"][key]]
-    row[var_types[key]] = ' '.join(merge_data)
-    return row
+    return apply_to_dict_row(partial(compile_merge, key, sd["conform"][key]), row)
 
 def row_fxn_join(sd, row, key, fxn):
     "Create new columns by merging arbitrary other columns with a separator"
-    separator = fxn.get("separator", " ")
-    try:
-        fields = [float_pattern.sub(u'', (row[n] or u'').strip()) for n in fxn["fields"]]
-        row[var_types[key]] = separator.join([f for f in fields if f])
-    except Exception as e:
-        _L.debug("Failure to merge row %r %s", e, row)
-    return row
+    return apply_to_dict_row(partial(compile_fxn_join, key, fxn), row)
 
 def row_fxn_regexp(sd, row, key, fxn):
     "Split addresses like '123 Maple St' into '123' and 'Maple St'"
-    pattern = re.compile(fxn.get("pattern", False))
-    replace = fxn.get('replace', False)
-    if replace:
-        match = re.sub(pattern, convert_regexp_replace(replace), row[fxn["field"]])
-        row[var_types[key]] = match;
-    else:
-        match = pattern.search(row[fxn["field"]])
-        row[var_types[key]] = ''.join(match.groups()) if match else '';
-    return row
+    return apply_to_dict_row(partial(compile_fxn_regexp, key, fxn), row)
 
 def row_fxn_prefixed_number(sd, row, key, fxn):
     "Extract '123' from '123 Maple St'"
-
-    match = prefixed_number_pattern.search(row[fxn["field"]])
-    row[var_types[key]] = ''.join(match.groups()) if match else '';
-
-    return row
+    return apply_to_dict_row(partial(compile_fxn_prefixed_number, key, fxn), row)
 
 def row_fxn_postfixed_street(sd, row, key, fxn):
     "Extract 'Maple St' from '123 Maple St'"
-
-    match = postfixed_street_pattern.search(row[fxn["field"]])
-    row[var_types[key]] = ''.join(match.groups()) if match else '';
-
-    return row
+    return apply_to_dict_row(partial(compile_fxn_postfixed_street, key, fxn), row)
 
 def row_fxn_remove_prefix(sd, row, key, fxn):
     "Remove a 'field_to_remove' from the beginning of 'field' if it is a prefix"
-    if row[fxn["field"]].startswith(row[fxn["field_to_remove"]]):
-        row[var_types[key]] = row[fxn["field"]][len(row[fxn["field_to_remove"]]):].lstrip(' ')
-    else:
-        row[var_types[key]] = row[fxn["field"]]
-
-    return row
+    return apply_to_dict_row(partial(compile_fxn_remove_prefix, key, fxn), row)
 
 def row_fxn_remove_postfix(sd, row, key, fxn):
     "Remove a 'field_to_remove' from the end of 'field' if it is a postfix"
-    if row[fxn["field_to_remove"]] != "" and row[fxn["field"]].endswith(row[fxn["field_to_remove"]]):
-        row[var_types[key]] = row[fxn["field"]][0:len(row[fxn["field_to_remove"]])*-1].rstrip(' ')
-    else:
-        row[var_types[key]] = row[fxn["field"]]
-
-    return row
+    return apply_to_dict_row(partial(compile_fxn_remove_postfix, key, fxn), row)
 
 def row_fxn_format(sd, row, key, fxn):
     "Format multiple fields using a user-specified format string"
-    format_var_pattern = re.compile('\$([0-9]+)')
+    return apply_to_dict_row(partial(compile_fxn_format, key, fxn), row)
 
-    fields = [(row[n] or u'').strip() for n in fxn["fields"]]
-
-    parts = []
-
-    idx = 0
-    num_fields_added = 0
+def row_fxn_chain(sd, row, key, fxn):
+    "Apply a list of functions in order, optionally through an intermediate variable"
+    return apply_to_dict_row(partial(compile_fxn_chain, key, fxn), row)
 
-    format_str = fxn["format"]
-    for i, m in enumerate(format_var_pattern.finditer(format_str)):
-        field_idx = int(m.group(1))
-        start, end = m.span()
+def row_canonicalize_unit_and_number(sd, row):
+    "Canonicalize address unit and number"
+    row["UNIT"] = (row["UNIT"] or '').strip()
+    row["NUMBER"] = float_pattern.sub(u'', (row["NUMBER"] or u'').strip())
+    row["STREET"] = (row["STREET"] or '').strip()
+    return row
 
-        if field_idx > 0 and field_idx - 1 < len(fields):
-            field = fields[field_idx - 1]
+def _round_wgs84_to_7(n):
+    "Round a WGS84 coordinate to 7 decimal points. Input and output both strings."
+    try:
+        return "%.12g" % round(float(n), 7)
+    except:
+        return n
 
-            if idx == 0 or (num_fields_added > 0 and field):
-                parts.append(format_str[idx:start])
+def _round_wgs84_column(values):
+    ''' Return a list of _round_wgs84_to_7() for each value in a column.
 
-            if field:
-                # if the value being added ends with '.0+', remove it
-                # certain fields ending with '.0+' are normalized by removing that
-                #  suffix in row_canonicalize_unit_and_number but this isn't 
-                #  possible when not-the-last component fields submitted to the format 
-                #  function end with '.0+'
-                field = float_pattern.sub(u'', field)
+        With NumPy, parsed values are rounded together. Values near a half
+        step of 1e-7 or too large to scale exactly are rounded one at a time,
+        so output is always identical to _round_wgs84_to_7().
+    '''
+    if numpy is None or not values:
+        return [_round_wgs84_to_7(n) for n in values]
 
-                parts.append(field)
-                num_fields_added += 1
+    try:
+        # Blank values are kept as-is, like failed parses below.
+        floats = numpy.array([float(n) if n else math.nan for n in values], dtype=numpy.float64)
+    except (TypeError, ValueError):
+        return [_round_wgs84_to_7(n) for n in values]
 
-        idx = end
+    with numpy.errstate(invalid='ignore', over='ignore'):
+        scaled = floats * 1e7
+        rounded = numpy.rint(scaled)
+        half_step = numpy.abs(scaled - numpy.floor(scaled) - .5)
+        exact = (numpy.abs(scaled) < 2**52) & (half_step > 4 * numpy.spacing(numpy.abs(scaled)))
 
-    if num_fields_added > 0:
-        parts.append(format_str[idx:])
-        row[var_types[key]] = u''.join(parts)
-    else:
-        row[var_types[key]] = u''
+    return ["%.12g" % r if is_exact else _round_wgs84_to_7(n)
+            for (r, is_exact, n) in zip((rounded / 1e7).tolist(), exact.tolist(), values)]
 
-    return row
+def _canonicalize_number_column(values):
+    ''' Return a list of stripped numbers for a column, without trailing ".0".
 
-def row_fxn_chain(sd, row, key, fxn):
-    functions = fxn["functions"]
-    var = fxn.get("variable")
+        Numbers are joined to apply float_pattern once to the whole column.
+    '''
+    numbers = [(n or u'').strip() for n in values]
+    joined = u'\n'.join(numbers)
 
-    original_key = key
+    if joined.count(u'\n') != len(numbers) - 1:
+        # Some numbers have line breaks of their own.
+        return [float_pattern.sub(u'', n) for n in numbers]
 
-    if var and var not in attrib_types and var.lstrip('OA:') not in attrib_types and var not in row:
-        var_types[var] = var
-        row[var_types[var]] = u''
-        key = var
-    else:
-        var = None
+    return float_pattern.sub(u'', joined).split(u'\n') if numbers else []
 
-    for func in functions:
-        row = row_function(sd, row, key, func)
+def canonicalize_out_rows(outs):
+    ''' Canonicalize a list of output rows in place, one column at a time.
 
-    row[var_types[original_key]] = row[var_types[key]]
+        Output rows are lists in the order of OPENADDR_CSV_SCHEMA without
+        HASH. Results match row_canonicalize_unit_and_number() and
+        row_round_lat_lon() applied to each row.
+    '''
+    LON, LAT, NUMBER, STREET, UNIT = 0, 1, 2, 3, 4
 
-    return row
+    columns = zip(
+        _round_wgs84_column([out[LON] for out in outs]),
+        _round_wgs84_column([out[LAT] for out in outs]),
+        _canonicalize_number_column([out[NUMBER] for out in outs]),
+        [(out[STREET] or '').strip() for out in outs],
+        [(out[UNIT] or '').strip() for out in outs])
 
-def row_canonicalize_unit_and_number(sd, row):
-    "Canonicalize address unit and number"
-    row["UNIT"] = (row["UNIT"] or '').strip()
-    row["NUMBER"] = float_pattern.sub(u'', (row["NUMBER"] or u'').strip())
-    row["STREET"] = (row["STREET"] or '').strip()
-    return row
+    for (out, values) in zip(outs, columns):
+        out[:UNIT + 1] = values
 
-def _round_wgs84_to_7(n):
-    "Round a WGS84 coordinate to 7 decimal points. Input and output both strings."
-    try:
-        return "%.12g" % round(float(n), 7)
-    except:
-        return n
 def row_round_lat_lon(sd, row):
     "Round WGS84 coordinates to 1cm precision"
     row["LON"] = _round_wgs84_to_7(row["LON"])
@@ -1144,6 +2037,61 @@ def row_calculate_hash(cache_fingerprint, row):
     
     return row
 
+class RowHasher:
+    ''' Calculate the HASH column for output rows of one source.
+
+        The cache fingerprint is hashed once, and the SHA-1 state is copied
+        for each row. Rows are lists of values in OPENADDR_CSV_SCHEMA order
+        without HASH.
+
+        In compatible mode, rows are serialized to the same JSON as
+        row_calculate_hash(), so hash values match earlier releases. A
+        missing fingerprint is replaced by one random UUID, so hash values
+        are at least stable within one hasher. Otherwise rows use a fixed
+        canonical byte layout: big-endian 32-bit byte lengths of all UTF-8
+        values as written to CSV, followed by the values themselves. A
+        missing fingerprint is then treated as empty, so hash values are
+        stable from one run to the next.
+    '''
+    names = OPENADDR_CSV_SCHEMA[:-1]
+
+    def __init__(self, fingerprint, compatible=True):
+        self.compatible = compatible
+        if compatible and fingerprint is None:
+            fingerprint = str(uuid4())
+        self.base_hash = sha1((fingerprint or '').encode('utf8'))
+
+        # JSON template for sorted name/value pairs, see row_calculate_hash()
+        self.json_order = sorted(range(len(self.names)), key=self.names.__getitem__)
+        self.json_template = '[{}]'.format(','.join(['[{},%s]'.format(json.dumps(self.names[i]))
+                                                     for i in self.json_order]))
+        self.lengths_format = struct.Struct('>{}I'.format(len(self.names)))
+
+    def hash(self, values):
+        "Return a 16-character hex hash of a list of output values."
+        hash = self.base_hash.copy()
+
+        if self.compatible:
+            hash.update(self.serialize_json(values))
+        else:
+            hash.update(self.serialize_canonical(values))
+
+        return hash.hexdigest()[:16]
+
+    def serialize_json(self, values):
+        "Serialize values like json.dumps(sorted(row.items())) in row_calculate_hash()."
+        encoded = [encode_json_string(value) if type(value) is str
+                   else ('null' if value is None else json.dumps(value, separators=(',', ':')))
+                   for value in [values[i] for i in self.json_order]]
+        return (self.json_template % tuple(encoded)).encode('utf8')
+
+    def serialize_canonical(self, values):
+        "Serialize values with their byte lengths, None written as empty like csv.writer."
+        encoded = [value.encode('utf8') if type(value) is str
+                   else ('' if value is None else str(value)).encode('utf8')
+                   for value in values]
+        return self.lengths_format.pack(*map(len, encoded)) + b''.join(encoded)
+
 def row_convert_to_out(sd, row):
     "Convert a row from the source schema to OpenAddresses output schema"
     # note: sd["conform"]["lat"] and lon were already applied in the extraction from source
@@ -1168,77 +2116,858 @@ def row_convert_to_out(sd, row):
         "ID": row.get(keys['id'], None) if keys['id'] else None,
     }
 
+### Compiled conform plans. The conform object is read once per source and
+### turned into row operations for a particular set of columns. Operations
+### accept a single position-indexed row as a list and modify it in place.
+
+class RowColumns:
+    ''' Indexes of named columns in position-indexed rows.
+
+        Start with the names of source columns, where later duplicates win
+        just like in a dictionary. Columns written by row operations are
+        added to the end of the row with add().
+    '''
+    def __init__(self, fieldnames):
+        self.indexes = {name: index for (index, name) in enumerate(fieldnames)}
+        self.width = len(fieldnames)
+
+    def __contains__(self, name):
+        return name in self.indexes
+
+    def get(self, name):
+        "Return the index of a named column, or None if it does not exist."
+        return self.indexes.get(name)
+
+    def index(self, name):
+        "Return the index of a named column, or raise KeyError like a missing dictionary key."
+        return self.indexes[name]
+
+    def add(self, name):
+        "Return the index of a named column, adding it to the end of the row if necessary."
+        if name not in self.indexes:
+            self.indexes[name] = self.width
+            self.width += 1
+        return self.indexes[name]
+
+def var_name(key):
+    "Return the row column written for an attribute like 'street' or a chain variable."
+    return attrib_types.get(key, key)
+
+def compile_missing(name):
+    "Return a row operation that fails on a missing column like a dictionary lookup."
+    return compile_error(KeyError(name))
+
+def compile_error(error):
+    "Return a row operation that always raises an error."
+    def fail(row):
+        raise error
+
+    return fail
+
+def compile_merge(key, fields, columns):
+    "Merge multiple columns like 'Maple','St' to 'Maple St'"
+    try:
+        indexes = [columns.index(field) for field in fields]
+    except KeyError as e:
+        return compile_missing(e.args[0])
+
+    target = columns.add(var_name(key))
+
+    def merge(row):
+        row[target] = ' '.join([row[index] for index in indexes])
+
+    return merge
+
+def compile_fxn_join(key, fxn, columns):
+    "Create new columns by merging arbitrary other columns with a separator"
+    separator = fxn.get("separator", " ")
+
+    try:
+        indexes = [columns.index(name) for name in fxn.get("fields")]
+    except Exception as e:
+        error = e
+
+        def join(row):
+            _L.debug("Failure to merge row %r %s", error, row)
+
+        return join
+
+    target = columns.add(var_name(key))
+
+    def join(row):
+        try:
+            fields = [float_pattern.sub(u'', (row[index] or u'').strip()) for index in indexes]
+            row[target] = separator.join([f for f in fields if f])
+        except Exception as e:
+            _L.debug("Failure to merge row %r %s", e, row)
+
+    return join
+
+def compile_fxn_regexp(key, fxn, columns):
+    "Split addresses like '123 Maple St' into '123' and 'Maple St'"
+    pattern = re.compile(fxn.get("pattern", False))
+    replace = fxn.get('replace', False)
+
+    if fxn["field"] not in columns:
+        return compile_missing(fxn["field"])
+
+    field, target = columns.index(fxn["field"]), columns.add(var_name(key))
+
+    if replace:
+        replace = convert_regexp_replace(replace)
+
+        def regexp_replace(row):
+            row[target] = pattern.sub(replace, row[field])
+
+        return regexp_replace
+
+    def regexp_search(row):
+        match = pattern.search(row[field])
+        row[target] = ''.join(match.groups()) if match else ''
+
+    return regexp_search
+
+def compile_fxn_prefixed_number(key, fxn, columns):
+    "Extract '123' from '123 Maple St'"
+    return compile_fxn_regexp(key, dict(field=fxn["field"], pattern=prefixed_number_pattern), columns)
+
+def compile_fxn_postfixed_street(key, fxn, columns):
+    "Extract 'Maple St' from '123 Maple St'"
+    return compile_fxn_regexp(key, dict(field=fxn["field"], pattern=postfixed_street_pattern), columns)
+
+def compile_fxn_remove_prefix(key, fxn, columns):
+    "Remove a 'field_to_remove' from the beginning of 'field' if it is a prefix"
+    try:
+        field, field_to_remove = columns.index(fxn["field"]), columns.index(fxn["field_to_remove"])
+    except KeyError as e:
+        return compile_missing(e.args[0])
+
+    target = columns.add(var_name(key))
+
+    def remove_prefix(row):
+        value, prefix = row[field], row[field_to_remove]
+        if value.startswith(prefix):
+            row[target] = value[len(prefix):].lstrip(' ')
+        else:
+            row[target] = value
+
+    return remove_prefix
+
+def compile_fxn_remove_postfix(key, fxn, columns):
+    "Remove a 'field_to_remove' from the end of 'field' if it is a postfix"
+    try:
+        field, field_to_remove = columns.index(fxn["field"]), columns.index(fxn["field_to_remove"])
+    except KeyError as e:
+        return compile_missing(e.args[0])
+
+    target = columns.add(var_name(key))
+
+    def remove_postfix(row):
+        value, postfix = row[field], row[field_to_remove]
+        if postfix != "" and value.endswith(postfix):
+            row[target] = value[0:len(postfix)*-1].rstrip(' ')
+        else:
+            row[target] = value
+
+    return remove_postfix
+
+def compile_fxn_format(key, fxn, columns):
+    ''' Format multiple fields using a user-specified format string.
+
+        The format string is split up front into pieces of literal text,
+        each followed by a field index or None for out-of-range "$n" values.
+    '''
+    format_str = fxn["format"]
+    pieces, idx = [], 0
+
+    try:
+        indexes = [columns.index(name) for name in fxn["fields"]]
+    except KeyError as e:
+        return compile_missing(e.args[0])
+
+    for m in format_var_pattern.finditer(format_str):
+        field_idx = int(m.group(1))
+        start, end = m.span()
+
+        if field_idx > 0 and field_idx - 1 < len(indexes):
+            pieces.append((format_str[idx:start], field_idx - 1))
+        else:
+            pieces.append((format_str[idx:start], None))
+
+        idx = end
+
+    tail = format_str[idx:]
+    target = columns.add(var_name(key))
+
+    def format(row):
+        fields = [(row[index] or u'').strip() for index in indexes]
+        parts = []
+        num_fields_added = 0
+
+        for (i, (text, field_idx)) in enumerate(pieces):
+            if field_idx is None:
+                continue
+
+            field = fields[field_idx]
+
+            if i == 0 or (num_fields_added > 0 and field):
+                parts.append(text)
+
+            if field:
+                # if the value being added ends with '.0+', remove it
+                # certain fields ending with '.0+' are normalized by removing that
+                #  suffix in row_canonicalize_unit_and_number but this isn't
+                #  possible when not-the-last component fields submitted to the format
+                #  function end with '.0+'
+                parts.append(float_pattern.sub(u'', field))
+                num_fields_added += 1
+
+        if num_fields_added > 0:
+            parts.append(tail)
+            row[target] = u''.join(parts)
+        else:
+            row[target] = u''
+
+    return format
+
+def compile_fxn_chain(key, fxn, columns):
+    ''' Apply a list of functions in order, optionally through an intermediate variable.
+
+        The variable is skipped when it names an attribute or an existing column.
+    '''
+    var = fxn.get("variable")
+
+    if var and var not in attrib_types and var.lstrip('OA:') not in attrib_types \
+       and var not in columns:
+        variable = columns.add(var)
+        operations = [compile_row_function(var, func, columns) for func in fxn["functions"]]
+        target = columns.add(var_name(key))
+
+        def chain(row):
+            row[variable] = u''
+            for operation in operations:
+                operation(row)
+            row[target] = row[variable]
+
+        return chain
+
+    operations = [compile_row_function(key, func, columns) for func in fxn["functions"]]
+
+    def chain(row):
+        for operation in operations:
+            operation(row)
+
+    return chain
+
+row_function_compilers = {
+    'join': compile_fxn_join,
+    'regexp': compile_fxn_regexp,
+    'format': compile_fxn_format,
+    'prefixed_number': compile_fxn_prefixed_number,
+    'postfixed_street': compile_fxn_postfixed_street,
+    'remove_prefix': compile_fxn_remove_prefix,
+    'remove_postfix': compile_fxn_remove_postfix,
+    'chain': compile_fxn_chain,
+    }
+
+def compile_row_function(key, fxn, columns):
+    ''' Return a row operation for a conform function object like {"function": "join", ...}.
+
+        Unknown functions compile to an operation that leaves the row alone.
+    '''
+    compiler = row_function_compilers.get(fxn["function"])
+
+    if compiler is None:
+        return lambda row: None
+
+    return compiler(key, fxn, columns)
+
+# Marks columns of a dictionary row that a row operation did not write.
+_unwritten = object()
+
+def apply_to_dict_row(compile_operation, row):
+    ''' Compile a row operation for the columns of one dictionary row and apply it.
+
+        compile_operation: function that accepts a RowColumns and returns an operation
+    '''
+    columns = RowColumns(row.keys())
+    operation = compile_operation(columns)
+    values = list(row.values()) + [_unwritten] * (columns.width - len(row))
+    operation(values)
+
+    for (name, index) in columns.indexes.items():
+        if values[index] is not _unwritten:
+            row[name] = values[index]
+
+    return row
+
+class ConformPlan:
+    ''' Row operations compiled from a single smashed-case source definition.
+
+        Create one per source with conform_smash_case() output, then call
+        row_transform() once with extracted column names to get a function
+        for position-indexed rows, batch_transform() for lists of them, or
+        transform() for a dictionary row.
+
+        HASH values are compatible with earlier releases by default,
+        see RowHasher for the stable canonical alternative. Pass a
+        ConformProfile to time each attribute operation and hashing.
+    '''
+    # Attributes in the order of OPENADDR_CSV_SCHEMA
+    out_attribs = ('number', 'street', 'unit', 'city', 'district', 'region', 'postcode', 'id')
+
+    def __init__(self, sd, compatible_hash=True, profile=None):
+        c = sd["conform"]
+
+        if "advanced_merge" in c:
+            raise ValueError('Found unsupported "advanced_merge" option in conform')
+        if "split" in c:
+            raise ValueError('Found unsupported "split" option in conform')
+
+        self.operations = []
+        self.row_transforms = {}
+
+        "Attribute tags can utilize processing fxns"
+        for k, v in c.items():
+            if k in attrib_types and type(v) is list:
+                "Lists are a concat shortcut to concat fields with spaces"
+                self.operations.append((compile_merge, k, v))
+            if k in attrib_types and type(v) is dict:
+                "Dicts are custom processing functions"
+                if v["function"] not in row_function_compilers:
+                    raise ValueError('Found unknown function "{}" in conform'.format(v["function"]))
+                self.operations.append((compile_row_function, k, v))
+
+        # Source column names of attributes, see row_convert_to_out().
+        self.out_keys = [(attrib_types[k], c.get(k, False)) for k in self.out_attribs]
+
+        # Without a fingerprint, compatible hashes use a random one
+        self.hasher = RowHasher(sd.get('fingerprint'), compatible_hash)
+        self.profile = profile
+
+    def _row_convert(self, fieldnames):
+        ''' Return functions to convert position-indexed rows and hash them.
+
+            The convert function applies operations and returns a list of output
+            values without HASH, before canonicalize_out_rows() or equivalent.
+        '''
+        # Some conform specs have fields named with a case different from the source
+        columns = RowColumns([name if name in (X_FIELDNAME, Y_FIELDNAME) else name.lower()
+                              for name in fieldnames])
+
+        width = columns.width
+        operations = [compiler(key, value, columns) for (compiler, key, value) in self.operations]
+        padding = [None] * (columns.width - width)
+        hash = self.hasher.hash
+
+        if self.profile is not None:
+            operations = [self.profile.wrap('transform/{} ({})'.format(key, 'merge'
+                          if compiler is compile_merge else value['function']), operation)
+                          for ((compiler, key, value), operation) in zip(self.operations, operations)]
+            hash = self.profile.wrap('transform/hash', hash)
+
+        # Output values come from these columns, or are None. Attributes
+        # written by operations are used instead of named source columns.
+        out_indexes = [columns.get(X_FIELDNAME), columns.get(Y_FIELDNAME)]
+        for (attrib_name, key) in self.out_keys:
+            if attrib_name in columns:
+                key = attrib_name
+            try:
+                out_indexes.append(columns.get(key) if key else None)
+            except TypeError as e:
+                # Unhashable conform values fail on every row, like a dict lookup.
+                operations.append(compile_error(e))
+                out_indexes.append(None)
+
+        def convert(values):
+            if len(values) != width:
+                # Missing values are read as None, see csv.DictReader
+                values = (list(values) + [None] * width)[:width]
+
+            row = values + padding
+
+            for operation in operations:
+                operation(row)
+
+            return [None if index is None else row[index] for index in out_indexes]
+
+        return convert, hash
+
+    def row_transform(self, fieldnames):
+        ''' Return a function to apply the full conform transform to position-indexed rows.
+
+            fieldnames: names of extracted columns, lowercased here just once.
+
+            The function accepts a list of values and returns a list of output
+            values in the order of OPENADDR_CSV_SCHEMA.
+        '''
+        convert, hash = self._row_convert(fieldnames)
+        LON, LAT, NUMBER, STREET, UNIT = 0, 1, 2, 3, 4
+
+        def transform(values):
+            out = convert(values)
+
+            # See row_canonicalize_unit_and_number() and row_round_lat_lon()
+            out[UNIT] = (out[UNIT] or '').strip()
+            out[NUMBER] = float_pattern.sub(u'', (out[NUMBER] or u'').strip())
+            out[STREET] = (out[STREET] or '').strip()
+            out[LON] = _round_wgs84_to_7(out[LON])
+            out[LAT] = _round_wgs84_to_7(out[LAT])
+
+            out.append(hash(out))
+
+            return out
+
+        return transform
+
+    def batch_transform(self, fieldnames):
+        ''' Return a function to apply the full conform transform to lists of rows.
+
+            Like row_transform(), but output columns of each list are
+            canonicalized together by canonicalize_out_rows(), with output
+            identical to row_transform() for every row.
+        '''
+        convert, hash = self._row_convert(fieldnames)
+        canonicalize = canonicalize_out_rows
+
+        if self.profile is not None:
+            canonicalize = self.profile.wrap('transform/canonicalize', canonicalize)
+
+        def transform(rows):
+            outs = [convert(values) for values in rows]
+            canonicalize(outs)
+
+            for out in outs:
+                out.append(hash(out))
+
+            return outs
+
+        return transform
+
+    def transform(self, row):
+        "Apply the full conform transform and extract operations to a dictionary row"
+        fieldnames = tuple(row.keys())
+
+        if fieldnames not in self.row_transforms:
+            self.row_transforms[fieldnames] = self.row_transform(fieldnames)
+
+        out = self.row_transforms[fieldnames](list(row.values()))
+        return dict(zip(OPENADDR_CSV_SCHEMA, out))
+
 ### File-level conform code. Inputs and outputs are filenames.
 
-def extract_to_source_csv(source_definition, source_path, extract_path):
-    """Extract arbitrary downloaded sources to an extracted CSV in the source schema.
+def extract_to_source_rows(source_definition, source_path, stats=None, context=None):
+    """Extract arbitrary downloaded sources to rows in the source schema.
     source_definition: description of the source, containing the conform object
-    extract_path: file to write the extracted CSV file
+    stats: optional ConformStats to count rows read and skipped
+    context: optional ConformContext for per-source state like transforms
 
-    The extracted file will be in UTF-8 and will have X and Y columns corresponding
-    to longitude and latitude in EPSG:4326.
+    Return a list of field names and a generator of row lists with
+    X and Y columns corresponding to longitude and latitude in EPSG:4326.
+    Rows are not yet converted to strings, see row_as_extracted().
     """
     if source_definition["conform"]["type"] in ("shapefile", "shapefile-polygon", "xml", "gdb"):
         ogr_source_path = normalize_ogr_filename_case(source_path)
-        ogr_source_to_csv(source_definition, ogr_source_path, extract_path)
+        return ogr_source_to_rows(source_definition, ogr_source_path, stats)
     elif source_definition["conform"]["type"] == "csv":
-        csv_source_to_csv(source_definition, source_path, extract_path)
+        return csv_source_to_rows(source_definition, source_path, stats, context)
     elif source_definition["conform"]["type"] == "geojson":
         # GeoJSON sources have some awkward legacy with ESRI, see issue #34
         if source_definition["type"] == "ESRI":
             _L.info("ESRI GeoJSON source found; treating it as CSV")
-            csv_source_to_csv(source_definition, source_path, extract_path)
+            return csv_source_to_rows(source_definition, source_path, stats, context)
         else:
             _L.info("Non-ESRI GeoJSON source found; converting as a stream.")
             geojson_source_path = normalize_ogr_filename_case(source_path)
-            geojson_source_to_csv(geojson_source_path, extract_path)
+            return geojson_source_to_rows(geojson_source_path, stats)
     else:
         raise Exception("Unsupported source type %s" % source_definition["conform"]["type"])
 
-def transform_to_out_csv(source_definition, extract_path, dest_path):
-    ''' Transform an extracted source CSV to the OpenAddresses output CSV by applying conform rules.
+def extract_to_source_csv(source_definition, source_path, extract_path, stats=None, context=None):
+    """Extract arbitrary downloaded sources to an extracted CSV in the source schema.
+    source_definition: description of the source, containing the conform object
+    extract_path: file to write the extracted CSV file
+    stats: optional ConformStats to count rows read and skipped
+    context: optional ConformContext for per-source state like transforms
+
+    The extracted file will be in UTF-8 and will have X and Y columns corresponding
+    to longitude and latitude in EPSG:4326.
+    """
+    fieldnames, rows = extract_to_source_rows(source_definition, source_path, stats, context)
+    write_extracted_csv(fieldnames, rows, extract_path)
+
+class _PackageFile(io.RawIOBase):
+    ''' Unbuffered binary file that writes to a package stream it does not close.
+    '''
+    def __init__(self, package_fp):
+        self.package_fp = package_fp
+
+    def writable(self):
+        return True
+
+    def write(self, bytes):
+        self.package_fp.write(bytes)
+        return len(bytes)
+
+@contextmanager
+def open_out_csv(dest_path, package_fp=None):
+    ''' Open dest_path to write output CSV bytes, return a binary file.
+
+        With package_fp, a binary stream such as one from
+        util.package_output_stream(), output is written only to package_fp
+        so no uncompressed copy is left on disk, and dest_path is not created.
+        package_fp stays open for its owner to close.
+    '''
+    if package_fp is None:
+        with open(dest_path, 'wb') as dest_fp:
+            yield dest_fp
+    else:
+        with io.BufferedWriter(_PackageFile(package_fp)) as package_file:
+            yield package_file
+
+def out_csv_header():
+    ''' Return the output CSV header line as bytes, as written by csv.writer().
+    '''
+    header = io.StringIO()
+    csv.writer(header).writerow(OPENADDR_CSV_SCHEMA)
+    return header.getvalue().encode('utf-8')
+
+def transform_rows_to_out_csv(source_definition, fieldnames, extract_rows, dest_path, stats=None, package_fp=None, compatible_hash=True):
+    ''' Transform extracted source rows to the OpenAddresses output CSV by applying conform rules.
 
         source_definition: description of the source, containing the conform object
-        extract_path: extracted CSV file to process
+        fieldnames: list of extracted column names
+        extract_rows: iterable of extracted row lists with string values
         dest_path: path for output file in OpenAddress CSV
+        stats: optional ConformStats to count rows written
+        package_fp: optional binary stream to receive the output instead of dest_path
+        compatible_hash: False for canonical HASH values, see RowHasher
     '''
     # Convert all field names in the conform spec to lower case
     source_definition = conform_smash_case(source_definition)
+    profile = stats and stats.profile
+    plan = ConformPlan(source_definition, compatible_hash, profile)
+    transform = plan.batch_transform(fieldnames)
+
+    # Write to the destination CSV
+    with open_out_csv(dest_path, package_fp) as dest_file, \
+         io.TextIOWrapper(dest_file, encoding='utf-8') as dest_fp:
+        writer = csv.writer(dest_fp)
+        writer.writerow(OPENADDR_CSV_SCHEMA)
+        rows_written, null_geometry = _write_out_rows(writer, transform, extract_rows, profile)
+
+    if stats is not None:
+        stats.rows_written += rows_written
+        stats.null_geometry += null_geometry
+
+def _write_out_rows(writer, transform, extract_rows, profile=None):
+    ''' Write transformed extracted rows to a CSV writer.
+
+        transform is a function from ConformPlan.batch_transform(), called
+        with up to TRANSFORM_BATCH_SIZE rows at a time.
+
+        Return counts of rows written and rows without a location.
+    '''
+    rows_written, null_geometry = 0, 0
+    writerow = writer.writerow
+    extract_rows = iter(extract_rows)
+
+    if profile is not None:
+        writerow = profile.wrap('transform/write', writerow)
+
+    # For every batch of rows in the extract
+    for extract_batch in iter(lambda: list(itertools.islice(extract_rows, TRANSFORM_BATCH_SIZE)), []):
+        for out in transform(extract_batch):
+            writerow(out)
+            rows_written += 1
+            if not out[0] or not out[1]:
+                null_geometry += 1
+
+    return rows_written, null_geometry
+
+def transform_to_out_csv(source_definition, extract_path, dest_path, workers=1, stats=None, package_fp=None, compatible_hash=True):
+    ''' Transform an extracted source CSV to the OpenAddresses output CSV by applying conform rules.
+
+        source_definition: description of the source, containing the conform object
+        extract_path: extracted CSV file to process
+        dest_path: path for output file in OpenAddress CSV
+        workers: number of processes to transform record-aligned shards in parallel
+        stats: optional ConformStats to count rows written
+        package_fp: optional binary stream to receive the output instead of dest_path
+        compatible_hash: False for canonical HASH values, see RowHasher
+    '''
+    if workers > 1:
+        return transform_to_out_csv_sharded(source_definition, extract_path, dest_path,
+                                            workers, stats, package_fp, compatible_hash)
 
     # Read through the extract CSV
     with open(extract_path, 'r', encoding='utf-8') as extract_fp:
-        reader = csv.DictReader(extract_fp)
-        # Write to the destination CSV
-        with open(dest_path, 'w', encoding='utf-8') as dest_fp:
-            writer = csv.DictWriter(dest_fp, OPENADDR_CSV_SCHEMA)
-            writer.writeheader()
-            # For every row in the extract
-            for extract_row in reader:
-                out_row = row_transform_and_convert(source_definition, extract_row)
-                writer.writerow(out_row)
-
-def conform_cli(source_definition, source_path, dest_path):
-    "Command line entry point for conforming a downloaded source to an output CSV."
-    # TODO: this tool only works if the source creates a single output
+        reader = csv.reader(extract_fp)
+        fieldnames = next(reader, [])
+        # Skip blank lines like csv.DictReader
+        extract_rows = (row for row in reader if row)
+        transform_rows_to_out_csv(source_definition, fieldnames, extract_rows, dest_path,
+                                  stats, package_fp, compatible_hash)
+
+# Number of shards given to each worker process, to even out uneven rows.
+SHARDS_PER_WORKER = 4
+
+def transform_to_out_csv_sharded(source_definition, extract_path, dest_path, workers, stats=None, package_fp=None, compatible_hash=True):
+    ''' Transform an extracted source CSV in a pool of worker processes.
+
+        The extracted CSV is split into record-aligned byte ranges, each range
+        is conformed to a separate part file, and parts are concatenated in
+        their original order so the output matches transform_to_out_csv().
+        Worker processes are spawned rather than forked, so this is safe to
+        call from a thread conforming several sources.
+    '''
+    with open(extract_path, 'rb') as extract_fp:
+        header, ranges = split_extracted_csv(extract_fp, workers * SHARDS_PER_WORKER)
+
+    fieldnames = next(csv.reader(_decode_extracted_lines([header])))
+    dest_dir = os.path.dirname(os.path.abspath(dest_path))
+    part_paths, tasks = [], []
+
+    try:
+        for (start, end) in ranges:
+            handle, part_path = tempfile.mkstemp(prefix='conform-part-', suffix='.csv', dir=dest_dir)
+            os.close(handle)
+            part_paths.append(part_path)
+            tasks.append((source_definition, extract_path, fieldnames, start, end, part_path,
+                          stats is not None and stats.profile is not None, compatible_hash))
+
+        _L.info('Transforming %d shards of %s in %d processes', len(tasks), extract_path, workers)
+
+        # Forking copies locks held by other threads, so start fresh processes.
+        with multiprocessing.get_context('spawn').Pool(workers) as pool:
+            counts = pool.map(_transform_extracted_range, tasks, chunksize=1)
+
+        if stats is not None:
+            for (rows_written, null_geometry, profile) in counts:
+                stats.rows_written += rows_written
+                stats.null_geometry += null_geometry
+                if profile is not None:
+                    stats.profile.update(profile)
+
+        with open_out_csv(dest_path, package_fp) as dest_fp:
+            dest_fp.write(out_csv_header())
+            for part_path in part_paths:
+                with open(part_path, 'rb') as part_fp:
+                    shutil.copyfileobj(part_fp, dest_fp)
+    finally:
+        for part_path in part_paths:
+            os.remove(part_path)
+
+def split_extracted_csv(file, count):
+    ''' Split an extracted CSV file open in binary mode into record-aligned ranges.
 
+        Return the header line and a list of up to count (start, end) byte
+        offsets covering every record after it. Quoted values may contain
+        newlines, so a range only ends at a newline with an even number of
+        double quotes before it in the file.
+    '''
+    file.seek(0, os.SEEK_END)
+    size = file.tell()
+    file.seek(0)
+
+    header = file.readline()
+    quotes, position = header.count(b'"'), len(header)
+    while quotes % 2 and position < size:
+        line = file.readline()
+        header += line
+        quotes, position = quotes + line.count(b'"'), position + len(line)
+
+    offsets = [position]
+    for index in range(1, count):
+        target = position + (size - position) * index // count
+
+        if target <= offsets[-1]:
+            continue
+
+        # Count quotes up to the target offset in large blocks
+        while position < target:
+            block = file.read(min(1024 * 1024, target - position))
+            quotes, position = quotes + block.count(b'"'), position + len(block)
+
+        # Finish the current record, which may span several lines
+        while position < size:
+            line = file.readline()
+            quotes, position = quotes + line.count(b'"'), position + len(line)
+            if quotes % 2 == 0 and line.endswith(b'\n'):
+                break
+
+        if position < size:
+            offsets.append(position)
+
+    offsets.append(size)
+    ranges = [(start, end) for (start, end) in zip(offsets[:-1], offsets[1:]) if end > start]
+
+    return header, ranges
+
+def _decode_extracted_lines(lines):
+    ''' Decode binary lines of an extracted CSV with universal newlines, like text mode.
+    '''
+    for line in lines:
+        text = line.decode('utf-8').replace('\r\n', '\n')
+        yield text.replace('\r', '\n') if '\r' in text else text
+
+def _read_extracted_range(file, start, end):
+    ''' Generate binary lines of a file from start up to the end byte offset.
+    '''
+    file.seek(start)
+    position = start
+    while position < end:
+        line = file.readline()
+        if not line:
+            break
+        position += len(line)
+        yield line
+
+def _transform_extracted_range(task):
+    ''' Transform one record-aligned range of an extracted CSV to a headerless part file.
+
+        Runs in a spawned worker process of transform_to_out_csv_sharded(). Return
+        counts of rows written and rows without a location, and a
+        ConformProfile if one was requested.
+    '''
+    source_definition, extract_path, fieldnames, start, end, part_path, profiled, compatible_hash = task
+    profile = ConformProfile() if profiled else None
+    plan = ConformPlan(conform_smash_case(source_definition), compatible_hash, profile)
+    transform = plan.batch_transform(fieldnames)
+
+    with open(extract_path, 'rb') as extract_fp, \
+         open(part_path, 'w', encoding='utf-8') as part_fp:
+        lines = _decode_extracted_lines(_read_extracted_range(extract_fp, start, end))
+        extract_rows = (row for row in csv.reader(lines) if row)
+        rows_written, null_geometry = _write_out_rows(csv.writer(part_fp), transform, extract_rows, profile)
+
+    return rows_written, null_geometry, profile
+
+def conform_cli(source_definition, source_path, dest_path, extract_path=None, workers=1, profile=False, package_fp=None, compatible_hash=True):
+    ''' Command line entry point for conforming a downloaded source to an output CSV.
+
+        Extracted rows are streamed directly into the output CSV. For debugging,
+        pass an extract_path to write and keep the intermediate extracted CSV
+        and conform from that file instead. With more than one worker, rows are
+        extracted to a CSV file first and transformed in parallel processes.
+
+        Return a ConformStats object, or None if the source can't be conformed.
+        With profile, its profile attribute is a ConformProfile of time spent
+        in each stage and conform function. With an optional package_fp binary
+        stream, output is written there instead of dest_path, see open_out_csv().
+        HASH values are compatible with earlier releases unless compatible_hash
+        is False, see RowHasher.
+    '''
     if "conform" not in source_definition:
-        return 1
+        return None
     if not source_definition["conform"].get("type", None) in ["shapefile", "shapefile-polygon", "geojson", "csv", "xml", "gdb"]:
         _L.warning("Skipping file with unknown conform: %s", source_path)
-        return 1
+        return None
+
+    stats = ConformStats(ConformProfile() if profile else None)
+    context = ConformContext()
+    start = time.perf_counter()
 
-    # Create a temporary filename for the intermediate extracted source CSV
-    fd, extract_path = tempfile.mkstemp(prefix='openaddr-extracted-', suffix='.csv')
-    os.close(fd)
-    _L.debug('extract temp file %s', extract_path)
+    with logged_gdal_errors():
+        if extract_path is not None or workers > 1:
+            if extract_path is None:
+                handle, temp_path = tempfile.mkstemp(prefix='extracted-', suffix='.csv',
+                                                     dir=os.path.dirname(os.path.abspath(dest_path)))
+                os.close(handle)
+            else:
+                _L.debug('extract file %s', extract_path)
+                temp_path = None
+            try:
+                extract_to_source_csv(source_definition, source_path, extract_path or temp_path, stats, context)
+                stats.extract_time = time.perf_counter() - start
+                transform_to_out_csv(source_definition, extract_path or temp_path, dest_path,
+                                     workers, stats, package_fp, compatible_hash)
+            finally:
+                if temp_path is not None:
+                    os.remove(temp_path)
+        else:
+            fieldnames, rows = extract_to_source_rows(source_definition, source_path, stats, context)
+            extract_rows = stats.timed_rows(row_as_extracted(row) for row in rows)
+            stats.extract_time = time.perf_counter() - start
+            transform_rows_to_out_csv(source_definition, fieldnames, extract_rows, dest_path,
+                                      stats, package_fp, compatible_hash)
+
+    stats.transform_time = time.perf_counter() - start - stats.extract_time
+
+    if stats.profile is not None:
+        stats.profile.add('extract', stats.extract_time, stats.rows_read)
+        stats.profile.add('transform', stats.transform_time, stats.rows_written)
+
+    _L.info('Conformed %d of %d rows in %.1fs extract and %.1fs transform',
+            stats.rows_written, stats.rows_read, stats.extract_time, stats.transform_time)
+
+    return stats
+
+def conform_parts_cli(parts, dest_path, workers=1, profile=False, package_fp=None, compatible_hash=True):
+    ''' Conform several parts of a source from find_source_parts() into one output CSV.
+
+        Each part is conformed by conform_cli(), in up to workers processes,
+        and part outputs are concatenated in order into dest_path, or into
+        package_fp instead. Worker processes are spawned rather than forked,
+        so this is safe to call from a thread conforming several sources.
+        Return a ConformStats object with summed counts and stage times,
+        or None if any part can't be conformed.
+    '''
+    dest_dir = os.path.dirname(os.path.abspath(dest_path))
+    part_paths, tasks = [], []
+
+    # Parts without a fingerprint share one random fingerprint, so compatible
+    # hashes are stable across parts as they are within one conform.
+    fingerprint = str(uuid4()) if compatible_hash else None
 
     try:
-        extract_to_source_csv(source_definition, source_path, extract_path)
-        transform_to_out_csv(source_definition, extract_path, dest_path)
+        for (part_definition, source_path) in parts:
+            if part_definition.get('fingerprint') is None:
+                part_definition = dict(part_definition, fingerprint=fingerprint)
+
+            handle, part_path = tempfile.mkstemp(prefix='conform-part-', suffix='.csv', dir=dest_dir)
+            os.close(handle)
+            part_paths.append(part_path)
+            tasks.append((part_definition, source_path, part_path, profile, compatible_hash))
+
+        processes = min(len(tasks), workers)
+        _L.info('Conforming %d source parts in %d processes', len(tasks), processes)
+
+        if processes > 1:
+            # Forking copies locks held by other threads, so start fresh processes.
+            with multiprocessing.get_context('spawn').Pool(processes) as pool:
+                part_stats = pool.map(_conform_part, tasks, chunksize=1)
+        else:
+            part_stats = list(map(_conform_part, tasks))
+
+        if None in part_stats:
+            return None
+
+        stats = ConformStats(ConformProfile() if profile else None)
+        for each_stats in part_stats:
+            stats.update(each_stats)
+
+        with open_out_csv(dest_path, package_fp) as dest_fp:
+            dest_fp.write(out_csv_header())
+            for part_path in part_paths:
+                with open(part_path, 'rb') as part_fp:
+                    part_fp.readline()
+                    shutil.copyfileobj(part_fp, dest_fp)
     finally:
-        os.remove(extract_path)
+        for part_path in part_paths:
+            os.remove(part_path)
 
-    return 0
+    return stats
+
+def _conform_part(task):
+    ''' Conform one part of a source to a part file with conform_cli().
+
+        Runs in a spawned worker process of conform_parts_cli(), or in the
+        calling process with one worker.
+    '''
+    part_definition, source_path, part_path, profile, compatible_hash = task
+    return conform_cli(part_definition, source_path, part_path, profile=profile,
+                       compatible_hash=compatible_hash)
 
 def conform_license(license):
     ''' Convert optional license tag.
@@ -1351,9 +3080,11 @@ def check_source_tests(raw_source):
         # There is nothing to be done here.
         return None, None
     
+    plan = ConformPlan(source)
+
     for (index, test) in enumerate(acceptance_tests):
         input = row_smash_case(source, test['inputs'])
-        output = row_smash_case(source, row_transform_and_convert(source, input))
+        output = row_smash_case(source, plan.transform(input))
         actual = {k: v for (k, v) in output.items() if k in test['expected']}
         expected = row_smash_case(source, test['expected'])
         
@@ -0,0 +1,175 @@
+from __future__ import absolute_import, division, print_function
+import logging; _L = logging.getLogger('openaddr.conform_cache')
+
+from os.path import join, exists, isdir
+from urllib.parse import urlparse
+from shutil import copy, copyfileobj, rmtree, move
+from tempfile import mkdtemp
+from hashlib import sha1
+import json
+
+from .cache import mkdirsp
+
+# Source keys that change between runs or only describe the data,
+# and so can't change conform output.
+VOLATILE_SOURCE_KEYS = {
+    'cache', 'fingerprint', 'version', 'cache etag', 'cache last modified',
+    'cache content length', 'cache url', 'website', 'attribution', 'license',
+    }
+
+def conform_cache_key(source, code_version, compatible_hash=True):
+    ''' Return a hex key for a conform output from its inputs.
+
+        source: source JSON with cache details from CacheResult; every key
+          not in VOLATILE_SOURCE_KEYS is part of the key, along with the
+          source data md5 hash in its "fingerprint".
+        code_version: openaddr.__version__
+        compatible_hash: HASH mode of the conform, see conform.RowHasher
+    '''
+    fingerprint = source.get('fingerprint')
+
+    if not fingerprint:
+        return None
+
+    definition = {k: v for (k, v) in source.items() if k not in VOLATILE_SOURCE_KEYS}
+    inputs = dict(fingerprint=fingerprint, source=definition, version=code_version,
+                  compatible_hash=compatible_hash)
+    return sha1(json.dumps(inputs, sort_keys=True).encode('utf8')).hexdigest()
+
+class ConformCacheEntry:
+    ''' Conform output found in a cache.
+
+        path: local path to copy of out.csv
+        sample: list of sample rows, as in ConformResult
+        geometry_type: typically Point or Polygon
+        stats: dictionary from ConformStats.todict()
+    '''
+    def __init__(self, path, sample, geometry_type, stats):
+        self.path = path
+        self.sample = sample
+        self.geometry_type = geometry_type
+        self.stats = stats
+
+def _write_details(dirname, sample, geometry_type, stats):
+    details = dict(sample=sample, geometry_type=geometry_type,
+                   stats=stats and stats.todict())
+
+    with open(join(dirname, 'conform.json'), 'w') as file:
+        json.dump(details, file)
+
+def _read_entry(dirname, destdir):
+    ''' Move out.csv from dirname to destdir, return a ConformCacheEntry.
+    '''
+    with open(join(dirname, 'conform.json')) as file:
+        details = json.load(file)
+
+    out_path = join(destdir, 'out.csv')
+    move(join(dirname, 'out.csv'), out_path)
+
+    return ConformCacheEntry(out_path, details['sample'],
+                             details['geometry_type'], details['stats'])
+
+class LocalConformCache:
+    ''' Conform outputs in subdirectories of a local directory, one per key.
+    '''
+    def __init__(self, dirname):
+        self.dirname = dirname
+
+    def get(self, key, destdir):
+        ''' Copy cached output to destdir, return a ConformCacheEntry or None.
+        '''
+        entrydir = join(self.dirname, key)
+
+        if not exists(join(entrydir, 'conform.json')):
+            return None
+
+        workdir = mkdtemp(prefix='conform-cache-', dir=destdir)
+
+        try:
+            copy(join(entrydir, 'out.csv'), workdir)
+            copy(join(entrydir, 'conform.json'), workdir)
+            return _read_entry(workdir, destdir)
+        finally:
+            rmtree(workdir)
+
+    def put(self, key, out_file, sample, geometry_type, stats):
+        ''' Save a copy of output CSV binary file with its sample, geometry type and stats.
+        '''
+        entrydir = join(self.dirname, key)
+        mkdirsp(entrydir)
+
+        # conform.json is written last and marks a complete entry.
+        with open(join(entrydir, 'out.csv'), 'wb') as csv_file:
+            copyfileobj(out_file, csv_file)
+        _write_details(entrydir, sample, geometry_type, stats)
+
+class S3ConformCache:
+    ''' Conform outputs under a key prefix in an S3 bucket, one per key.
+    '''
+    def __init__(self, s3, prefix):
+        self.s3 = s3
+        self.prefix = prefix.strip('/')
+
+    def _key_name(self, key, filename):
+        return '/'.join(p for p in (self.prefix, key, filename) if p)
+
+    def get(self, key, destdir):
+        ''' Download cached output to destdir, return a ConformCacheEntry or None.
+        '''
+        details_key = self.s3.get_key(self._key_name(key, 'conform.json'))
+        csv_key = self.s3.get_key(self._key_name(key, 'out.csv'))
+
+        if details_key is None or csv_key is None:
+            return None
+
+        workdir = mkdtemp(prefix='conform-cache-', dir=destdir)
+
+        try:
+            csv_key.get_contents_to_filename(join(workdir, 'out.csv'))
+            details_key.get_contents_to_filename(join(workdir, 'conform.json'))
+            return _read_entry(workdir, destdir)
+        finally:
+            rmtree(workdir)
+
+    def put(self, key, out_file, sample, geometry_type, stats):
+        ''' Upload output CSV binary file with its sample, geometry type and stats.
+        '''
+        workdir = mkdtemp(prefix='conform-cache-')
+
+        try:
+            _write_details(workdir, sample, geometry_type, stats)
+
+            # Output may be streamed from a zip, so it's spooled to a
+            # seekable file for boto to compute its MD5 hash.
+            with open(join(workdir, 'out.csv'), 'wb') as csv_file:
+                copyfileobj(out_file, csv_file)
+
+            # conform.json is uploaded last and marks a complete entry.
+            csv_key = self.s3.new_key(self._key_name(key, 'out.csv'))
+            csv_key.set_contents_from_filename(join(workdir, 'out.csv'))
+
+            details_key = self.s3.new_key(self._key_name(key, 'conform.json'))
+            details_key.set_contents_from_filename(join(workdir, 'conform.json'))
+        finally:
+            rmtree(workdir)
+
+def from_location(location):
+    ''' Return a conform cache for a local directory or s3://bucket/prefix URL.
+    '''
+    if not location:
+        return None
+
+    scheme, bucketname, prefix, _, _, _ = urlparse(location)
+
+    if scheme == 's3':
+        from . import S3
+        return S3ConformCache(S3(None, None, bucketname), prefix)
+
+    if scheme not in ('', 'file'):
+        raise ValueError('Unknown conform cache location {}'.format(location))
+
+    dirname = prefix if scheme == 'file' else location
+    if exists(dirname) and not isdir(dirname):
+        raise ValueError('Conform cache {} is not a directory'.format(location))
+
+    return LocalConformCache(dirname)
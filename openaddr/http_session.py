@@ -0,0 +1,92 @@
+from __future__ import absolute_import, division, print_function
+import logging; _L = logging.getLogger('openaddr.http_session')
+
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+# Timeout in seconds for connecting and for each read, unless a call passes its own.
+HTTP_TIMEOUT = 180
+
+# Retries of connection errors and retried response statuses, with exponential backoff.
+HTTP_RETRIES = 3
+HTTP_BACKOFF = .5
+HTTP_RETRY_STATUSES = (500, 502, 503, 504)
+
+# Hosts with kept-alive connection pools, and connections kept per host.
+HTTP_POOL_HOSTS = 16
+HTTP_POOL_SIZE = 8
+
+_settings = dict(timeout=HTTP_TIMEOUT, retries=HTTP_RETRIES, backoff=HTTP_BACKOFF,
+                 pool_hosts=HTTP_POOL_HOSTS, pool_size=HTTP_POOL_SIZE)
+
+_session, _session_pid, _session_lock = None, None, threading.Lock()
+
+def configure(**settings):
+    ''' Change settings for new sessions and replace the shared session.
+
+        Settings are timeout, retries, backoff, pool_hosts and pool_size,
+        with defaults from the HTTP_* values above.
+    '''
+    global _session
+
+    unknown = set(settings) - set(_settings)
+    if unknown:
+        raise ValueError('Unknown HTTP session settings: {}'.format(', '.join(sorted(unknown))))
+
+    with _session_lock:
+        _settings.update(settings)
+        _session = None
+
+def new_session():
+    ''' Return a new requests.Session with retrying, pooled HTTP adapters.
+
+        Idempotent requests like GET are retried after connection errors
+        and 5xx responses. The last response is returned after the final
+        retry, so callers still see its status code.
+    '''
+    retry = Retry(total=_settings['retries'], backoff_factor=_settings['backoff'],
+                  status_forcelist=HTTP_RETRY_STATUSES, raise_on_status=False)
+
+    adapter = HTTPAdapter(pool_connections=_settings['pool_hosts'],
+                          pool_maxsize=_settings['pool_size'], max_retries=retry)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return session
+
+def get_session():
+    ''' Return the shared session for this process, creating it if needed.
+
+        Connections are pooled per host and kept alive between requests.
+        The underlying connection pools are safe to use from many threads.
+        Child processes get their own session instead of sharing sockets.
+    '''
+    global _session, _session_pid
+
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            _session, _session_pid = new_session(), os.getpid()
+        return _session
+
+def request(method, url, **kwargs):
+    ''' Make a request with the shared session, like requests.request().
+
+        A timeout of HTTP_TIMEOUT seconds is used unless one is passed.
+    '''
+    kwargs.setdefault('timeout', _settings['timeout'])
+    return get_session().request(method, url, **kwargs)
+
+def get(url, **kwargs):
+    "Make a GET request with the shared session, like requests.get()."
+    kwargs.setdefault('allow_redirects', True)
+    return request('GET', url, **kwargs)
+
+def post(url, data=None, **kwargs):
+    "Make a POST request with the shared session, like requests.post()."
+    return request('POST', url, data=data, **kwargs)
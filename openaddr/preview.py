@@ -10,10 +10,12 @@ from argparse import ArgumentParser
 from urllib.parse import urlparse
 import json, itertools, os, struct
 
-import requests, uritemplate
+import uritemplate
 
 from osgeo import osr, ogr
 
+from . import http_session
+
 try:
     import cairo
 except ImportError:
@@ -104,7 +106,7 @@ def get_local_filename(filename_or_url):
     
     _L.info('Downloading {}...'.format(filename_or_url))
 
-    got = requests.get(filename_or_url)
+    got = http_session.get(filename_or_url)
     _, filename = mkstemp(prefix='Preview-', suffix=suffix)
 
     with open(filename, 'wb') as file:
@@ -162,7 +164,7 @@ def get_map_features(xmin, ymin, xmax, ymax, resolution, scale, mapzen_key):
     
     for (row, col) in row_cols:
         url = uritemplate.expand(TILE_URL, dict(z=zoom, x=col, y=row, api_key=mapzen_key))
-        got = requests.get(url)
+        got = http_session.get(url)
 
         for feature in got.json()['landuse']['features']:
             if 'Polygon' in feature['geometry']['type']:
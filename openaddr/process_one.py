@@ -5,12 +5,12 @@ from urllib.parse import urlparse
 from os.path import join, basename, dirname, exists, splitext, relpath
 from shutil import copy, move, rmtree
 from argparse import ArgumentParser
-from os import mkdir, rmdir, close, chmod
+from os import mkdir, rmdir, close, chmod, environ
 from _thread import get_ident
 import tempfile, json, csv, sys, enum
 import threading
 
-from . import util, cache, conform, preview, slippymap, CacheResult, ConformResult, __version__
+from . import util, cache, conform, preview, slippymap, conform_cache, CacheResult, ConformResult, __version__
 from .cache import DownloadError
 from .conform import check_source_tests
 
@@ -47,10 +47,15 @@ def boolstr(value):
     
     raise ValueError(repr(value))
 
-def process(source, destination, do_preview, mapzen_key=None, extras=dict()):
+def process(source, destination, do_preview, mapzen_key=None, extras=dict(), workers=1, profile=False, output_cache=None, package_name=None, columnar=False, compatible_hash=True):
     ''' Process a single source and destination, return path to JSON state file.
     
-        Creates a new directory and files under destination.
+        Creates a new directory and files under destination. Conform output
+        is reused from output_cache when the source has not changed. With
+        package_name, output is written only to a distribution zip while
+        conforming, instead of to a plain CSV file. With
+        columnar, an Arrow IPC copy of the output is written too.
+        Without compatible_hash, HASH values are canonical and stable.
     '''
     # The main processing thread holds wait_lock until it is done.
     # The logging thread periodically writes data in the background,
@@ -98,7 +103,9 @@ def process(source, destination, do_preview, mapzen_key=None, extras=dict()):
                 _L.info(u'Cached data in {}'.format(cache_result.cache))
 
                 # Conform cached source data.
-                conform_result = conform(temp_src, temp_dir, cache_result.todict())
+                conform_result = conform(temp_src, temp_dir, cache_result.todict(),
+                                         workers, profile, output_cache, package_name,
+                                         columnar, compatible_hash)
     
                 if not conform_result.path:
                     _L.warning('Nothing processed')
@@ -222,6 +229,21 @@ def find_source_problem(log_contents, source):
     
     return None
 
+def read_previous_state(state_path):
+    ''' Read cache details from a previous run's state JSON, for cache() extras.
+
+        Only a remote cache URL can be reused, along with its fingerprint
+        and the HTTP validators and source URL for revalidating it.
+    '''
+    with open(state_path) as file:
+        state = json.load(file)
+
+    if urlparse(state.get('cache') or '').scheme not in ('http', 'https'):
+        return dict()
+
+    keys = 'cache', 'fingerprint', 'cache etag', 'cache last modified', 'cache content length', 'cache url'
+    return {key: state[key] for key in keys if state.get(key) is not None}
+
 def write_state(source, skipped, destination, log_handler, tests_passed,
                 cache_result, conform_result, preview_path, slippymap_path,
                 temp_dir):
@@ -237,17 +259,26 @@ def write_state(source, skipped, destination, log_handler, tests_passed,
         scheme, _, cache_path1, _, _, _ = urlparse(cache_result.cache)
         if scheme in ('file', ''):
             cache_path2 = join(statedir, 'cache{1}'.format(*splitext(cache_path1)))
-            copy(cache_path1, cache_path2)
+            move(cache_path1, cache_path2)
             state_cache = relpath(cache_path2, statedir)
         else:
             state_cache = cache_result.cache
     else:
         state_cache = None
 
-    if conform_result.path:
+    if conform_result.package:
+        # Output was written only into the package while conforming.
+        processed_path2 = package_path2 = join(statedir, 'out.zip')
+        move(conform_result.package, package_path2)
+
+    elif conform_result.path:
         _, _, processed_path1, _, _, _ = urlparse(conform_result.path)
         processed_path2 = join(statedir, 'out{1}'.format(*splitext(processed_path1)))
-        copy(processed_path1, processed_path2)
+        move(processed_path1, processed_path2)
+
+    if conform_result.columnar:
+        columnar_path2 = join(statedir, 'out{1}'.format(*splitext(conform_result.columnar)))
+        move(conform_result.columnar, columnar_path2)
 
     # Write the sample data to a sample.json file
     if conform_result.sample:
@@ -263,6 +294,11 @@ def write_state(source, skipped, destination, log_handler, tests_passed,
         slippymap_path2 = join(statedir, 'slippymap.mbtiles')
         copy(slippymap_path, slippymap_path2)
     
+    # Write the optional conform profile to a profile.txt file
+    if conform_result.stats and conform_result.stats.profile:
+        with open(join(statedir, 'profile.txt'), 'w') as profile_file:
+            profile_file.write(conform_result.stats.profile.report())
+    
     log_handler.flush()
     output_path = join(statedir, 'output.txt')
     copy(log_handler.stream.name, output_path)
@@ -288,10 +324,17 @@ def write_state(source, skipped, destination, log_handler, tests_passed,
         ('license', conform_result.license),
         ('geometry type', conform_result.geometry_type),
         ('address count', conform_result.address_count),
+        ('conform stats', conform_result.stats and conform_result.stats.todict()),
         ('version', cache_result.version),
         ('fingerprint', cache_result.fingerprint),
+        ('cache etag', cache_result.validators.etag),
+        ('cache last modified', cache_result.validators.last_modified),
+        ('cache content length', cache_result.validators.content_length),
+        ('cache url', cache_result.validators.url),
         ('cache time', cache_result.elapsed and str(cache_result.elapsed)),
         ('processed', conform_result.path and relpath(processed_path2, statedir)),
+        ('package', conform_result.package and relpath(package_path2, statedir)),
+        ('columnar', conform_result.columnar and relpath(columnar_path2, statedir)),
         ('process time', conform_result.elapsed and str(conform_result.elapsed)),
         ('output', relpath(output_path, statedir)),
         ('preview', preview_path and relpath(preview_path2, statedir)),
@@ -331,6 +374,30 @@ parser.add_argument('--skip-preview', help="Don't render a map preview",
 parser.add_argument('--mapzen-key', dest='mapzen_key',
                     help='Mapzen API Key. See: https://mapzen.com/documentation/overview/')
 
+parser.add_argument('-w', '--workers', type=int, default=1,
+                    help='Number of processes for the conform transform. Default 1.')
+
+parser.add_argument('--profile', help='Time conform functions and write profile.txt',
+                    action='store_const', dest='profile',
+                    const=True, default=False)
+
+parser.add_argument('--conform-cache', default=environ.get('CONFORM_CACHE', None),
+                    help='Optional directory or s3://bucket/prefix for reusing conform output. Defaults to value of CONFORM_CACHE environment variable.')
+
+parser.add_argument('--package-name', dest='package_name',
+                    help='Optional name like "us/ca/oakland" for a distribution zip written while conforming.')
+
+parser.add_argument('--columnar', help='Also write conform output to an Arrow IPC file, with pyarrow',
+                    action='store_const', dest='columnar',
+                    const=True, default=False)
+
+parser.add_argument('--canonical-hash', help='Write stable canonical HASH values instead of ones compatible with earlier releases',
+                    action='store_const', dest='compatible_hash',
+                    const=False, default=True)
+
+parser.add_argument('--previous-state', dest='previous_state',
+                    help='Optional JSON file with state of a previous run, to revalidate its cached data instead of downloading again.')
+
 parser.add_argument('-l', '--logfile', help='Optional log file name.')
 
 parser.add_argument('-v', '--verbose', help='Turn on verbose logging',
@@ -353,7 +420,14 @@ def main():
     csv.field_size_limit(sys.maxsize)
     
     try:
-        file_path = process(args.source, args.destination, args.render_preview, mapzen_key=args.mapzen_key)
+        extras = read_previous_state(args.previous_state) if args.previous_state else dict()
+        file_path = process(args.source, args.destination, args.render_preview,
+                            mapzen_key=args.mapzen_key, extras=extras, workers=args.workers,
+                            profile=args.profile,
+                            output_cache=conform_cache.from_location(args.conform_cache),
+                            package_name=args.package_name,
+                            columnar=args.columnar,
+                            compatible_hash=args.compatible_hash)
     except Exception as e:
         _L.error(e, exc_info=True)
         return 1
@@ -1,7 +1,62 @@
 from __future__ import absolute_import, division, print_function
 
 import json, ijson
-from itertools import chain
+from itertools import chain, takewhile
+from importlib import import_module
+from functools import partial
+from operator import ne
+from decimal import Decimal
+
+def _find_items_backend():
+    ''' Return the fastest compiled ijson backend available, or None.
+    '''
+    for name in ('yajl2_c', 'yajl2_cffi', 'yajl2'):
+        try:
+            return import_module('ijson.backends.{}'.format(name))
+        except ImportError:
+            continue
+
+# Compiled ijson backend used to build whole features, if one exists.
+items_backend = _find_items_backend()
+
+def _number(value):
+    ''' Return an ijson number as an integer if it has no fractional part, or a float.
+    '''
+    return int(value) if (int(value) == float(value)) else float(value)
+
+# Integers up to this size are exactly equal to their float value.
+_MAX_EXACT_INT = 2 ** 53
+
+def _convert_number(value):
+    ''' Return the same as _number() for an int or Decimal, testing common cases first.
+    '''
+    if type(value) is int:
+        return value if (-_MAX_EXACT_INT <= value <= _MAX_EXACT_INT) else _number(value)
+
+    number = float(value)
+    return _number(value) if number.is_integer() else number
+
+def _convert_numbers(value):
+    ''' Convert numbers in a value built by an ijson backend like _build_value().
+
+        Lists and dictionaries are modified in place.
+    '''
+    if type(value) is dict:
+        for (key, item) in value.items():
+            if type(item) in _converted_types:
+                value[key] = _converted_types[type(item)](item)
+
+    elif type(value) is list:
+        for (index, item) in enumerate(value):
+            if type(item) in _converted_types:
+                value[index] = _converted_types[type(item)](item)
+
+    return value
+
+_converted_types = {
+    dict: _convert_numbers, list: _convert_numbers,
+    int: _convert_number, Decimal: _convert_number,
+    }
 
 def _build_value(data):
     ''' Build a value (number, array, whatever) from an ijson stream.
@@ -11,7 +66,7 @@ def _build_value(data):
             return value
         
         elif event == 'number':
-            return int(value) if (int(value) == float(value)) else float(value)
+            return _number(value)
         
         elif event == 'start_array':
             return _build_list(data)
@@ -76,6 +131,71 @@ def sample_geojson(stream, max_features):
     return json.dumps(geojson)
 
 def stream_geojson(stream):
+    ''' Generate GeoJSON features from a stream of a FeatureCollection.
+
+        Uses a compiled ijson backend for byte streams if one is available,
+        and builds features from parse events in Python otherwise.
+    '''
+    if items_backend is not None and isinstance(stream.read(0), bytes):
+        return _stream_geojson_items(stream, items_backend)
+
+    return _stream_geojson_events(stream)
+
+def _check_geojson_type(prefix, event, value):
+    ''' Raise ValueError if a "type" value can't be FeatureCollection.
+    '''
+    if event != 'string' and value != 'FeatureCollection':
+        # We only want GeoJSON feature collections
+        raise ValueError((prefix, event, value))
+
+# Parse event that ends the root features array.
+_FEATURES_END = ('features', 'end_array', None)
+
+def _checked_geojson_events(data):
+    ''' Generate ijson parse events, raising ValueError where _stream_geojson_events() would.
+
+        Events inside the features array are passed on without checks.
+    '''
+    for (prefix, event, value) in data:
+        if event != 'start_map':
+            # A root GeoJSON object is a map.
+            raise ValueError((prefix, event, value))
+        yield (prefix, event, value)
+        break
+
+    key = None
+
+    for (prefix, event, value) in data:
+        if key == 'type':
+            _check_geojson_type(prefix, event, value)
+
+        elif key == 'features' and event != 'start_array':
+            # We only want lists of features here.
+            raise ValueError((prefix, event, value))
+
+        elif key == 'features' and prefix == 'features':
+            yield (prefix, event, value)
+            yield from takewhile(partial(ne, _FEATURES_END), data)
+            yield _FEATURES_END
+            key = None
+            continue
+
+        key = value if event == 'map_key' else None
+        yield (prefix, event, value)
+
+def _stream_geojson_items(stream, backend):
+    ''' Generate GeoJSON features built by an ijson backend from a byte stream.
+
+        Features are built from the same backend parse events that are
+        checked by _checked_geojson_events(), so the stream is read once.
+    '''
+    events = _checked_geojson_events(backend.parse(stream))
+
+    for feature in backend.items(events, 'features.item'):
+        convert = _converted_types.get(type(feature))
+        yield convert(feature) if convert else feature
+
+def _stream_geojson_events(stream):
     '''
     '''
     data = ijson.parse(stream)
@@ -87,11 +207,7 @@ def stream_geojson(stream):
 
         for (prefix2, event2, value2) in data:
             if event2 == 'map_key' and value2 == 'type':
-                prefix3, event3, value3 = next(data)
-            
-                if event3 != 'string' and value3 != 'FeatureCollection':
-                    # We only want GeoJSON feature collections
-                    raise ValueError((prefix3, event3, value3))
+                _check_geojson_type(*next(data))
             
             elif event2 == 'map_key' and value2 == 'features':
                 prefix4, event4, value4 = next(data)
@@ -51,11 +51,12 @@ from .. import (
     iterate_local_processed_files, download_processed_file
     )
 
-from ..util import package_output
+from ..util import package_output, package_output_stream
 from ..ci.objects import Run, RunState
-from ..cache import CacheResult
-from ..conform import ConformResult
+from ..cache import CacheResult, CacheValidators
+from ..conform import ConformResult, ConformStats, ConformProfile, RowHasher, OPENADDR_CSV_SCHEMA
 from ..process_one import find_source_problem, SourceProblem
+from ..conform_cache import LocalConformCache
 
 def touch_first_arg_file(path, *args, **kwargs):
     ''' Write a short dummy file for the first argument.
@@ -394,6 +395,106 @@ class TestOA (unittest.TestCase):
             self.assertEqual(rows[100]['UNIT'], '')
             self.assertEqual(rows[1000]['UNIT'], '')
 
+    def test_single_ac_conform_cache(self):
+        ''' Test process_one.process twice with a conform output cache.
+        '''
+        source = join(self.src_dir, 'us-ca-alameda_county.json')
+        output_cache = LocalConformCache(join(self.testdir, 'conform-cache'))
+        mkdir(join(self.testdir, 'first'))
+        mkdir(join(self.testdir, 'second'))
+        
+        with HTTMock(self.response_content):
+            state_path1 = process_one.process(source, join(self.testdir, 'first'),
+                                              False, output_cache=output_cache)
+        
+        with HTTMock(self.response_content), \
+             mock.patch('openaddr.ConvertToCsvTask.convert') as convert:
+            convert.side_effect = AssertionError('Should not convert a cached source')
+            state_path2 = process_one.process(source, join(self.testdir, 'second'),
+                                              False, output_cache=output_cache)
+        
+        self.assertEqual(convert.mock_calls, [])
+
+        with open(state_path1) as file1, open(state_path2) as file2:
+            state1, state2 = dict(zip(*json.load(file1))), dict(zip(*json.load(file2)))
+        
+        self.assertIsNotNone(state2['processed'])
+        self.assertIsNotNone(state2['sample'])
+        self.assertEqual(state2['geometry type'], state1['geometry type'])
+        self.assertEqual(state2['address count'], state1['address count'])
+        self.assertEqual(state2['conform stats'], state1['conform stats'])
+
+        with open(join(dirname(state_path1), state1['processed']), encoding='utf8') as file1, \
+             open(join(dirname(state_path2), state2['processed']), encoding='utf8') as file2:
+            self.assertEqual(file1.read(), file2.read())
+
+    def test_single_ac_canonical_hash(self):
+        ''' Test process_one.process with canonical HASH values, with and without cached output.
+        '''
+        source = join(self.src_dir, 'us-ca-alameda_county.json')
+        output_cache = LocalConformCache(join(self.testdir, 'conform-cache'))
+
+        args = process_one.parser.parse_args([source, self.testdir])
+        self.assertTrue(args.compatible_hash)
+        args = process_one.parser.parse_args([source, self.testdir, '--canonical-hash'])
+        self.assertFalse(args.compatible_hash)
+
+        states = []
+
+        with HTTMock(self.response_content):
+            for (subdir, compatible_hash) in (('first', True), ('second', False), ('third', False)):
+                mkdir(join(self.testdir, subdir))
+                state_path = process_one.process(source, join(self.testdir, subdir), False,
+                                                 output_cache=output_cache,
+                                                 compatible_hash=compatible_hash)
+                with open(state_path) as file:
+                    state = dict(zip(*json.load(file)))
+                with open(join(dirname(state_path), state['processed']), encoding='utf8') as file:
+                    states.append((state, list(csv.DictReader(file))))
+
+        (state1, rows1), (state2, rows2), (state3, rows3) = states
+        hasher = RowHasher(state2['fingerprint'], compatible=False)
+
+        # Canonical output is cached separately from compatible output
+        self.assertNotEqual([row['HASH'] for row in rows1], [row['HASH'] for row in rows2])
+        self.assertEqual(rows2, rows3)
+
+        for row in rows2:
+            values = [row[name] for name in OPENADDR_CSV_SCHEMA[:-1]]
+            self.assertEqual(row['HASH'], hasher.hash(values))
+
+    def test_single_ac_package(self):
+        ''' Test process_one.process with a package name, with and without cached output.
+        '''
+        source = join(self.src_dir, 'us-ca-alameda_county.json')
+        output_cache = LocalConformCache(join(self.testdir, 'conform-cache'))
+        mkdir(join(self.testdir, 'first'))
+        mkdir(join(self.testdir, 'second'))
+        
+        with HTTMock(self.response_content):
+            state_path1 = process_one.process(source, join(self.testdir, 'first'), False,
+                                              output_cache=output_cache, package_name='us/ca/alameda')
+            state_path2 = process_one.process(source, join(self.testdir, 'second'), False,
+                                              output_cache=output_cache, package_name='us/ca/alameda')
+        
+        contents = []
+
+        for state_path in (state_path1, state_path2):
+            with open(state_path) as file:
+                state = dict(zip(*json.load(file)))
+            
+            # Output is only written to the package, not to a plain CSV.
+            self.assertEqual(state['processed'], 'out.zip')
+            self.assertEqual(state['package'], 'out.zip')
+            self.assertFalse(exists(join(dirname(state_path), 'out.csv')))
+
+            with ZipFile(join(dirname(state_path), state['package'])) as zip_file:
+                self.assertIn('us/ca/alameda.vrt', zip_file.namelist())
+                contents.append(zip_file.read('us/ca/alameda.csv'))
+        
+        self.assertEqual(contents[0], contents[1])
+        self.assertTrue(contents[0].startswith(b'LON,LAT,NUMBER,STREET'))
+
     def test_single_ac_mixedcase(self):
         ''' Test complete process_one.process on Alameda County sample data.
         '''
@@ -1741,11 +1842,16 @@ class TestState (unittest.TestCase):
                                        geometry_type='Point', address_count=999,
                                        path=processed_path, elapsed=timedelta(seconds=1),
                                        attribution_flag=True, attribution_name='Example',
-                                       sharealike_flag=True)
+                                       sharealike_flag=True, stats=ConformStats(ConformProfile()))
+
+        conform_result.stats.rows_read, conform_result.stats.rows_written = 1000, 999
+        conform_result.stats.skip('column count')
+        conform_result.stats.profile.add('transform/hash', 1.5, 999)
 
         cache_result = CacheResult(cache='http://example.com/cache.csv',
                                    fingerprint='ff9900', version='0.0.0',
-                                   elapsed=timedelta(seconds=2))
+                                   elapsed=timedelta(seconds=2),
+                                   validators=CacheValidators('"abc"', None, 999, 'http://example.com/data.csv'))
         
         #
         # Check result of process_one.write_state().
@@ -1769,8 +1875,15 @@ class TestState (unittest.TestCase):
         self.assertEqual(state1['license'], 'ODbL')
         self.assertEqual(state1['geometry type'], 'Point')
         self.assertEqual(state1['address count'], 999)
+        self.assertEqual(state1['conform stats']['rows_read'], 1000)
+        self.assertEqual(state1['conform stats']['rows_written'], 999)
+        self.assertEqual(state1['conform stats']['rows_skipped'], {'column count': 1})
         self.assertEqual(state1['version'], '0.0.0')
         self.assertEqual(state1['fingerprint'], 'ff9900')
+        self.assertEqual(state1['cache etag'], '"abc"')
+        self.assertIsNone(state1['cache last modified'])
+        self.assertEqual(state1['cache content length'], 999)
+        self.assertEqual(state1['cache url'], 'http://example.com/data.csv')
         self.assertEqual(state1['cache time'], '0:00:02')
         self.assertEqual(state1['processed'], 'out.zip')
         self.assertEqual(state1['process time'], '0:00:01')
@@ -1782,11 +1895,19 @@ class TestState (unittest.TestCase):
         self.assertEqual(state1['attribution name'], 'Example')
         self.assertEqual(state1['tests passed'], True)
 
+        with open(join(dirname(path1), 'profile.txt')) as file:
+            self.assertIn('transform/hash', file.read())
+
         #
         # Tweak a few values, try process_one.write_state() again.
         #
         conform_result.attribution_flag = False
 
+        # Processed output was moved into the first state directory.
+        self.assertFalse(exists(processed_path))
+        with open(processed_path, 'w') as file:
+            pass
+
         args.update(source='sources/foo/bar.json', skipped=True)
         path2 = process_one.write_state(**args)
         
@@ -1845,6 +1966,28 @@ class TestPackage (unittest.TestCase):
 
         self.assertEqual(call4[0], 'close')
 
+    def test_package_output_columnar(self):
+        '''
+        '''
+        processed_csv, columnar_arrow = '/tmp/stuff.csv', '/tmp/stuff.arrow'
+        website, license = 'http://ci.carson.ca.us/', 'Public domain'
+        
+        with mock.patch('zipfile.ZipFile') as ZipFile:
+            package_output('us-ca-carson', processed_csv, website, license, columnar_arrow)
+
+            self.assertEqual(len(ZipFile.return_value.mock_calls), 5)
+            call1, call2, call3, call4, call5 = ZipFile.return_value.mock_calls
+
+        self.assertEqual(call3[0], 'write')
+        self.assertEqual(call3[1][0], processed_csv)
+        self.assertEqual(call3[1][1], 'us-ca-carson.csv')
+
+        self.assertEqual(call4[0], 'write')
+        self.assertEqual(call4[1][0], columnar_arrow)
+        self.assertEqual(call4[1][1], 'us-ca-carson.arrow')
+
+        self.assertEqual(call5[0], 'close')
+
     def test_package_output_txt(self):
         '''
         '''
@@ -1869,6 +2012,26 @@ class TestPackage (unittest.TestCase):
 
         self.assertEqual(call3[0], 'close')
 
+    def test_package_output_stream(self):
+        '''
+        '''
+        handle, zip_path = tempfile.mkstemp(prefix='package_output_stream-', suffix='.zip')
+        close(handle)
+        website, license = 'http://ci.carson.ca.us/', 'Public domain'
+        
+        try:
+            with package_output_stream(zip_path, 'us/ca/carson', website, license) as stream:
+                stream.write(b'LON,LAT\r\n')
+                stream.write(b'-118.2,33.8\r\n')
+            
+            with ZipFile(zip_path) as zip_file:
+                self.assertEqual(zip_file.namelist(), ['README.txt', 'us/ca/carson.vrt', 'us/ca/carson.csv'])
+                self.assertTrue(website in zip_file.read('README.txt').decode('utf8'))
+                self.assertTrue('<OGRVRTLayer name="carson">' in zip_file.read('us/ca/carson.vrt').decode('utf8'))
+                self.assertEqual(zip_file.read('us/ca/carson.csv'), b'LON,LAT\r\n-118.2,33.8\r\n')
+        finally:
+            remove(zip_path)
+
     def test_iterate_local_processed_files(self):
         state0 = {'processed': 'http://s3.amazonaws.com/openaddresses/000.csv'}
         state1 = {'processed': 'http://s3.amazonaws.com/openaddresses/123.csv', 'website': 'http://example.com'}
@@ -0,0 +1,454 @@
+# coding=ascii
+''' Performance benchmarks. These are not part of the test suite, run with:
+
+    python -m openaddr.tests.benchmarks hashing
+    python -m openaddr.tests.benchmarks geojson --large
+    python -m openaddr.tests.benchmarks conform --type csv --rows 10000 --rows 1000000
+
+Each benchmark runs 10,000 rows by default, and --large adds 1,000,000 and
+10,000,000 rows, which take hours and several GB of disk for all conform
+types. Results are compared by name to a baseline, by default the committed
+data/benchmarks-baseline.json, and a run fails if any result is slower by
+more than --threshold. Save results for each benchmark with --output, and
+pass the baseline file to --output on a reference machine to update it.
+'''
+from __future__ import absolute_import, division, print_function
+
+import os
+import csv
+import json
+import time
+import shutil
+import random
+import tempfile
+import unittest
+import itertools
+
+from argparse import ArgumentParser
+from functools import partial
+from operator import eq
+
+from osgeo import ogr, osr
+
+from ..conform import (
+    OPENADDR_CSV_SCHEMA, RowHasher, row_calculate_hash,
+    extract_to_source_csv, transform_to_out_csv
+    )
+
+from .. import sample
+
+# Rows held in memory at once by the hashing benchmark.
+CHUNK_ROWS = 100000
+
+def synthetic_out_rows(count, seed=0):
+    ''' Generate count random output rows without HASH values.
+    '''
+    rnd = random.Random(seed)
+    streets = ['MAPLE ST', 'OAK DR', u'RUE DE L\u2019\xc9GLISE', 'MAIN ST', '']
+    cities = ['RENO', 'OAKLAND', u'M\xdcNCHEN', None]
+
+    for n in range(count):
+        yield ['{:.7f}'.format(rnd.uniform(-180, 180)), '{:.7f}'.format(rnd.uniform(-90, 90)),
+               str(rnd.randrange(10000)), rnd.choice(streets), rnd.choice(['', '', '1A']),
+               rnd.choice(cities), None, None, str(rnd.randrange(10000, 99999)), str(n)]
+
+def timed_results(function, rows):
+    ''' Return how many seconds function takes to process a list of rows, and its results.
+    '''
+    start = time.perf_counter()
+    results = [function(row) for row in rows]
+    return time.perf_counter() - start, results
+
+def benchmark_hashing(count):
+    ''' Compare HASH calculation by row_calculate_hash() and RowHasher.
+
+        Rows are made and hashed CHUNK_ROWS at a time, and only hashing is timed.
+        Return a dictionary of rows per second for each method.
+    '''
+    names = OPENADDR_CSV_SCHEMA[:-1]
+
+    def calculate_hash(values):
+        return row_calculate_hash('fingerprint', dict(zip(names, values)))['HASH']
+
+    methods = [('row_calculate_hash', calculate_hash),
+               ('RowHasher compatible', RowHasher('fingerprint').hash),
+               ('RowHasher canonical', RowHasher('fingerprint', compatible=False).hash)]
+
+    rows = synthetic_out_rows(count)
+    seconds = dict.fromkeys([name for (name, _) in methods], 0.)
+
+    for chunk in iter(lambda: list(itertools.islice(rows, CHUNK_ROWS)), []):
+        hashes = dict()
+        for (name, function) in methods:
+            elapsed, hashes[name] = timed_results(function, chunk)
+            seconds[name] += elapsed
+
+        if hashes['RowHasher compatible'] != hashes['row_calculate_hash']:
+            raise ValueError('Compatible RowHasher values differ from row_calculate_hash()')
+
+    return {name: count / elapsed for (name, elapsed) in seconds.items()}
+
+def write_synthetic_geojson(path, count, seed=0):
+    ''' Write a GeoJSON FeatureCollection of count random polygons, one feature at a time.
+    '''
+    rnd = random.Random(seed)
+
+    with open(path, 'w', encoding='utf8') as file:
+        file.write('{"type": "FeatureCollection", "features": [\n')
+        for n in range(count):
+            x, y = rnd.uniform(-180, 180), rnd.uniform(-90, 90)
+            ring = [[x, y], [x + .001, y], [x + .001, y + .001], [x, y + .001], [x, y]]
+            properties = dict(OBJECTID=n, NUMBER=str(rnd.randrange(10000)), STREET='MAPLE ST', AREA=1.5)
+            feature = dict(type='Feature', properties=properties,
+                           geometry=dict(type='Polygon', coordinates=[ring]))
+            file.write((',\n' if n else '') + json.dumps(feature))
+        file.write('\n]}\n')
+
+def features_per_second(stream_features, path):
+    ''' Return how many features per second stream_features can read from a file.
+    '''
+    with open(path, 'rb') as file:
+        start = time.perf_counter()
+        count = sum(1 for _ in stream_features(file))
+        return count / (time.perf_counter() - start)
+
+def benchmark_geojson(count):
+    ''' Compare GeoJSON feature streaming from ijson parse events and backend items.
+
+        Features are streamed from a temporary file, and features from both
+        methods are compared afterwards in an untimed pass.
+        Return a dictionary of features per second for each method.
+    '''
+    handle, path = tempfile.mkstemp(prefix='benchmark-', suffix='.geojson')
+    os.close(handle)
+
+    try:
+        write_synthetic_geojson(path, count)
+        results = {'parse events': features_per_second(sample._stream_geojson_events, path)}
+
+        if sample.items_backend is None:
+            print('No compiled ijson backend available')
+            return results
+
+        def stream_items(stream):
+            return sample._stream_geojson_items(stream, sample.items_backend)
+
+        speed = features_per_second(stream_items, path)
+        results['{} items'.format(sample.items_backend.__name__.split('.')[-1])] = speed
+
+        with open(path, 'rb') as file1, open(path, 'rb') as file2:
+            features1, features2 = sample._stream_geojson_events(file1), stream_items(file2)
+            if not all(itertools.starmap(eq, itertools.zip_longest(features1, features2))):
+                raise ValueError('Features from ijson items differ from parse events')
+
+        return results
+    finally:
+        os.remove(path)
+
+# Source fields of synthetic addresses, all strings but ID.
+SOURCE_FIELDS = ('NUMBER', 'STREET', 'SUFFIX', 'UNIT', 'CITY', 'POSTCODE', 'ID')
+
+def synthetic_source_rows(count, seed=0):
+    ''' Generate count random address rows of SOURCE_FIELDS values and X, Y.
+    '''
+    rnd = random.Random(seed)
+    streets = ['MAPLE', 'OAK', u'RUE DE L\u2019\xc9GLISE', 'MAIN', '3RD']
+    suffixes = ['ST', 'DR', 'AVE', '']
+    cities = ['RENO', 'OAKLAND', u'M\xdcNCHEN', '']
+
+    for n in range(count):
+        yield (str(rnd.randrange(1, 10000)), rnd.choice(streets), rnd.choice(suffixes),
+               rnd.choice(['', '', '1A']), rnd.choice(cities), str(rnd.randrange(10000, 99999)),
+               n, rnd.uniform(-180, 180), rnd.uniform(-85, 85))
+
+def _square(x, y):
+    "Return a ring of coordinates for a small square polygon at x, y."
+    return [(x, y), (x + .0001, y), (x + .0001, y + .0001), (x, y + .0001), (x, y)]
+
+def write_csv_source(path, rows):
+    ''' Write synthetic rows to a CSV source with X and Y columns.
+    '''
+    with open(path, 'w', encoding='utf8') as file:
+        out = csv.writer(file)
+        out.writerow(SOURCE_FIELDS + ('X', 'Y'))
+        for row in rows:
+            out.writerow(row)
+
+def write_geojson_source(path, rows):
+    ''' Write synthetic rows to a GeoJSON source of points, one feature at a time.
+    '''
+    with open(path, 'w', encoding='utf8') as file:
+        file.write('{"type": "FeatureCollection", "features": [\n')
+        for (index, row) in enumerate(rows):
+            feature = dict(type='Feature', properties=dict(zip(SOURCE_FIELDS, row)),
+                           geometry=dict(type='Point', coordinates=row[-2:]))
+            file.write((',\n' if index else '') + json.dumps(feature))
+        file.write('\n]}\n')
+
+def write_ogr_source(driver_name, path, rows, polygons=False):
+    ''' Write synthetic rows to an OGR data source of points or polygons in EPSG:4326.
+
+        Raise RuntimeError if this GDAL can't write with the named driver.
+    '''
+    driver = ogr.GetDriverByName(driver_name)
+    if driver is None or not driver.TestCapability(ogr.ODrCCreateDataSource):
+        raise RuntimeError('Unable to create {} data sources'.format(driver_name))
+
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+
+    datasource = driver.CreateDataSource(path)
+    layer = datasource.CreateLayer('addresses', srs, ogr.wkbPolygon if polygons else ogr.wkbPoint)
+
+    for name in SOURCE_FIELDS:
+        layer.CreateField(ogr.FieldDefn(name, ogr.OFTInteger if name == 'ID' else ogr.OFTString))
+
+    layer_defn = layer.GetLayerDefn()
+    transactions = layer.TestCapability(ogr.OLCTransactions)
+
+    if transactions:
+        layer.StartTransaction()
+
+    for row in rows:
+        feature = ogr.Feature(layer_defn)
+        for (index, value) in enumerate(row[:-2]):
+            feature.SetField(index, value)
+
+        x, y = row[-2:]
+        if polygons:
+            wkt = 'POLYGON (({}))'.format(', '.join(['{} {}'.format(*p) for p in _square(x, y)]))
+        else:
+            wkt = 'POINT ({} {})'.format(x, y)
+
+        feature.SetGeometry(ogr.CreateGeometryFromWkt(wkt))
+        layer.CreateFeature(feature)
+
+    if transactions:
+        layer.CommitTransaction()
+
+    datasource.Destroy()
+
+# Conform types, with a file name and a function to write synthetic rows to it.
+source_writers = {
+    'csv': ('source.csv', write_csv_source),
+    'geojson': ('source.geojson', write_geojson_source),
+    'shapefile': ('source.shp', partial(write_ogr_source, 'ESRI Shapefile')),
+    'shapefile-polygon': ('source.shp', partial(write_ogr_source, 'ESRI Shapefile', polygons=True)),
+    'gdb': ('source.gdb', partial(write_ogr_source, 'OpenFileGDB')),
+    'xml': ('source.gml', partial(write_ogr_source, 'GML')),
+    }
+
+def synthetic_source(conform_type, count, dirname):
+    ''' Write a synthetic source of a conform type with count rows in dirname.
+
+        Return a source definition and the path to its data.
+    '''
+    filename, write_source = source_writers[conform_type]
+    source_path = os.path.join(dirname, filename)
+    write_source(source_path, synthetic_source_rows(count))
+
+    conform = dict(type=conform_type, number='NUMBER', street=['STREET', 'SUFFIX'],
+                   unit='UNIT', city='CITY', postcode='POSTCODE', id='ID',
+                   lon='X', lat='Y', srs='EPSG:4326')
+
+    if conform_type == 'csv':
+        del conform['srs']
+
+    return dict(type='http', fingerprint='0000', conform=conform), source_path
+
+def benchmark_conform(count, types=sorted(source_writers.keys())):
+    ''' Time extract_to_source_csv() and transform_to_out_csv() for synthetic sources.
+
+        Return a dictionary of rows per second for each conform type and stage.
+        Types whose sources can't be written with this GDAL are skipped.
+    '''
+    results = dict()
+
+    for conform_type in types:
+        dirname = tempfile.mkdtemp(prefix='benchmark-{}-'.format(conform_type))
+        extract_path = os.path.join(dirname, 'extracted.csv')
+        dest_path = os.path.join(dirname, 'out.csv')
+
+        try:
+            try:
+                source_definition, source_path = synthetic_source(conform_type, count, dirname)
+            except RuntimeError as e:
+                print('Skipping {}: {}'.format(conform_type, e))
+                continue
+
+            start = time.perf_counter()
+            extract_to_source_csv(source_definition, source_path, extract_path)
+            results[conform_type + '/extract'] = count / (time.perf_counter() - start)
+
+            start = time.perf_counter()
+            transform_to_out_csv(source_definition, extract_path, dest_path)
+            results[conform_type + '/transform'] = count / (time.perf_counter() - start)
+        finally:
+            shutil.rmtree(dirname)
+
+    return results
+
+def find_regressions(results, baseline, threshold):
+    ''' Return sorted names of results slower than baseline by more than threshold.
+
+        threshold: allowed slowdown as a fraction, e.g. 0.2 for 20%.
+    '''
+    return sorted([name for (name, speed) in results.items()
+                   if name in baseline and speed < baseline[name] * (1 - threshold)])
+
+benchmarks = {
+    'hashing': benchmark_hashing,
+    'geojson': benchmark_geojson,
+    'conform': benchmark_conform,
+    }
+
+# Default row counts for each benchmark, small enough to run in a few minutes.
+default_rows = {
+    'hashing': [10000],
+    'geojson': [10000],
+    'conform': [10000],
+    }
+
+# Row counts added by --large for every benchmark.
+large_rows = [1000000, 10000000]
+
+# Saved results for each benchmark, compared to a run by default.
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'data', 'benchmarks-baseline.json')
+
+def read_baseline(path, benchmark):
+    ''' Return saved results for one benchmark from a JSON file of results by benchmark.
+    '''
+    with open(path) as file:
+        return json.load(file).get(benchmark, {})
+
+def write_results(path, benchmark, results):
+    ''' Save results for one benchmark to a JSON file, keeping other benchmarks' results.
+    '''
+    saved = dict()
+
+    if os.path.exists(path):
+        with open(path) as file:
+            saved = json.load(file)
+
+    saved[benchmark] = results
+
+    with open(path, 'w') as file:
+        json.dump(saved, file, indent=2, sort_keys=True)
+
+parser = ArgumentParser(description='Run a performance benchmark.')
+
+parser.add_argument('benchmark', choices=sorted(benchmarks.keys()),
+                    help='Name of benchmark to run.')
+
+parser.add_argument('--rows', type=int, action='append',
+                    help='Number of synthetic rows, can be repeated. Default {}.'.format(
+                         ', '.join('{} for {}'.format(rows, name) for (name, rows) in sorted(default_rows.items()))))
+
+parser.add_argument('--large', action='store_true',
+                    help='Also run {} rows, taking hours for all benchmarks.'.format(
+                         ' and '.join(str(rows) for rows in large_rows)))
+
+parser.add_argument('--type', dest='types', action='append', choices=sorted(source_writers.keys()),
+                    help='Conform type to benchmark, can be repeated. Default all types.')
+
+parser.add_argument('--output', help='Optional JSON file name to save results.')
+
+parser.add_argument('--baseline', default=BASELINE_PATH,
+                    help='JSON file name of saved results to compare. Default {}.'.format(BASELINE_PATH))
+
+parser.add_argument('--threshold', type=float, default=0.2,
+                    help='Fraction slower than baseline that fails. Default {}.'.format(0.2))
+
+def main():
+    '''
+    '''
+    args = parser.parse_args()
+    function = benchmarks[args.benchmark]
+    results = dict()
+
+    if args.types and args.benchmark != 'conform':
+        parser.error('--type only applies to the conform benchmark')
+    elif args.types:
+        function = partial(function, types=args.types)
+
+    counts = (args.rows or default_rows[args.benchmark]) + (large_rows if args.large else [])
+
+    for count in counts:
+        for (name, speed) in function(count).items():
+            results['{}/{}'.format(name, count)] = speed
+
+    baseline = read_baseline(args.baseline, args.benchmark)
+
+    for name in sorted(results.keys()):
+        if name in baseline:
+            print('{:<32} {:>12,.0f} rows/sec {:>6.2f}x baseline'.format(name, results[name], results[name] / baseline[name]))
+        else:
+            print('{:<32} {:>12,.0f} rows/sec, no baseline'.format(name, results[name]))
+
+    if args.output:
+        write_results(args.output, args.benchmark, results)
+
+    regressions = find_regressions(results, baseline, args.threshold)
+    for name in regressions:
+        print('Regression in {}: {:,.0f} rows/sec, baseline {:,.0f}'.format(
+              name, results[name], baseline[name]))
+
+    return 1 if regressions else 0
+
+class TestBenchmarks (unittest.TestCase):
+
+    def test_find_regressions(self):
+        baseline = {'csv/extract/10000': 1000., 'csv/transform/10000': 2000., 'gdb/extract/10000': 500.}
+
+        # Only results slower than the threshold allows are regressions
+        results = {'csv/extract/10000': 900., 'csv/transform/10000': 1500., 'gdb/extract/10000': 600.}
+        self.assertEqual(find_regressions(results, baseline, .2), ['csv/transform/10000'])
+        self.assertEqual(find_regressions(results, baseline, .05), ['csv/extract/10000', 'csv/transform/10000'])
+        self.assertEqual(find_regressions(results, baseline, .3), [])
+
+        # Results are compared by name, and ones missing from the baseline are ignored
+        results = {'csv/extract/1000000': 1., 'xml/extract/10000': 1., 'csv/extract/10000': 1000.}
+        self.assertEqual(find_regressions(results, baseline, .2), [])
+        self.assertEqual(find_regressions({}, baseline, .2), [])
+
+    def test_baseline(self):
+        "The committed baseline should have results for each benchmark at default and large sizes"
+        for (benchmark, counts) in default_rows.items():
+            baseline = read_baseline(BASELINE_PATH, benchmark)
+            self.assertEqual({int(name.split('/')[-1]) for name in baseline}, set(counts + large_rows), benchmark)
+
+        hashing_baseline = read_baseline(BASELINE_PATH, 'hashing')
+        geojson_baseline = read_baseline(BASELINE_PATH, 'geojson')
+        conform_baseline = read_baseline(BASELINE_PATH, 'conform')
+
+        for count in default_rows['conform'] + large_rows:
+            for method in ('row_calculate_hash', 'RowHasher compatible', 'RowHasher canonical'):
+                self.assertIn('{}/{}'.format(method, count), hashing_baseline)
+
+            # Parse events and a compiled backend's items
+            names = [name for name in geojson_baseline if name.endswith('/{}'.format(count))]
+            self.assertIn('parse events/{}'.format(count), names)
+            self.assertTrue([name for name in names if name.endswith(' items/{}'.format(count))], count)
+
+            for conform_type in source_writers:
+                self.assertIn('{}/extract/{}'.format(conform_type, count), conform_baseline)
+                self.assertIn('{}/transform/{}'.format(conform_type, count), conform_baseline)
+
+    def test_write_results(self):
+        handle, path = tempfile.mkstemp(prefix='benchmarks-', suffix='.json')
+        os.close(handle)
+        os.remove(path)
+
+        try:
+            write_results(path, 'hashing', {'RowHasher canonical/100': 3.})
+            write_results(path, 'conform', {'csv/extract/100': 2.})
+            write_results(path, 'conform', {'csv/extract/100': 1.})
+
+            self.assertEqual(read_baseline(path, 'hashing'), {'RowHasher canonical/100': 3.})
+            self.assertEqual(read_baseline(path, 'conform'), {'csv/extract/100': 1.})
+            self.assertEqual(read_baseline(path, 'geojson'), {})
+        finally:
+            os.remove(path)
+
+if __name__ == '__main__':
+    exit(main())
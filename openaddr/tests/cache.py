@@ -1,10 +1,17 @@
 from __future__ import absolute_import, division, print_function
 
 from urllib.parse import urlparse, parse_qs
-from os.path import join, dirname
+from hashlib import md5
+from os.path import join, dirname, exists
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 
+import os
+import re
+import json
 import shutil
+import threading
 import mimetypes
+import time
 
 from mock import patch
 from esridump.errors import EsriDownloadError
@@ -12,7 +19,8 @@ import unittest
 import httmock
 import tempfile
 
-from ..cache import guess_url_file_extension, EsriRestDownloadTask
+from ..cache import guess_url_file_extension, EsriRestDownloadTask, URLDownloadTask, DownloadError, CacheValidators, file_fingerprint
+from .. import http_session, cache
 
 class TestCacheExtensionGuessing (unittest.TestCase):
 
@@ -56,6 +64,257 @@ class TestCacheExtensionGuessing (unittest.TestCase):
             assert guess_url_file_extension('http://dcatlas.dcgis.dc.gov/catalog/download.asp?downloadID=2182&downloadTYPE=ESRI') == '.zip'
             assert guess_url_file_extension('http://data.northcowichan.ca/DataBrowser/DownloadCsv?container=mncowichan&entitySet=PropertyReport&filter=NOFILTER') == '.csv', guess_url_file_extension('http://data.northcowichan.ca/DataBrowser/DownloadCsv?container=mncowichan&entitySet=PropertyReport&filter=NOFILTER')
 
+class _DownloadHandler(BaseHTTPRequestHandler):
+    ''' Serve the server's data, with Range support and dropped connections.
+
+        Each response sends at most the next number of bytes in the server's
+        drops list before closing its connection, then responses are whole.
+        Each request changes the ETag to the next one in the etags list.
+        Requests with a matching If-None-Match get a 304 Not Modified.
+        Responses have the next status in the statuses list and no body
+        until it's empty. Requests numbered in the refusals list, counting
+        from one, are closed without any response.
+    '''
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+
+        if len(server.requests) in server.refusals:
+            self.close_connection = True
+            return
+
+        if server.statuses:
+            self.send_response(server.statuses.pop(0))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        server.etag = server.etags.pop(0) if server.etags else server.etag
+
+        data, status, start = server.data, 200, 0
+        match = re.match(r'^bytes=(\d+)-$', self.headers.get('Range', ''))
+        if_range = self.headers.get('If-Range')
+
+        if self.headers.get('If-None-Match') == server.etag:
+            self.send_response(304)
+            self.send_header('ETag', server.etag)
+            self.end_headers()
+            return
+
+        if server.ranges and match and if_range in (None, server.etag):
+            start, status = int(match.group(1)), 206
+
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(data) - start))
+        self.send_header('ETag', server.etag)
+        if server.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        if status == 206:
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, len(data) - 1, len(data)))
+        self.end_headers()
+
+        if server.drops:
+            self.wfile.write(data[start:start + server.drops.pop(0)])
+            self.close_connection = True
+        else:
+            self.wfile.write(data[start:])
+
+    def log_message(self, *args):
+        pass
+
+class TestCacheURLDownload (unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='testCache-')
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _DownloadHandler)
+        self.server.data, self.server.etag = os.urandom(100000), '"abc"'
+        self.server.ranges, self.server.drops, self.server.etags, self.server.requests = True, [], [], []
+        self.server.statuses, self.server.refusals = [], []
+        self.url = 'http://127.0.0.1:{}/data.zip'.format(self.server.server_port)
+
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        http_session.get_session().close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        shutil.rmtree(self.workdir)
+
+    def _download(self, task=None, validators=None):
+        task = task or URLDownloadTask(None)
+        (file_path, ) = task.download([self.url], self.workdir, validators=validators)
+
+        self.assertFalse(exists(file_path + '.partial'))
+        with open(file_path, 'rb') as file:
+            self.assertEqual(file.read(), self.server.data)
+
+        # Fingerprint was computed while downloading, including resumed bytes
+        self.assertEqual(task.fingerprints[file_path], md5(self.server.data).hexdigest())
+        self.assertEqual(task.fingerprints[file_path], file_fingerprint(file_path))
+
+        return file_path
+
+    def test_download(self):
+        self._download()
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertNotIn('Range', self.server.requests[0])
+
+    def test_download_resumed(self):
+        chunk = URLDownloadTask.CHUNK
+        self.server.drops[:] = [chunk * 2, chunk * 3]
+        self._download()
+
+        ranges = [request.get('Range') for request in self.server.requests]
+        self.assertEqual(ranges, [None, 'bytes={}-'.format(chunk * 2), 'bytes={}-'.format(chunk * 5)])
+        self.assertEqual(self.server.requests[1]['If-Range'], self.server.etag)
+
+    def test_download_changed(self):
+        "A resource changed since the broken download should be started over"
+        self.server.drops[:] = [URLDownloadTask.CHUNK * 2]
+        self.server.etags[:] = ['"def"', '"ghi"']
+
+        self._download()
+        self.assertEqual(self.server.requests[1]['If-Range'], '"def"')
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_download_restarted(self):
+        "Without Accept-Ranges, broken downloads should start over"
+        self.server.ranges = False
+        self.server.drops[:] = [URLDownloadTask.CHUNK * 2]
+        self._download()
+
+        ranges = [request.get('Range') for request in self.server.requests]
+        self.assertEqual(ranges, [None, None])
+
+    def test_download_not_modified(self):
+        task = URLDownloadTask(None)
+        file_path = self._download(task)
+        os.remove(file_path)
+
+        previous = task.validators[self.url]
+        self.assertEqual(previous.etag, self.server.etag)
+        self.assertEqual(previous.content_length, len(self.server.data))
+        self.assertEqual(previous.url, self.url)
+
+        task = URLDownloadTask(None)
+        self.assertEqual(task.download([self.url], self.workdir, validators={self.url: previous}), [])
+        self.assertEqual(self.server.requests[-1]['If-None-Match'], self.server.etag)
+        self.assertEqual(task.validators[self.url].content_length, len(self.server.data))
+        self.assertFalse(exists(file_path))
+
+    def test_cache_revalidated(self):
+        "Previous validators should only be sent back to the URL they came from"
+        source_path = join(self.workdir, 'source.json')
+        with open(source_path, 'w') as file:
+            json.dump({'type': 'http', 'data': self.url}, file)
+
+        extras = {'cache': 'http://example.com/cache.zip', 'fingerprint': '0000',
+                  'cache etag': self.server.etag, 'cache url': self.url}
+
+        result1 = cache(source_path, self.workdir, extras)
+        self.assertEqual(self.server.requests[-1]['If-None-Match'], self.server.etag)
+        self.assertEqual(result1.cache, 'http://example.com/cache.zip')
+        self.assertEqual(result1.fingerprint, '0000')
+        self.assertEqual(result1.validators.url, self.url)
+
+        # Source data URL changed since the previous run
+        extras.update({'cache url': 'http://example.com/old-data.zip'})
+
+        result2 = cache(source_path, self.workdir, extras)
+        self.assertNotIn('If-None-Match', self.server.requests[-1])
+        self.assertEqual(result2.fingerprint, md5(self.server.data).hexdigest())
+        self.assertEqual(result2.validators.url, self.url)
+
+    def test_download_modified(self):
+        self.server.etags[:] = ['"def"']
+        previous = CacheValidators('"abc"', 'Sat, 01 Jan 2000 00:00:00 GMT', 99)
+
+        task = URLDownloadTask(None)
+        self._download(task, {self.url: previous})
+        self.assertEqual(self.server.requests[0]['If-None-Match'], '"abc"')
+        self.assertEqual(self.server.requests[0]['If-Modified-Since'], previous.last_modified)
+        self.assertEqual(task.validators[self.url].etag, '"def"')
+
+    def test_download_many(self):
+        urls = [self.url.replace('data.zip', '{}.zip'.format(name)) for name in 'abcdef']
+        active, peak, lock = [0], [0], threading.Lock()
+        download_file = URLDownloadTask.download_file
+
+        def counted_download_file(task, *args):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(.05)
+            try:
+                return download_file(task, *args)
+            finally:
+                with lock:
+                    active[0] -= 1
+
+        with patch.object(URLDownloadTask, 'download_file', counted_download_file):
+            file_paths = URLDownloadTask(None).download(urls, self.workdir)
+
+        # Files are returned in URL order, downloaded concurrently up to the host limit
+        self.assertEqual([os.path.basename(path) for path in file_paths],
+                         ['{}.zip'.format(name) for name in 'abcdef'])
+        self.assertEqual(len(self.server.requests), len(urls))
+        self.assertEqual(peak[0], URLDownloadTask.HOST_CONNECTIONS)
+
+    def test_download_failed(self):
+        self.server.drops[:] = [1000] * URLDownloadTask.ATTEMPTS
+
+        with self.assertRaises(DownloadError):
+            URLDownloadTask(None).download([self.url], self.workdir)
+
+        self.assertEqual(len(self.server.requests), URLDownloadTask.ATTEMPTS)
+        self.assertEqual(os.listdir(join(self.workdir, 'http')), [])
+
+    def test_download_reconnect_refused(self):
+        "Reconnects after a broken download should be retried, even when starting over"
+        http_session.configure(backoff=0)
+        self.addCleanup(http_session.configure, backoff=http_session.HTTP_BACKOFF)
+
+        # The HTTP session retries each refused connection before giving up on it
+        tries = http_session.HTTP_RETRIES + 1
+
+        self.server.ranges = False
+        self.server.drops[:] = [URLDownloadTask.CHUNK * 2]
+        self.server.refusals[:] = range(2, 2 + tries)
+
+        self._download()
+        self.assertEqual(len(self.server.requests), 2 + tries)
+
+        # A first connection is not retried beyond the HTTP session
+        del self.server.requests[:]
+        self.server.refusals[:] = range(1, 1 + tries)
+
+        with self.assertRaises(DownloadError):
+            URLDownloadTask(None).download([self.url.replace('data', 'other')], self.workdir)
+
+        self.assertEqual(len(self.server.requests), tries)
+
+    def test_download_server_error(self):
+        "Server errors should only be retried by the HTTP session, with its backoff"
+        http_session.configure(backoff=0)
+        self.addCleanup(http_session.configure, backoff=http_session.HTTP_BACKOFF)
+
+        self.server.statuses[:] = [503]
+        self._download()
+        self.assertEqual(len(self.server.requests), 2)
+
+        self.server.statuses[:] = [503] * (http_session.HTTP_RETRIES + 1)
+        del self.server.requests[:]
+
+        with self.assertRaises(DownloadError):
+            URLDownloadTask(None).download([self.url.replace('data', 'other')], self.workdir)
+
+        self.assertEqual(len(self.server.requests), http_session.HTTP_RETRIES + 1)
+
 class TestCacheEsriDownload (unittest.TestCase):
 
     def setUp(self):
@@ -59,7 +59,7 @@ from ..jobs import JOB_TIMEOUT
 from ..ci.work import make_source_filename, assemble_runstate, MAGIC_OK_MESSAGE
 from ..ci.webhooks import apply_webhooks_blueprint
 from ..ci.webapi import apply_webapi_blueprint
-from .. import LocalProcessedResult
+from .. import LocalProcessedResult, process_one
 from . import FakeS3
 
 def en64(bytes):
@@ -2399,7 +2399,7 @@ class TestRuns (unittest.TestCase):
         
         source_id, source_path = '0xDEADBEEF', 'sources/us-ca-oakland.json'
         
-        def returns_plausible_result(s3, run_id, source_name, content, render_preview, output_dir, mapzen_key):
+        def returns_plausible_result(s3, run_id, source_name, content, render_preview, output_dir, mapzen_key, previous_state):
             return dict(message=MAGIC_OK_MESSAGE, state=RunState({"source": "user_input.txt"}))
         
         do_work.side_effect = returns_plausible_result
@@ -2524,7 +2524,7 @@ class TestRuns (unittest.TestCase):
     def test_overdue_run(self, do_work):
         ''' Test a run that succeeds past its due date.
         '''
-        def returns_plausible_result(s3, run_id, source_name, content, render_preview, output_dir, mapzen_key):
+        def returns_plausible_result(s3, run_id, source_name, content, render_preview, output_dir, mapzen_key, previous_state):
             return dict(message=MAGIC_OK_MESSAGE, state=RunState({"source": "user_input.txt"}))
 
         do_work.side_effect = returns_plausible_result
@@ -2689,7 +2689,7 @@ class TestRuns (unittest.TestCase):
         source_id, source_path = '0xDEADBEEF', 'sources/us-ca-oakland.json'
         fprint = itertools.count(1)
         
-        def returns_plausible_result(s3, run_id, source_name, content, render_preview, output_dir, mapzen_key):
+        def returns_plausible_result(s3, run_id, source_name, content, render_preview, output_dir, mapzen_key, previous_state):
             return dict(message='Something went wrong', result_code=0, result_stdout='...',
                         state=RunState({"source": "user_input.txt", "fingerprint": next(fprint)}))
         
@@ -2796,7 +2796,7 @@ class TestRuns (unittest.TestCase):
         source_id, source_path = '0xDEADBEEF', 'sources/us-ca-oakland.json'
         fprint = itertools.count(1)
         
-        def returns_plausible_result(s3, run_id, source_name, content, render_preview, output_dir, mapzen_key):
+        def returns_plausible_result(s3, run_id, source_name, content, render_preview, output_dir, mapzen_key, previous_state):
             return dict(message=MAGIC_OK_MESSAGE, state=RunState({"source": "user_input.txt", "fingerprint": next(fprint)}))
         
         fake_queued_job_args = list(self.fake_queued_job_args[:])
@@ -2871,7 +2871,7 @@ class TestRuns (unittest.TestCase):
         source_id, source_path = '0xDEADBEEF', 'sources/us-ca-oakland.json'
         fprint = itertools.count(1)
         
-        def returns_plausible_result(s3, run_id, source_name, content, render_preview, output_dir, mapzen_key):
+        def returns_plausible_result(s3, run_id, source_name, content, render_preview, output_dir, mapzen_key, previous_state):
             return dict(message=MAGIC_OK_MESSAGE, result_code=0, result_stdout='...',
                         state=RunState({"source": "user_input.txt", "fingerprint": next(fprint)}))
         
@@ -3044,6 +3044,16 @@ class TestWorker (unittest.TestCase):
         self.assertEqual(state7.slippymap, 'https://s3.amazonaws.com/a-bucket/a-key')
         self.assertEqual(s3.new_key.mock_calls[-2], mock.call('/runs/7/slippymap.mbtiles'))
 
+        input8 = {'cache': 'https://s3.amazonaws.com/a-bucket/runs/1/cache.zip', 'fingerprint': 'ff9900',
+                  'cache etag': '"abc"', 'sample': False, 'processed': False, 'output': False, 'preview': False, 'slippymap': False}
+        state8 = assemble_runstate(s3, input8, 'xx/f', 8, 'dir')
+
+        self.assertEqual(state8.run_id, 8)
+        self.assertEqual(state8.cache, input8['cache'])
+        self.assertEqual(state8.fingerprint, 'ff9900')
+        self.assertEqual(state8.cache_etag, '"abc"')
+        self.assertNotIn(mock.call('/runs/8/' + input8['cache']), s3.new_key.mock_calls)
+
     @patch('tempfile.mkdtemp')
     @patch('subprocess.check_output')
     def test_happy_worker(self, check_output, mkdtemp):
@@ -3080,6 +3090,7 @@ class TestWorker (unittest.TestCase):
             os.path.join(self.output_dir, 'work/logfile.txt'),
             os.path.join(self.output_dir, u'work/so--exalté.txt'),
             os.path.join(self.output_dir, 'work/out'),
+            '--package-name', u'so/exalté',
             '--render-preview',
             '--mapzen-key', 'mapzen-XXXX'
             ))
@@ -3139,6 +3150,7 @@ class TestWorker (unittest.TestCase):
             os.path.join(self.output_dir, 'work/logfile.txt'),
             os.path.join(self.output_dir, 'work/angry.txt'),
             os.path.join(self.output_dir, 'work/out'),
+            '--package-name', 'angry',
             '--skip-preview'
             ))
         
@@ -3149,6 +3161,45 @@ class TestWorker (unittest.TestCase):
         self.assertEqual(result['result_stdout'], 'Everything is ruined.\n')
         self.assertEqual(result['result_code'], 1)
 
+    @patch('tempfile.mkdtemp')
+    @patch('subprocess.check_output')
+    def test_previous_state_worker(self, check_output, mkdtemp):
+        ''' Previous run state should reach openaddr-process-one as cache() extras.
+        '''
+        extras = dict()
+
+        def reads_previous_state(cmd, timeout, stderr):
+            # Parse arguments and read state the way process_one.main() does.
+            args = process_one.parser.parse_args(cmd[1:])
+            extras.update(process_one.read_previous_state(args.previous_state))
+            raise subprocess.CalledProcessError(1, cmd, 'Stopping here.\n')
+        
+        def same_tempdir_every_time(prefix, dir):
+            os.mkdir(join(dir, 'work'))
+            return join(dir, 'work')
+        
+        check_output.side_effect = reads_previous_state
+        mkdtemp.side_effect = same_tempdir_every_time
+        
+        previous_state = RunState({'cache': 'http://s3.amazonaws.com/a-bucket/runs/1/cache.zip',
+                                   'fingerprint': 'ff9900', 'cache etag': '"abc"',
+                                   'cache last modified': 'Sat, 01 Jan 2000 00:00:00 GMT',
+                                   'cache content length': 999, 'cache url': 'http://example.com/data.zip',
+                                   'processed': 'http://s3.amazonaws.com/a-bucket/runs/1/angry.zip'})
+
+        result = work.do_work(self.s3, -1, 'angry', '{ }', False, self.output_dir,
+                              previous_state=previous_state)
+        
+        self.assertEqual(check_output.mock_calls[-1][1][0][-2:],
+                         ('--previous-state', os.path.join(self.output_dir, 'work/previous-state.json')))
+        
+        self.assertEqual(extras, {'cache': 'http://s3.amazonaws.com/a-bucket/runs/1/cache.zip',
+                                  'fingerprint': 'ff9900', 'cache etag': '"abc"',
+                                  'cache last modified': 'Sat, 01 Jan 2000 00:00:00 GMT',
+                                  'cache content length': 999, 'cache url': 'http://example.com/data.zip'})
+
+        self.assertEqual(result['result_code'], 1)
+
     @patch('tempfile.mkdtemp')
     @patch('subprocess.check_output')
     def test_skippy_worker(self, check_output, mkdtemp):
@@ -3184,6 +3235,7 @@ class TestWorker (unittest.TestCase):
             os.path.join(self.output_dir, 'work/logfile.txt'),
             os.path.join(self.output_dir, u'work/so--exalté.txt'),
             os.path.join(self.output_dir, 'work/out'),
+            '--package-name', u'so/exalté',
             '--render-preview',
             '--mapzen-key', 'mapzen-XXXX'
             ))
@@ -3429,7 +3481,7 @@ class TestBatch (unittest.TestCase):
     def test_single_run(self, do_work):
         ''' Show that the tasks enqueued in a batch context can be run.
         '''
-        def returns_plausible_result(s3, run_id, source_name, content, render_preview, output_dir, mapzen_key):
+        def returns_plausible_result(s3, run_id, source_name, content, render_preview, output_dir, mapzen_key, previous_state):
             return dict(message=MAGIC_OK_MESSAGE, state=RunState({"source": "user_input.txt"}))
         
         do_work.side_effect = returns_plausible_result
@@ -3490,7 +3542,7 @@ class TestBatch (unittest.TestCase):
     def test_run_with_renders(self, do_work):
         ''' Show that a batch context will result in rendered maps.
         '''
-        def returns_plausible_result(s3, run_id, source_name, content, render_preview, output_dir, mapzen_key):
+        def returns_plausible_result(s3, run_id, source_name, content, render_preview, output_dir, mapzen_key, previous_state):
             return dict(message=MAGIC_OK_MESSAGE, state=RunState({"source": "user_input.txt", "address count": 999}))
         
         do_work.side_effect = returns_plausible_result
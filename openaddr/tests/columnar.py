@@ -0,0 +1,47 @@
+from __future__ import absolute_import, division, print_function
+
+from os.path import join
+
+import unittest
+import tempfile
+import shutil
+
+from .. import columnar
+from ..conform import OPENADDR_CSV_SCHEMA
+
+@unittest.skipIf(not columnar.is_available(), 'Columnar output needs pyarrow')
+class TestColumnar (unittest.TestCase):
+
+    def setUp(self):
+        self.testdir = tempfile.mkdtemp(prefix='testColumnar-')
+
+    def tearDown(self):
+        shutil.rmtree(self.testdir)
+
+    def test_write_columnar(self):
+        csv_path = join(self.testdir, 'out.csv')
+        columnar_path = join(self.testdir, 'out.arrow')
+
+        with open(csv_path, 'w', encoding='utf8') as file:
+            file.write(','.join(OPENADDR_CSV_SCHEMA) + '\r\n')
+            file.write('-122.2592497,37.8026126,5115,FRUITED PLAINS LN,,,,,,,0a1b\r\n')
+            file.write(',,5121,"FRUITED PLAINS LN, WEST",,Oakland,,CA,94612,00123,2c3d\r\n')
+
+        self.assertEqual(columnar.write_columnar(csv_path, columnar_path), 2)
+
+        table = columnar.read_columnar(columnar_path)
+        self.assertEqual(table.schema.names, OPENADDR_CSV_SCHEMA)
+        self.assertEqual(str(table.schema.field('LON').type), 'double')
+        self.assertEqual(str(table.schema.field('STREET').type), 'string')
+
+        rows = table.to_pylist()
+        self.assertAlmostEqual(rows[0]['LON'], -122.2592497)
+        self.assertAlmostEqual(rows[0]['LAT'], 37.8026126)
+        self.assertEqual(rows[0]['UNIT'], '')
+        self.assertIsNone(rows[1]['LON'])
+        self.assertEqual(rows[1]['STREET'], 'FRUITED PLAINS LN, WEST')
+        self.assertEqual(rows[1]['ID'], '00123')
+
+        table = columnar.read_columnar(columnar_path, ['LON', 'LAT'])
+        self.assertEqual(table.schema.names, ['LON', 'LAT'])
+        self.assertEqual(table.num_rows, 2)
@@ -2,29 +2,50 @@
 
 from __future__ import absolute_import, division, print_function
 
+import io
 import os
 import copy
 import json
 import csv
 import re
+import zipfile
 
 import unittest
 import tempfile
+import importlib
+import concurrent.futures
+import mock
+import multiprocessing
 import shutil
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from osgeo import ogr, osr
+
 from ..conform import (
     GEOM_FIELDNAME, X_FIELDNAME, Y_FIELDNAME,
     csv_source_to_csv, find_source_path, row_transform_and_convert,
     row_fxn_regexp, row_smash_case, row_round_lat_lon, row_merge,
-    row_extract_and_reproject, row_convert_to_out, row_fxn_join, row_fxn_format,
+    row_extract_and_reproject, row_extract_coordinates, reproject_extracted_rows, reproject_coordinates,
+    row_convert_to_out, row_fxn_join, row_fxn_format,
     row_fxn_prefixed_number, row_fxn_postfixed_street,
     row_fxn_remove_prefix, row_fxn_remove_postfix, row_fxn_chain,
     row_canonicalize_unit_and_number, conform_smash_case, conform_cli,
     convert_regexp_replace, conform_license,
     conform_attribution, conform_sharealike, normalize_ogr_filename_case,
-    OPENADDR_CSV_SCHEMA, is_in, geojson_source_to_csv, check_source_tests
+    OPENADDR_CSV_SCHEMA, is_in, geojson_source_to_csv, check_source_tests,
+    ConformPlan, ConformStats, row_as_extracted, split_extracted_csv, transform_to_out_csv,
+    RowHasher, row_calculate_hash, ogr_geometry_centroid, ogr_wkb_centroids, geojson_centroids, geojson_geometry_wkb, ZipDecompressTask,
+    vsizip_paths, is_vsizip_readable, select_zip_members, find_source_parts, conform_parts_cli,
+    elaborate_filenames, canonicalize_out_rows
     )
 
+# openaddr.conform() shadows this module as a package attribute, so patch it directly
+conform_module = importlib.import_module('..conform', __package__)
+
 class TestConformTransforms (unittest.TestCase):
     "Test low level data transform functions"
 
@@ -287,6 +308,93 @@ class TestConformTransforms (unittest.TestCase):
                           "CITY": None, "REGION": None, "DISTRICT": None, "POSTCODE": None, "ID": None,
                           'HASH': 'eee8eb535bb20a03'}, r)
 
+    def test_conform_plan(self):
+        d = conform_smash_case({ "conform": { "street": ["S1", "S2"], "number": {"function": "regexp", "field": "N", "pattern": "^([0-9]+)"},
+                                 "unit": { "function": "format", "fields": ["u1", "u2"], "format": "$1-$2" }, "lon": "y", "lat": "x" },
+                                 "fingerprint": "0000" })
+        plan = ConformPlan(d)
+        self.assertEqual(len(plan.operations), 3)
+
+        for (n, u2) in (("123", "A"), ("456 REAR", None), ("", "")):
+            row = { "N": n, "s1": "MAPLE", "s2": "ST", "u1": "1", "u2": u2, X_FIELDNAME: "-119.2", Y_FIELDNAME: "39.3" }
+            self.assertEqual(row_transform_and_convert(d, dict(row)), plan.transform(dict(row)))
+
+        r = plan.transform({ "n": "456 REAR", "s1": "MAPLE", "s2": "ST", "u1": "1", "u2": "A", X_FIELDNAME: "-119.2", Y_FIELDNAME: "39.3" })
+        self.assertEqual(r["NUMBER"], "456")
+        self.assertEqual(r["STREET"], "MAPLE ST")
+        self.assertEqual(r["UNIT"], "1-A")
+        self.assertIsNone(r["CITY"])
+
+        # Position-indexed rows, with column names lowercased once
+        transform = plan.row_transform(["N", "S1", "S2", "U1", "U2", X_FIELDNAME, Y_FIELDNAME])
+        out = transform(["456 REAR", "MAPLE", "ST", "1", "A", "-119.2", "39.3"])
+        self.assertEqual(dict(zip(OPENADDR_CSV_SCHEMA, out)), r)
+
+        # Missing values are None, and missing columns fail like dictionary keys
+        self.assertEqual(transform(["456 REAR", "MAPLE", "ST"])[:5], [None, None, "456", "MAPLE ST", ""])
+        with self.assertRaises(KeyError):
+            plan.row_transform(["N", "S1", X_FIELDNAME, Y_FIELDNAME])(["456", "MAPLE", "0", "0"])
+
+        with self.assertRaises(ValueError):
+            ConformPlan({ "conform": { "number": {"function": "bogus", "field": "n"} } })
+
+        with self.assertRaises(ValueError):
+            ConformPlan({ "conform": { "number": "n", "split": "address" } })
+
+    def test_conform_plan_batch(self):
+        d = conform_smash_case({ "conform": { "street": ["S1", "S2"], "number": "N", "unit": "U", "lon": "x", "lat": "y" },
+                                 "fingerprint": "0000" })
+        plan = ConformPlan(d)
+        fieldnames = ["N", "S1", "S2", "U", X_FIELDNAME, Y_FIELDNAME]
+
+        coordinates = ["", None, "junk", "nan", "inf", "1e300", "-0", " 0.00", "180.0", "1e-05", "-0.00000001",
+                       "0.00000005", "0.00000015", "39.142857153", "-122.12345665", "1.23456785", "39.14285717777"]
+        numbers = ["123.0", " 5.00 ", None, "", "3.0a", "1.05", "7\n.0", "44"]
+        rows = [[numbers[i % len(numbers)], "MAPLE ", " ST", (None, " 1 ")[i % 2],
+                 coordinates[i % len(coordinates)], coordinates[-i % len(coordinates)]]
+                for i in range(200)]
+
+        "Batches should match the row transform exactly, with or without junk coordinates"
+        row_transform, batch_transform = plan.row_transform(fieldnames), plan.batch_transform(fieldnames)
+        self.assertEqual(batch_transform([list(row) for row in rows]), [row_transform(list(row)) for row in rows])
+        self.assertEqual(batch_transform([list(row) for row in rows if row[4] != "junk"]),
+                         [row_transform(list(row)) for row in rows if row[4] != "junk"])
+        self.assertEqual(batch_transform([]), [])
+
+        outs = [["39.3000000", "-121.20", " 5.00 ", " MAPLE ST ", None] + [None] * 4]
+        canonicalize_out_rows(outs)
+        self.assertEqual(outs, [["39.3", "-121.2", "5", "MAPLE ST", ""] + [None] * 4])
+
+    def test_row_hasher(self):
+        rows = [['-119.2', '39.3', '123', 'MAPLE ST', '', 'RENO', None, None, '89501', ''],
+                ['', '', '', u'\u2603 "ST"', '1\n2', None, None, None, None, 5],
+                [None] * 10]
+
+        # Compatible hashes match row_calculate_hash() exactly
+        hasher = RowHasher('0000')
+        for values in rows:
+            expected = row_calculate_hash('0000', dict(zip(OPENADDR_CSV_SCHEMA, values)))['HASH']
+            self.assertEqual(hasher.hash(values), expected)
+
+        # Compatible hashes without a fingerprint are random, but keyed once
+        hasher = RowHasher(None)
+        self.assertEqual(hasher.hash(rows[0]), hasher.hash(rows[0]))
+        self.assertNotEqual(hasher.hash(rows[0]), RowHasher(None).hash(rows[0]))
+
+        # Canonical hashes are stable with or without a fingerprint
+        for fingerprint in ('0000', None):
+            hasher1 = RowHasher(fingerprint, compatible=False)
+            hasher2 = RowHasher(fingerprint, compatible=False)
+            for values in rows:
+                self.assertEqual(hasher1.hash(values), hasher2.hash(values))
+                self.assertEqual(len(hasher1.hash(values)), 16)
+
+        # Canonical values are unambiguous but None and empty strings are alike, like in CSV
+        hasher = RowHasher('0000', compatible=False)
+        self.assertNotEqual(hasher.hash(['ab', ''] + [''] * 8), hasher.hash(['a', 'b'] + [''] * 8))
+        self.assertEqual(hasher.hash([None] * 10), hasher.hash([''] * 10))
+        self.assertNotEqual(hasher.hash(rows[0]), RowHasher('0001', compatible=False).hash(rows[0]))
+
     def test_row_canonicalize_unit_and_number(self):
         r = row_canonicalize_unit_and_number({}, {"NUMBER": "324 ", "STREET": " OAK DR.", "UNIT": "1"})
         self.assertEqual("324", r["NUMBER"])
@@ -367,6 +475,54 @@ class TestConformTransforms (unittest.TestCase):
         r = row_extract_and_reproject(d, {"LONG_WGS84": "-21,77", "LAT_WGS84": "64,11"})
         self.assertEqual({Y_FIELDNAME: "64.11", X_FIELDNAME: "-21.77"}, r)
 
+    def test_reproject_extracted_rows(self):
+        d = { "conform" : { "srs": "EPSG:2913", "type": "" }, 'type': 'test' }
+        source_rows = [{X_FIELDNAME: "7655634.924", Y_FIELDNAME: "668868.414"},
+                       {X_FIELDNAME: "", Y_FIELDNAME: ""},
+                       {X_FIELDNAME: "bad", Y_FIELDNAME: "668868.414"},
+                       {X_FIELDNAME: None, Y_FIELDNAME: "668868.414"},
+                       {X_FIELDNAME: "7655634,924", Y_FIELDNAME: "668868,414"}]
+
+        extracted = [row_extract_coordinates(d, row) for row in source_rows]
+        self.assertEqual(extracted[3], ({}, None, None))
+        self.assertEqual(extracted[4], ({}, "7655634.924", "668868.414"))
+
+        rows = reproject_extracted_rows(d, extracted)
+        self.assertEqual(rows, [row_extract_and_reproject(d, row) for row in source_rows])
+        self.assertAlmostEqual(-122.630842186650796, float(rows[0][X_FIELDNAME]))
+        self.assertAlmostEqual(45.481554393851063, float(rows[0][Y_FIELDNAME]))
+        self.assertEqual(rows[0], rows[4])
+        self.assertEqual(rows[1], {X_FIELDNAME: "", Y_FIELDNAME: ""})
+        self.assertEqual(rows[2], {X_FIELDNAME: "", Y_FIELDNAME: ""})
+        self.assertEqual(rows[3], {X_FIELDNAME: None, Y_FIELDNAME: None})
+
+    def test_reproject_coordinates_error(self):
+        "A point that fails to reproject alone should be logged with its row number"
+        d = { "conform" : { "srs": "EPSG:2913", "type": "" }, 'type': 'test' }
+        context = mock.Mock()
+        context.transform_to_4326.return_value = mock.Mock(spec=['TransformPoints'])
+        context.transform_to_4326.return_value.TransformPoints.return_value = \
+            [(-122.6, 45.5, 0), (float('inf'), float('inf'), 0)]
+
+        with self.assertLogs('openaddr.conform', 'ERROR') as logs, self.assertRaises(Exception):
+            reproject_coordinates(d, [("1", "2"), ("3", "4")], context, row_numbers=[5, 9])
+
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('Error in row 9:', logs.output[0])
+
+    def test_reproject_coordinates_stats(self):
+        "Blank and bad coordinates should be counted separately"
+        d = { "conform" : { "srs": "EPSG:2913", "type": "" }, 'type': 'test' }
+        context = mock.Mock()
+        context.transform_to_4326.return_value.TransformPoints.return_value = [(-122.6, 45.5, 0)]
+
+        stats = ConformStats()
+        coordinates = [("1", "2"), ("", ""), (None, "3"), ("x", "4"), ("5", "")]
+        reprojected = reproject_coordinates(d, coordinates, context, stats=stats)
+
+        self.assertEqual(reprojected, [("-122.6000000", "45.5000000"), ("", ""), (None, None), ("", ""), ("", "")])
+        self.assertEqual(stats.rows_unlocated, {'blank coordinates': 3, 'bad coordinates': 1})
+
     def test_row_fxn_prefixed_number_and_postfixed_street(self):
         "Regex prefixed_number and postfix_street - both fields present"
         c = { "conform": {
@@ -837,18 +993,18 @@ class TestConformCli (unittest.TestCase):
         source_path = os.path.join(self.conforms_dir, "%s.%s" % (source_name, ext))
         dest_path = os.path.join(self.testdir, '%s-conformed.csv' % source_name)
         
-        rc = conform_cli(source_definition, source_path, dest_path)
-        return rc, dest_path
+        stats = conform_cli(source_definition, source_path, dest_path)
+        return stats, dest_path
 
     def test_unknown_conform(self):
         # Test that the conform tool does something reasonable with unknown conform sources
-        self.assertEqual(1, conform_cli({}, 'test', ''))
-        self.assertEqual(1, conform_cli({'conform': {}}, 'test', ''))
-        self.assertEqual(1, conform_cli({'conform': {'type': 'broken'}}, 'test', ''))
+        self.assertIsNone(conform_cli({}, 'test', ''))
+        self.assertIsNone(conform_cli({'conform': {}}, 'test', ''))
+        self.assertIsNone(conform_cli({'conform': {'type': 'broken'}}, 'test', ''))
 
     def test_lake_man(self):
-        rc, dest_path = self._run_conform_on_source('lake-man', 'shp')
-        self.assertEqual(0, rc)
+        stats, dest_path = self._run_conform_on_source('lake-man', 'shp')
+        self.assertIsNotNone(stats)
 
         with open(dest_path) as fp:
             reader = csv.DictReader(fp)
@@ -874,8 +1030,8 @@ class TestConformCli (unittest.TestCase):
             self.assertEqual(rows[5]['STREET'], 'OLD MILL RD')
 
     def test_lake_man_gdb(self):
-        rc, dest_path = self._run_conform_on_source('lake-man-gdb', 'gdb')
-        self.assertEqual(0, rc)
+        stats, dest_path = self._run_conform_on_source('lake-man-gdb', 'gdb')
+        self.assertIsNotNone(stats)
 
         with open(dest_path) as fp:
             reader = csv.DictReader(fp)
@@ -900,9 +1056,52 @@ class TestConformCli (unittest.TestCase):
             self.assertEqual(rows[5]['NUMBER'], '5115')
             self.assertEqual(rows[5]['STREET'], 'OLD MILL RD')
 
+    def test_lake_man_gdb_layers(self):
+        with open(os.path.join(self.conforms_dir, 'lake-man-gdb.json')) as file:
+            source_definition = json.load(file)
+        source_definition['conform']['layer'] = [0, 0]
+        source_path = os.path.join(self.conforms_dir, 'lake-man-gdb.gdb')
+        dest_path = os.path.join(self.testdir, 'lake-man-gdb-conformed.csv')
+
+        parts = find_source_parts(source_definition, [source_path])
+        self.assertEqual([(d['conform']['layer'], p) for (d, p) in parts], [(0, source_path), (0, source_path)])
+
+        # One worker conforms parts in this process, two in spawned processes
+        for workers in (1, 2):
+            with mock.patch('multiprocessing.get_context', wraps=multiprocessing.get_context) as get_context:
+                stats = conform_parts_cli(parts, dest_path, workers=workers)
+
+            self.assertEqual(get_context.mock_calls[:1], [mock.call('spawn')] if workers > 1 else [])
+            self.assertEqual(stats.rows_read, 12)
+            self.assertEqual(stats.rows_written, 12)
+
+            with open(dest_path) as fp:
+                reader = csv.DictReader(fp)
+                self.assertEqual(OPENADDR_CSV_SCHEMA, reader.fieldnames)
+
+                rows = list(reader)
+                self.assertEqual(12, len(rows))
+                self.assertEqual(rows[:6], rows[6:])
+                self.assertEqual(rows[0]['NUMBER'], '5115')
+                self.assertEqual(rows[5]['STREET'], 'OLD MILL RD')
+
+    @unittest.skipIf(numpy is None or not hasattr(ogr.Layer, 'GetArrowStreamAsNumPy'),
+                     'GDAL 3.6+ with NumPy is needed to read Arrow batches')
+    def test_lake_man_batches(self):
+        with mock.patch.object(conform_module, 'ogr_wkb_centroids', wraps=ogr_wkb_centroids) as centroids:
+            stats, dest_path = self._run_conform_on_source('lake-man', 'shp')
+
+        # Batched centroids are only used when reading Arrow batches
+        self.assertTrue(centroids.called)
+
+        with open(dest_path) as fp:
+            rows = list(csv.DictReader(fp))
+            self.assertAlmostEqual(float(rows[0]['LAT']), 37.802612637607439)
+            self.assertAlmostEqual(float(rows[0]['LON']), -122.259249687194824)
+
     def test_lake_man_split(self):
-        rc, dest_path = self._run_conform_on_source('lake-man-split', 'shp')
-        self.assertEqual(0, rc)
+        stats, dest_path = self._run_conform_on_source('lake-man-split', 'shp')
+        self.assertIsNotNone(stats)
         
         with open(dest_path) as fp:
             rows = list(csv.DictReader(fp))
@@ -920,8 +1119,8 @@ class TestConformCli (unittest.TestCase):
             self.assertEqual(rows[5]['STREET'], 'SCOFIELD AVE')
 
     def test_lake_man_merge_postcode(self):
-        rc, dest_path = self._run_conform_on_source('lake-man-merge-postcode', 'shp')
-        self.assertEqual(0, rc)
+        stats, dest_path = self._run_conform_on_source('lake-man-merge-postcode', 'shp')
+        self.assertIsNotNone(stats)
         
         with open(dest_path) as fp:
             rows = list(csv.DictReader(fp))
@@ -939,8 +1138,8 @@ class TestConformCli (unittest.TestCase):
             self.assertEqual(rows[5]['STREET'], 'EKLUTNA LAKE RD')
     
     def test_lake_man_merge_postcode2(self):
-        rc, dest_path = self._run_conform_on_source('lake-man-merge-postcode2', 'shp')
-        self.assertEqual(0, rc)
+        stats, dest_path = self._run_conform_on_source('lake-man-merge-postcode2', 'shp')
+        self.assertIsNotNone(stats)
         
         with open(dest_path) as fp:
             rows = list(csv.DictReader(fp))
@@ -958,15 +1157,15 @@ class TestConformCli (unittest.TestCase):
             self.assertEqual(rows[5]['STREET'], 'MAITLAND DR')
 
     def test_lake_man_shp_utf8(self):
-        rc, dest_path = self._run_conform_on_source('lake-man-utf8', 'shp')
-        self.assertEqual(0, rc)
+        stats, dest_path = self._run_conform_on_source('lake-man-utf8', 'shp')
+        self.assertIsNotNone(stats)
         with open(dest_path, encoding='utf-8') as fp:
             rows = list(csv.DictReader(fp))
             self.assertEqual(rows[0]['STREET'], u'PZ ESPA\u00d1A')
 
     def test_lake_man_shp_epsg26943(self):
-        rc, dest_path = self._run_conform_on_source('lake-man-epsg26943', 'shp')
-        self.assertEqual(0, rc)
+        stats, dest_path = self._run_conform_on_source('lake-man-epsg26943', 'shp')
+        self.assertIsNotNone(stats)
 
         with open(dest_path) as fp:
             rows = list(csv.DictReader(fp))
@@ -974,8 +1173,8 @@ class TestConformCli (unittest.TestCase):
             self.assertAlmostEqual(float(rows[0]['LON']), -122.259249687194824)
 
     def test_lake_man_shp_noprj_epsg26943(self):
-        rc, dest_path = self._run_conform_on_source('lake-man-epsg26943-noprj', 'shp')
-        self.assertEqual(0, rc)
+        stats, dest_path = self._run_conform_on_source('lake-man-epsg26943-noprj', 'shp')
+        self.assertIsNotNone(stats)
 
         with open(dest_path) as fp:
             rows = list(csv.DictReader(fp))
@@ -986,8 +1185,8 @@ class TestConformCli (unittest.TestCase):
 
     def test_lake_man_split2(self):
         "An ESRI-to-CSV like source"
-        rc, dest_path = self._run_conform_on_source('lake-man-split2', 'csv')
-        self.assertEqual(0, rc)
+        stats, dest_path = self._run_conform_on_source('lake-man-split2', 'csv')
+        self.assertIsNotNone(stats)
 
         with open(dest_path) as fp:
             rows = list(csv.DictReader(fp))
@@ -1004,10 +1203,161 @@ class TestConformCli (unittest.TestCase):
             self.assertEqual(rows[5]['NUMBER'], '1')
             self.assertEqual(rows[5]['STREET'], 'Spectrum Pointe Dr #320')
 
+    def test_lake_man_feature_loop(self):
+        "Columnar batches, where GDAL supports them, should match the feature loop"
+        for (source_name, ext) in (('lake-man', 'shp'), ('lake-man-gdb', 'gdb'), ('lake-man-gml', 'gml')):
+            with open(os.path.join(self.conforms_dir, '%s.json' % source_name)) as file:
+                source_definition = json.load(file)
+                source_definition['fingerprint'] = '0000'
+
+            source_path = os.path.join(self.conforms_dir, '%s.%s' % (source_name, ext))
+            dest_path1 = os.path.join(self.testdir, '%s-conformed1.csv' % source_name)
+            dest_path2 = os.path.join(self.testdir, '%s-conformed2.csv' % source_name)
+
+            self.assertIsNotNone(conform_cli(source_definition, source_path, dest_path1))
+
+            with mock.patch.object(conform_module, 'ogr_arrow_batches') as ogr_arrow_batches:
+                ogr_arrow_batches.return_value = None
+                self.assertIsNotNone(conform_cli(source_definition, source_path, dest_path2))
+                self.assertTrue(ogr_arrow_batches.called)
+
+            with open(dest_path1, 'rb') as file1, open(dest_path2, 'rb') as file2:
+                self.assertEqual(file1.read(), file2.read())
+
+    def test_lake_man_split2_extract_path(self):
+        "Conforming through a kept extract file should match the streamed conform"
+        with open(os.path.join(self.conforms_dir, 'lake-man-split2.json')) as file:
+            source_definition = json.load(file)
+            source_definition['fingerprint'] = '0000'
+
+        source_path = os.path.join(self.conforms_dir, 'lake-man-split2.csv')
+        extract_path = os.path.join(self.testdir, 'lake-man-split2-extracted.csv')
+        dest_path1 = os.path.join(self.testdir, 'lake-man-split2-conformed1.csv')
+        dest_path2 = os.path.join(self.testdir, 'lake-man-split2-conformed2.csv')
+
+        self.assertIsNotNone(conform_cli(source_definition, source_path, dest_path1))
+        self.assertFalse(os.path.exists(extract_path))
+
+        self.assertIsNotNone(conform_cli(source_definition, source_path, dest_path2, extract_path))
+        self.assertTrue(os.path.exists(extract_path))
+
+        with open(dest_path1, 'rb') as file1, open(dest_path2, 'rb') as file2:
+            self.assertEqual(file1.read(), file2.read())
+
+    def test_lake_man_split2_workers(self):
+        "Conforming in parallel processes should match the serial conform"
+        with open(os.path.join(self.conforms_dir, 'lake-man-split2.json')) as file:
+            source_definition = json.load(file)
+            source_definition['fingerprint'] = '0000'
+
+        source_path = os.path.join(self.conforms_dir, 'lake-man-split2.csv')
+        dest_path1 = os.path.join(self.testdir, 'lake-man-split2-conformed1.csv')
+        dest_path2 = os.path.join(self.testdir, 'lake-man-split2-conformed2.csv')
+
+        self.assertIsNotNone(conform_cli(source_definition, source_path, dest_path1))
+        self.assertIsNotNone(conform_cli(source_definition, source_path, dest_path2, workers=3))
+
+        with open(dest_path1, 'rb') as file1, open(dest_path2, 'rb') as file2:
+            self.assertEqual(file1.read(), file2.read())
+
+        self.assertEqual(sorted(os.listdir(self.testdir)),
+                         ['lake-man-split2-conformed1.csv', 'lake-man-split2-conformed2.csv'])
+
+    def test_lake_man_split2_package(self):
+        "Output written only into a package stream should match the output CSV"
+        with open(os.path.join(self.conforms_dir, 'lake-man-split2.json')) as file:
+            source_definition = json.load(file)
+            source_definition['fingerprint'] = '0000'
+
+        source_path = os.path.join(self.conforms_dir, 'lake-man-split2.csv')
+        dest_path1 = os.path.join(self.testdir, 'lake-man-split2-conformed1.csv')
+        dest_path2 = os.path.join(self.testdir, 'lake-man-split2-conformed2.csv')
+
+        self.assertIsNotNone(conform_cli(source_definition, source_path, dest_path1))
+
+        for workers in (1, 3):
+            package_fp = io.BytesIO()
+            self.assertIsNotNone(conform_cli(source_definition, source_path, dest_path2,
+                                             workers=workers, package_fp=package_fp))
+
+            self.assertFalse(package_fp.closed)
+            self.assertFalse(os.path.exists(dest_path2))
+
+            with open(dest_path1, 'rb') as file:
+                self.assertEqual(file.read(), package_fp.getvalue())
+
+    def test_conform_stats(self):
+        "Row counts should be collected while conforming, however rows are transformed"
+        source_definition = {'type': 'http', 'conform': {'type': 'csv', 'lat': 'y', 'lon': 'x',
+                                                         'number': 'n', 'street': 's'}}
+        source_path = os.path.join(self.testdir, 'source.csv')
+
+        with open(source_path, 'w') as file:
+            file.write('n,s,x,y\n1,Main St,-122.1,37.1\n2,Main St,,\n3,Main St\n\n'
+                       '4,Main St,-122.2,37.2\n5,Main St,-122.3\n')
+
+        for (extract_path, workers) in ((None, 1), (os.path.join(self.testdir, 'extract.csv'), 1), (None, 2)):
+            dest_path = os.path.join(self.testdir, 'out.csv')
+            stats = conform_cli(source_definition, source_path, dest_path, extract_path, workers)
+
+            self.assertEqual(stats.rows_read, 5)
+            self.assertEqual(stats.rows_written, 5)
+            self.assertEqual(stats.rows_skipped, {})
+            self.assertEqual(stats.rows_unlocated, {'blank coordinates': 3})
+            self.assertEqual(stats.null_geometry, 3)
+            self.assertGreaterEqual(stats.extract_time, 0)
+            self.assertGreaterEqual(stats.transform_time, 0)
+            self.assertEqual(set(stats.todict().keys()), {'rows_read', 'rows_written',
+                'rows_skipped', 'rows_unlocated', 'null_geometry', 'extract_time', 'transform_time'})
+            self.assertEqual(ConformStats.fromdict(stats.todict()).rows_unlocated, stats.rows_unlocated)
+
+            with open(dest_path) as file:
+                self.assertEqual(len(list(csv.reader(file))), 1 + stats.rows_written)
+
+        # Repeated column names are counted like csv.DictReader, so rows are skipped.
+        with open(source_path, 'w') as file:
+            file.write('n,s,x,y,s\n1,Main St,-122.1,37.1,Main St\n')
+
+        stats = conform_cli(source_definition, source_path, dest_path)
+        self.assertEqual(stats.rows_read, 1)
+        self.assertEqual(stats.rows_written, 0)
+        self.assertEqual(stats.rows_skipped, {'column count': 1})
+
+    def test_conform_profile(self):
+        "Profiled conforms should time each conform function without changing output"
+        source_definition = {'type': 'http', 'fingerprint': '0000', 'conform': {'type': 'csv',
+            'lat': 'y', 'lon': 'x', 'street': ['s', 't'],
+            'number': {'function': 'regexp', 'field': 'a', 'pattern': '^([0-9]+)'}}}
+        source_path = os.path.join(self.testdir, 'source.csv')
+
+        with open(source_path, 'w') as file:
+            file.write('a,s,t,x,y\n')
+            for n in range(100):
+                file.write('{} Main,Main,St,-122.{},37.{}\n'.format(n, n, n))
+
+        dest_path1 = os.path.join(self.testdir, 'out1.csv')
+        self.assertIsNone(conform_cli(source_definition, source_path, dest_path1).profile)
+
+        for workers in (1, 2):
+            dest_path2 = os.path.join(self.testdir, 'out2.csv')
+            profile = conform_cli(source_definition, source_path, dest_path2, workers=workers, profile=True).profile
+
+            with open(dest_path1, 'rb') as file1, open(dest_path2, 'rb') as file2:
+                self.assertEqual(file1.read(), file2.read())
+
+            self.assertEqual(profile.calls['extract'], 100)
+            self.assertEqual(profile.calls['transform'], 100)
+            self.assertEqual(profile.calls['transform/number (regexp)'], 100)
+            self.assertEqual(profile.calls['transform/street (merge)'], 100)
+            self.assertEqual(profile.calls['transform/hash'], 100)
+            self.assertEqual(profile.calls['transform/write'], 100)
+            self.assertEqual(profile.calls['extract/reproject'], 1)
+            self.assertIn('transform/number (regexp)', profile.report())
+
     def test_nara_jp(self):
         "Test case from jp-nara.json"
-        rc, dest_path = self._run_conform_on_source('jp-nara', 'csv')
-        self.assertEqual(0, rc)
+        stats, dest_path = self._run_conform_on_source('jp-nara', 'csv')
+        self.assertIsNotNone(stats)
         with open(dest_path) as fp:
             rows = list(csv.DictReader(fp))
             self.assertEqual(rows[0]['NUMBER'], '2543-6')
@@ -1018,8 +1368,8 @@ class TestConformCli (unittest.TestCase):
 
     def test_lake_man_3740(self):
         "CSV in an oddball SRS"
-        rc, dest_path = self._run_conform_on_source('lake-man-3740', 'csv')
-        self.assertEqual(0, rc)
+        stats, dest_path = self._run_conform_on_source('lake-man-3740', 'csv')
+        self.assertIsNotNone(stats)
         with open(dest_path) as fp:
             rows = list(csv.DictReader(fp))
             self.assertAlmostEqual(float(rows[0]['LAT']), 37.802612637607439, places=5)
@@ -1027,10 +1377,59 @@ class TestConformCli (unittest.TestCase):
             self.assertEqual(rows[0]['NUMBER'], '5')
             self.assertEqual(rows[0]['STREET'], u'PZ ESPA\u00d1A')
 
+    def test_concurrent_conforms(self):
+        "Sources conformed together in threads should match sources conformed one at a time"
+        sources = [('lake-man-3740', 'csv'), ('jp-nara', 'csv'), ('lake-man', 'shp'),
+                   ('lake-man-epsg26943', 'shp'), ('lake-man-split2', 'csv')]
+        tasks = []
+
+        for (source_name, ext) in sources:
+            with open(os.path.join(self.conforms_dir, "%s.json" % source_name)) as file:
+                source_definition = dict(json.load(file), fingerprint=source_name)
+            source_path = os.path.join(self.conforms_dir, "%s.%s" % (source_name, ext))
+            tasks.append((source_definition, source_path, source_name))
+
+        # A second CSV in another SRS, see TestConformCsv.test_srs
+        source_path = os.path.join(self.testdir, 'portland.csv')
+        with open(source_path, 'w') as file:
+            file.write('n,s,X,Y\n')
+            for n in range(100):
+                file.write('{},SE WOODSTOCK BLVD,{}.924,668868.414\n'.format(3200 + n, 7655600 + n))
+        tasks.append(({'type': 'test', 'fingerprint': 'portland', 'conform': {'type': 'csv',
+                       'lon': 'x', 'lat': 'y', 'srs': 'EPSG:2913', 'number': 'n', 'street': 's'}},
+                      source_path, 'portland'))
+
+        def conform_task(task, suffix, workers=1):
+            source_definition, source_path, source_name = task
+            dest_path = os.path.join(self.testdir, '{}-{}.csv'.format(source_name, suffix))
+            stats = conform_cli(source_definition, source_path, dest_path, workers=workers)
+            with open(dest_path, 'rb') as file:
+                return stats.rows_written, file.read()
+
+        expected = [conform_task(task, 'serial') for task in tasks]
+
+        with concurrent.futures.ThreadPoolExecutor(4) as executor:
+            futures = [executor.submit(conform_task, task, '{}-{}'.format(suffix, index))
+                       for suffix in range(3) for (index, task) in enumerate(tasks)]
+            results = [future.result() for future in futures]
+
+        self.assertEqual(results, expected * 3)
+        self.assertEqual(expected[-1][0], 100)
+
+        # Sharded transforms in threads should spawn their worker processes
+        with mock.patch('multiprocessing.get_context', wraps=multiprocessing.get_context) as get_context, \
+             concurrent.futures.ThreadPoolExecutor(4) as executor:
+            futures = [executor.submit(conform_task, task, 'sharded-{}'.format(index), 2)
+                       for (index, task) in enumerate(tasks)]
+            results = [future.result() for future in futures]
+
+        self.assertEqual(results, expected)
+        self.assertEqual(get_context.mock_calls, [mock.call('spawn')] * len(tasks))
+
     def test_lake_man_gml(self):
         "GML XML files"
-        rc, dest_path = self._run_conform_on_source('lake-man-gml', 'gml')
-        self.assertEqual(0, rc)
+        stats, dest_path = self._run_conform_on_source('lake-man-gml', 'gml')
+        self.assertIsNotNone(stats)
         with open(dest_path) as fp:
             rows = list(csv.DictReader(fp))
             self.assertEqual(6, len(rows))
@@ -1146,6 +1545,9 @@ class TestConformMisc(unittest.TestCase):
         self.assertEqual(None, find_source_path(geojson_conform, ["nope.txt"]))
         self.assertEqual(None, find_source_path(geojson_conform, ["foo.json", "bar.json"]))
 
+        geojson_file_conform = {"type": "notESRI", "conform": {"type": "geojson", "file": "bar.json"}}
+        self.assertEqual("xyzzy/bar.json", find_source_path(geojson_file_conform, ["foo.json", "xyzzy/bar.json"]))
+
     def test_find_esri_source_path(self):
         # test that the legacy ESRI/GeoJSON style works
         old_conform = {"type": "ESRI", "conform": {"type": "geojson"}}
@@ -1162,6 +1564,32 @@ class TestConformMisc(unittest.TestCase):
         self.assertEqual("aa/bar.txt", find_source_path(csv_file_conform, ["license.pdf", "aa/bar.txt"]))
         self.assertEqual(None, find_source_path(csv_file_conform, ["foo.txt"]))
 
+    def test_find_source_parts(self):
+        shp_conform = {"conform": {"type": "shapefile", "number": "n"}}
+        self.assertEqual([(shp_conform, "foo.shp")], find_source_parts(shp_conform, ["foo.shp", "foo.dbf"]))
+        self.assertEqual([], find_source_parts(shp_conform, ["foo.shp", "bar.shp"]))
+
+        shp_files_conform = {"conform": {"type": "shapefile", "number": "n", "file": ["foo.shp", "bar.shp"]}}
+        parts = find_source_parts(shp_files_conform, ["x/foo.shp", "x/bar.shp", "x/baz.shp"])
+        self.assertEqual([(d["conform"], p) for (d, p) in parts],
+                         [({"type": "shapefile", "number": "n", "file": "foo.shp"}, "x/foo.shp"),
+                          ({"type": "shapefile", "number": "n", "file": "bar.shp"}, "x/bar.shp")])
+        self.assertEqual([], find_source_parts(shp_files_conform, ["x/foo.shp", "x/baz.shp"]))
+
+        gdb_layers_conform = {"conform": {"type": "gdb", "layer": ["Addresses", "Parcels"]}}
+        parts = find_source_parts(gdb_layers_conform, ["foo.gdb"])
+        self.assertEqual([(d["conform"], p) for (d, p) in parts],
+                         [({"type": "gdb", "layer": "Addresses"}, "foo.gdb"),
+                          ({"type": "gdb", "layer": "Parcels"}, "foo.gdb")])
+
+        geojson_conform = {"type": "notESRI", "conform": {"type": "geojson", "file": ["foo.json", "bar.json"]}}
+        parts = find_source_parts(geojson_conform, ["foo.json", "bar.json"])
+        self.assertEqual([p for (_, p) in parts], ["foo.json", "bar.json"])
+        self.assertEqual(parts[0][0]["type"], "notESRI")
+
+        self.assertEqual(elaborate_filenames(["Foo.shp", "bar.json"]),
+                         ["foo.shp", "foo.shx", "foo.dbf", "foo.prj", "bar.json"])
+
     def test_find_xml_source_path(self):
         c = {"conform": {"type": "xml"}}
         self.assertEqual("foo.gml", find_source_path(c, ["foo.gml"]))
@@ -1251,6 +1679,79 @@ class TestConformMisc(unittest.TestCase):
         self.assertTrue(is_in('foo/Bar', ['foo/bar']), 'Should match a directory path case-insensitively')
         self.assertTrue(is_in('foo/Bar/baz', ['foo/bar']), 'Should match a directory path case-insensitively')
     
+    def test_zip_decompress_in_place(self):
+        data_dirname = os.path.join(os.path.dirname(__file__), 'data')
+        zip_path = os.path.join(data_dirname, 'us-ca-berkeley-excerpt.zip')
+
+        paths = ZipDecompressTask(True).decompress([zip_path], self.testdir, ['parcels.shp', 'parcels.shx', 'parcels.dbf'])
+        self.assertEqual(sorted(paths), ['/vsizip/{}/Parcels.{}'.format(zip_path, ext) for ext in ('dbf', 'shp', 'shx')])
+        self.assertEqual(os.listdir(os.path.join(self.testdir, 'unzipped')), [])
+
+        # Mixed-case shapefile extensions need normalize_ogr_filename_case().
+        zip_path = os.path.join(data_dirname, 'us-ca-alameda_county-excerpt-mixedcase.zip')
+        paths = ZipDecompressTask(True).decompress([zip_path], self.testdir, [])
+        self.assertIn(os.path.join(self.testdir, 'unzipped', 'SPAD.Shp'), paths)
+
+        paths = ZipDecompressTask(False).decompress([os.path.join(data_dirname, 'us-ca-berkeley-excerpt.zip')], self.testdir, [])
+        self.assertIn(os.path.join(self.testdir, 'unzipped', 'Parcels.shp'), paths)
+
+    def test_is_vsizip_readable(self):
+        self.assertTrue(is_vsizip_readable(['Parcels.shp', 'Parcels.shx', 'Parcels.dbf', 'Parcels.shp.xml']))
+        self.assertTrue(is_vsizip_readable(['PARCELS.SHP', 'PARCELS.SHX', 'PARCELS.DBF', 'PARCELS.PRJ']))
+        self.assertTrue(is_vsizip_readable(['data/', 'data/Addresses.gdb/a00000001.gdbtable', 'README.Txt']))
+        self.assertTrue(is_vsizip_readable([]))
+        self.assertFalse(is_vsizip_readable(['SPAD.Shp', 'SPAD.shx', 'SPAD.dbf']))
+        self.assertFalse(is_vsizip_readable(['parcels.shp', 'parcels.Prj']))
+
+    def test_select_zip_members(self):
+        names = ['Foo.shp', 'foo.shx', 'bar.shp', 'Dir/', 'dir/Foo.shp', 'dir/sub/baz.csv',
+                 'dirt/foo.shp', './foo.dbf']
+
+        for filenames in ([], ['foo.shp'], ['foo.shp', 'foo.shx', 'foo.dbf'], ['dir'],
+                          ['dir/sub'], ['dir/foo.shp'], ['nothing.csv']):
+            self.assertEqual(select_zip_members(names, filenames),
+                             [name for name in names if not filenames or is_in(name, filenames)],
+                             'Should match like is_in() for {}'.format(filenames))
+
+    def test_zip_decompress_threads(self):
+        zip_path = os.path.join(self.testdir, 'source.zip')
+        big_data = os.urandom(1024 * 1024 * 3 + 17)
+
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as z:
+            z.writestr('counties/', b'')
+            z.writestr('counties/big.dbf', big_data)
+            for index in range(20):
+                z.writestr('counties/county{}.csv'.format(index), 'n,{}\n'.format(index))
+            z.writestr('../escape.csv', 'nope')
+
+        with mock.patch.object(conform_module, 'UNZIP_CHUNK_SIZE', 65536):
+            paths = ZipDecompressTask().decompress([zip_path], self.testdir, [])
+
+        unzipped_dir = os.path.join(self.testdir, 'unzipped')
+        self.assertEqual(len(paths), 22)
+        self.assertIn(os.path.join(unzipped_dir, 'escape.csv'), paths)
+
+        with open(os.path.join(unzipped_dir, 'counties', 'big.dbf'), 'rb') as file:
+            self.assertEqual(file.read(), big_data)
+
+        with open(os.path.join(unzipped_dir, 'counties', 'county7.csv')) as file:
+            self.assertEqual(file.read(), 'n,7\n')
+
+        paths = ZipDecompressTask().decompress([zip_path], os.path.join(self.testdir, 'w2'),
+                                               ['counties/county7.csv'])
+        self.assertEqual(paths, [os.path.join(self.testdir, 'w2', 'unzipped', 'counties', 'county7.csv')])
+
+    def test_vsizip_paths(self):
+        names = ['data/', 'data/Addresses.gdb/', 'data/Addresses.gdb/a00000001.gdbtable',
+                 'data/Addresses.gdb/a00000001.gdbtablx', 'data/readme.txt']
+        paths = vsizip_paths('/tmp/source.zip', names)
+
+        self.assertEqual(paths, ['/vsizip//tmp/source.zip/data/Addresses.gdb',
+                                 '/vsizip//tmp/source.zip/data/Addresses.gdb/a00000001.gdbtable',
+                                 '/vsizip//tmp/source.zip/data/Addresses.gdb/a00000001.gdbtablx',
+                                 '/vsizip//tmp/source.zip/data/readme.txt'])
+        self.assertEqual(find_source_path({'conform': {'type': 'gdb'}}, paths), paths[0])
+
     def test_geojson_source_to_csv(self):
         '''
         '''
@@ -1264,6 +1765,200 @@ class TestConformMisc(unittest.TestCase):
             self.assertAlmostEqual(float(row[Y_FIELDNAME]), 40.054962450263616)
             self.assertEqual(row['PARCEL_NUM'], '02-022-003')
 
+    def test_geojson_source_to_csv_empty(self):
+        "An empty FeatureCollection should extract to an empty file with no header"
+        geojson_path = os.path.join(self.testdir, 'empty.geojson')
+        csv_path = os.path.join(self.testdir, 'empty.csv')
+
+        with open(geojson_path, 'w') as file:
+            file.write('{"type": "FeatureCollection", "features": []}')
+
+        geojson_source_to_csv(geojson_path, csv_path)
+
+        with open(csv_path, encoding='utf8') as file:
+            self.assertEqual(file.read(), '')
+
+    def test_row_as_extracted(self):
+        row = row_as_extracted([1, None, 'x\r\ny\rz', -122.5, 37.5])
+        self.assertEqual(row, ['1', '', 'x\ny\nz', '-122.5', '37.5'])
+
+        # Compare with a round trip through a real CSV file
+        fieldnames = ['a', 'b', 'c', X_FIELDNAME, Y_FIELDNAME]
+        csv_path = os.path.join(self.testdir, 'extracted.csv')
+        raw_row = [1.5, True, 'x\r\ny', None, u'\u2603']
+
+        with open(csv_path, 'w', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(fieldnames)
+            writer.writerow(raw_row)
+
+        with open(csv_path, encoding='utf-8') as file:
+            rows = list(csv.reader(file))
+            self.assertEqual(rows[1], row_as_extracted(raw_row))
+
+    def test_geojson_centroids(self):
+        square = [[0, 0], [4, 0], [4, 4], [0, 4], [0, 0]]
+        hole = [[3, 3], [4, 3], [4, 4], [3, 4], [3, 3]]
+        geometries = [
+            dict(type='Point', coordinates=[-122, 37.5]),
+            dict(type='MultiPoint', coordinates=[[0, 0], [1, 2], [2, 4]]),
+            dict(type='Polygon', coordinates=[square]),
+            dict(type='Polygon', coordinates=[list(reversed(square)), hole]),
+            dict(type='MultiPolygon', coordinates=[[square], [[[p[0] + 8, p[1]] for p in square]]]),
+            dict(type='LineString', coordinates=[[0, 0], [2, 2]]),
+            None,
+            dict(type='MultiLineString', coordinates=[[[0, 0], [2, 0]], [[0, 2], [2, 2]]]),
+            dict(type='GeometryCollection', geometries=[dict(type='Polygon', coordinates=[square])]),
+            dict(type='Polygon', coordinates=[[[0, 0, 9], [4, 0, 9], [4, 4, 9], [0, 4, 9], [0, 0, 9]]]),
+            ]
+
+        centroids = geojson_centroids(geometries)
+
+        # Centroids should match OGR's for the same geometries read from JSON
+        for (geometry, centroid) in zip(geometries, centroids):
+            if geometry is not None:
+                center = ogr.CreateGeometryFromJson(json.dumps(geometry)).Centroid()
+                self.assertEqual(centroid, (center.GetX(), center.GetY()))
+
+        self.assertEqual(centroids[0], (-122., 37.5))
+        self.assertEqual(centroids[1], (1., 2.))
+        self.assertEqual(centroids[2], (2., 2.))
+        self.assertAlmostEqual(centroids[3][0], 1.9)
+        self.assertAlmostEqual(centroids[3][1], 1.9)
+        self.assertEqual(centroids[4], (6., 2.))
+        self.assertEqual(centroids[5], (1., 1.))
+        self.assertIsNone(centroids[6])
+        self.assertEqual(centroids[7], (1., 1.))
+        self.assertEqual(centroids[8], (2., 2.))
+        self.assertEqual(centroids[9], (2., 2.))
+
+        for centroid in centroids[:3]:
+            self.assertIs(type(centroid[0]), float)
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_ogr_wkb_centroids(self):
+        source = ogr.Open(os.path.join(os.path.dirname(__file__), 'conforms', 'lake-man-epsg26943.shp'))
+        layer = source.GetLayer(0)
+        wgs84 = osr.SpatialReference()
+        wgs84.ImportFromEPSG(4326)
+        coord_transform = osr.CoordinateTransformation(layer.GetSpatialRef(), wgs84)
+
+        geometries = []
+        for feature in layer:
+            point = feature.GetGeometryRef()
+            diamond = point.Buffer(50, 1)
+            donut = diamond.Difference(point.Buffer(20, 8))
+            multi = ogr.Geometry(ogr.wkbMultiPolygon)
+            multi.AddGeometry(donut)
+            multi.AddGeometry(point.Buffer(10, 2))
+            geometries.extend([point.Clone(), diamond, donut, multi, diamond.Boundary(), None])
+
+        layer = source = None
+        wkbs = [None if geom is None else geom.ExportToWkb() for geom in geometries]
+        xs, ys = ogr_wkb_centroids(wkbs, coord_transform)
+
+        # Centroids should match OGR's for each geometry
+        for (geom, x, y) in zip(geometries, xs, ys):
+            geom = None if geom is None else geom.Clone()
+            self.assertEqual((x, y), ogr_geometry_centroid(geom, coord_transform))
+
+        self.assertIsNone(xs[-1])
+        self.assertAlmostEqual(xs[0], -122.259249687194824, places=5)
+        self.assertAlmostEqual(ys[0], 37.802612637607439, places=5)
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_geojson_polygon_centroids(self):
+        with open(os.path.join(os.path.dirname(__file__), 'data/us-pa-bucks.geojson')) as file:
+            geometries = [feature['geometry'] for feature in json.load(file)['features']]
+
+        source = ogr.Open(os.path.join(os.path.dirname(__file__), 'conforms', 'lake-man-epsg26943.shp'))
+        for feature in source.GetLayer(0):
+            point = feature.GetGeometryRef()
+            multi = ogr.Geometry(ogr.wkbMultiPolygon)
+            multi.AddGeometry(point.Buffer(50, 1).Difference(point.Buffer(20, 8)))
+            multi.AddGeometry(point.Buffer(10, 2))
+            geometries.extend([json.loads(point.Buffer(30, 4).ExportToJson()), json.loads(multi.ExportToJson())])
+
+        source = None
+
+        with mock.patch.object(conform_module, '_geojson_ogr_centroid') as ogr_centroid:
+            centroids = geojson_centroids(geometries)
+
+        # Centroids should match OGR's without reading any polygons into OGR
+        self.assertFalse(ogr_centroid.called)
+
+        for (geometry, centroid) in zip(geometries, centroids):
+            if geometry is not None:
+                center = ogr.CreateGeometryFromJson(json.dumps(geometry)).Centroid()
+                self.assertEqual(centroid, (center.GetX(), center.GetY()))
+
+        self.assertIsNone(centroids[4])
+
+    def test_geojson_geometry_wkb(self):
+        geometries = [
+            dict(type='Point', coordinates=[-122, 37.5]),
+            dict(type='LineString', coordinates=[[0, 0], [2, 2]]),
+            dict(type='Polygon', coordinates=[[[0, 0], [4, 0], [4, 4], [0, 0]], [[1, 1], [2, 1], [2, 2], [1, 1]]]),
+            dict(type='MultiPoint', coordinates=[[0, 0], [1, 2]]),
+            dict(type='MultiLineString', coordinates=[[[0, 0], [2, 0]], [[0, 2], [2, 2]]]),
+            dict(type='MultiPolygon', coordinates=[[[[0, 0], [4, 0], [4, 4], [0, 0]]], [[[8, 0], [9, 0], [9, 1], [8, 0]]]]),
+            dict(type='GeometryCollection', geometries=[dict(type='Point', coordinates=[1, 2, 3])]),
+            ]
+
+        for geometry in geometries:
+            expected = ogr.CreateGeometryFromJson(json.dumps(geometry))
+            expected.FlattenTo2D()
+            geom = ogr.CreateGeometryFromWkb(geojson_geometry_wkb(geometry))
+            self.assertEqual(geom.ExportToWkt(), expected.ExportToWkt())
+
+        with self.assertRaises(ValueError):
+            geojson_geometry_wkb(dict(type='Circle', coordinates=[0, 0]))
+
+        with self.assertRaises(IndexError):
+            geojson_geometry_wkb(dict(type='Polygon', coordinates=[[[0], [1]]]))
+
+    def test_split_extracted_csv(self):
+        data = b'"A\r\nB",C\r\n1,"x\r\ny"\r\n2,"""\r\n"\r\n3,z\r\n4,"\r\n\r\n"\r\n'
+
+        for count in range(1, 8):
+            header, ranges = split_extracted_csv(io.BytesIO(data), count)
+            self.assertEqual(header, b'"A\r\nB",C\r\n')
+            self.assertTrue(len(ranges) <= count)
+            self.assertEqual(ranges[0][0], len(header))
+            self.assertEqual(ranges[-1][1], len(data))
+
+            for ((start1, end1), (start2, end2)) in zip(ranges[:-1], ranges[1:]):
+                self.assertEqual(end1, start2)
+                self.assertIn(data[start2:start2+2], (b'2,', b'3,', b'4,'))
+
+    def test_transform_to_out_csv_workers(self):
+        source_definition = {'fingerprint': '0000', 'conform': {'type': 'csv',
+            'number': 'n', 'street': {'function': 'join', 'fields': ['s', 't']}}}
+        fieldnames = ['n', 's', 't', X_FIELDNAME, Y_FIELDNAME]
+
+        extract_path = os.path.join(self.testdir, 'extracted.csv')
+        dest_path1 = os.path.join(self.testdir, 'conformed1.csv')
+        dest_path2 = os.path.join(self.testdir, 'conformed2.csv')
+
+        with open(extract_path, 'w', encoding='utf-8') as file:
+            writer = csv.DictWriter(file, fieldnames)
+            writer.writeheader()
+            for n in range(500):
+                writer.writerow({'n': n, 's': u'Main\r\n"St"' if n % 7 else u'\u2603\rSt',
+                                 't': 'x' * (n % 13), X_FIELDNAME: -122 + n / 1000, Y_FIELDNAME: 37})
+
+        transform_to_out_csv(source_definition, extract_path, dest_path1)
+        transform_to_out_csv(source_definition, extract_path, dest_path2, workers=4)
+
+        with open(dest_path1, 'rb') as file1, open(dest_path2, 'rb') as file2:
+            self.assertEqual(file1.read(), file2.read())
+
+        with open(dest_path2, encoding='utf-8') as file:
+            rows = list(csv.DictReader(file))
+            self.assertEqual(len(rows), 500)
+            self.assertEqual(rows[0]['STREET'], u'\u2603\nSt')
+            self.assertEqual(rows[499]['NUMBER'], '499')
+
 class TestConformCsv(unittest.TestCase):
     "Fixture to create real files to test csv_source_to_csv()"
 
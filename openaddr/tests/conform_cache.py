@@ -0,0 +1,91 @@
+from __future__ import absolute_import, division, print_function
+
+from os import mkdir
+from os.path import join, exists
+
+import unittest
+import tempfile
+import shutil
+
+from ..conform import ConformStats
+from ..conform_cache import conform_cache_key, from_location, LocalConformCache, S3ConformCache
+
+class TestConformCache (unittest.TestCase):
+
+    def setUp(self):
+        self.testdir = tempfile.mkdtemp(prefix='testConformCache-')
+
+    def tearDown(self):
+        shutil.rmtree(self.testdir)
+
+    def test_conform_cache_key(self):
+        conform = {'type': 'csv', 'number': 'NUM', 'street': ['PRE', 'NAME']}
+        source = {'type': 'http', 'data': 'http://example.com/data.csv',
+                  'conform': conform, 'fingerprint': '0xDEADBEEF'}
+        key = conform_cache_key(source, '1.0.0')
+
+        self.assertEqual(key, conform_cache_key(dict(reversed(list(source.items()))), '1.0.0'))
+        self.assertNotEqual(key, conform_cache_key(dict(source, fingerprint='0xBEEFDEAD'), '1.0.0'))
+        self.assertNotEqual(key, conform_cache_key(dict(source, conform=dict(conform, number='N')), '1.0.0'))
+        self.assertNotEqual(key, conform_cache_key(source, '1.0.1'))
+        self.assertIsNone(conform_cache_key(dict(source, fingerprint=None), '1.0.0'))
+
+        # Anything else in the source definition can change conform output
+        self.assertNotEqual(key, conform_cache_key(dict(source, type='ftp'), '1.0.0'))
+        self.assertNotEqual(key, conform_cache_key(dict(source, compression='zip'), '1.0.0'))
+        self.assertNotEqual(key, conform_cache_key(dict(source, data='http://example.com/other.csv'), '1.0.0'))
+
+        # Cache details and descriptive metadata can't
+        volatile = {'cache': 'http://s3.amazonaws.com/cache.csv', 'version': '20261017',
+                    'cache etag': '"abc"', 'cache last modified': 'Sat, 17 Oct 2026 00:00:00 GMT',
+                    'cache content length': 123, 'cache url': 'http://example.com/data.csv',
+                    'website': 'http://example.com', 'attribution': 'Example',
+                    'license': 'Public Domain'}
+        self.assertEqual(key, conform_cache_key(dict(source, **volatile), '1.0.0'))
+
+    def test_local_conform_cache(self):
+        output_cache = LocalConformCache(join(self.testdir, 'cache'))
+        self.assertIsNone(output_cache.get('abc', self.testdir))
+
+        out_path = join(self.testdir, 'first.csv')
+        with open(out_path, 'w') as file:
+            file.write('LON,LAT,NUMBER\n1,2,3\n')
+
+        stats = ConformStats()
+        stats.rows_read, stats.rows_written = 2, 1
+        stats.skip('column count')
+
+        with open(out_path, 'rb') as out_file:
+            output_cache.put('abc', out_file, [['NUMBER'], ['3']], 'Point', stats)
+
+        destdir = join(self.testdir, 'dest')
+        mkdir(destdir)
+        entry = output_cache.get('abc', destdir)
+
+        self.assertEqual(entry.path, join(destdir, 'out.csv'))
+        self.assertEqual(entry.sample, [['NUMBER'], ['3']])
+        self.assertEqual(entry.geometry_type, 'Point')
+        self.assertEqual(ConformStats.fromdict(entry.stats).todict(), stats.todict())
+
+        with open(entry.path) as file:
+            self.assertEqual(file.read(), 'LON,LAT,NUMBER\n1,2,3\n')
+
+        self.assertTrue(exists(join(self.testdir, 'cache', 'abc', 'out.csv')))
+
+    def test_from_location(self):
+        self.assertIsNone(from_location(None))
+
+        output_cache = from_location(join(self.testdir, 'cache'))
+        self.assertIsInstance(output_cache, LocalConformCache)
+        self.assertEqual(output_cache.dirname, join(self.testdir, 'cache'))
+
+        output_cache = from_location('file://' + join(self.testdir, 'cache'))
+        self.assertEqual(output_cache.dirname, join(self.testdir, 'cache'))
+
+        output_cache = from_location('s3://data.openaddresses.io/conform-cache/')
+        self.assertIsInstance(output_cache, S3ConformCache)
+        self.assertEqual(output_cache.s3.bucketname, 'data.openaddresses.io')
+        self.assertEqual(output_cache._key_name('abc', 'out.csv'), 'conform-cache/abc/out.csv')
+
+        with self.assertRaises(ValueError):
+            from_location('ftp://example.com/cache')
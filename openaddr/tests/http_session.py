@@ -0,0 +1,84 @@
+from __future__ import absolute_import, division, print_function
+
+import unittest
+import threading
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from .. import http_session
+
+class _Handler(BaseHTTPRequestHandler):
+    ''' Respond with statuses from the server's list, then 200 OK.
+    '''
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.requests.append(self.client_address)
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        body = 'Status {}'.format(status).encode('utf8')
+
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class TestHTTPSession (unittest.TestCase):
+
+    def setUp(self):
+        http_session.configure(backoff=0)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self.server.requests, self.server.statuses = [], []
+        self.url = 'http://127.0.0.1:{}/'.format(self.server.server_port)
+
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        # Close kept-alive connections so their handler threads can finish
+        http_session.get_session().close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+        http_session.configure(backoff=http_session.HTTP_BACKOFF)
+
+    def test_shared_session(self):
+        session = http_session.get_session()
+        self.assertIs(http_session.get_session(), session)
+
+        adapter = session.get_adapter(self.url)
+        self.assertEqual(adapter.max_retries.total, http_session.HTTP_RETRIES)
+        self.assertIn(503, adapter.max_retries.status_forcelist)
+
+        http_session.configure(retries=1)
+        self.assertIsNot(http_session.get_session(), session)
+        self.assertEqual(http_session.get_session().get_adapter(self.url).max_retries.total, 1)
+        http_session.configure(retries=http_session.HTTP_RETRIES)
+
+        with self.assertRaises(ValueError):
+            http_session.configure(bogus=True)
+
+    def test_keep_alive(self):
+        for i in range(3):
+            self.assertEqual(http_session.get(self.url).status_code, 200)
+
+        # All three requests came from one kept-alive client connection
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(set(self.server.requests)), 1)
+
+    def test_retry_server_errors(self):
+        self.server.statuses[:] = [503, 502]
+        got = http_session.get(self.url)
+        self.assertEqual(got.status_code, 200)
+        self.assertEqual(len(self.server.requests), 3)
+
+        # After the final retry the last error response is returned
+        del self.server.requests[:]
+        self.server.statuses[:] = [500] * (http_session.HTTP_RETRIES + 1)
+        got = http_session.get(self.url)
+        self.assertEqual(got.status_code, 500)
+        self.assertEqual(len(self.server.requests), http_session.HTTP_RETRIES + 1)
@@ -1,10 +1,15 @@
 from __future__ import absolute_import, division, print_function
 
+import io
 import json
+import mock
 import unittest
 
+import ijson.backends.python
+
 from io import BytesIO
 
+from .. import sample
 from ..sample import sample_geojson, stream_geojson
 
 class TestSample (unittest.TestCase):
@@ -79,3 +84,74 @@ class TestSample (unittest.TestCase):
         self.assertEqual(len(feature3['geometry']['coordinates']), 1)
         self.assertEqual(feature3['geometry']['coordinates'][0][0][0], 100.)
         self.assertEqual(feature3['geometry']['coordinates'][0][0][1], 0.)
+    
+    def test_stream_items(self):
+        geojson_input = b'''{ "type": "FeatureCollection", "features": [
+                            { "type": "Feature", "geometry": {"type": "Point", "coordinates": [102.0, 0.5]}, "properties": {"prop0": 1e2, "prop1": 9007199254740993} },
+                            { "type": "Feature", "geometry": { "type": "LineString", "coordinates": [ [102.25, -0.0], [103, 2.9999999999999999999] ] }, "properties": { "prop0": [1.0, {"this": 0.1}], "prop1": true } },
+                            { "type": "Feature", "geometry": null, "properties": { "prop0": "\\u00e9", "prop1": null } }
+                            ] }'''
+        
+        expected = list(sample._stream_geojson_events(BytesIO(geojson_input)))
+        features = list(sample._stream_geojson_items(BytesIO(geojson_input), ijson.backends.python))
+        
+        self.assertEqual(len(features), 3)
+        self.assertEqual(repr(features), repr(expected))
+        
+        self.assertIs(type(features[0]['geometry']['coordinates'][0]), int)
+        self.assertIs(type(features[0]['geometry']['coordinates'][1]), float)
+        self.assertIs(type(features[0]['properties']['prop0']), int)
+        self.assertIs(type(features[0]['properties']['prop1']), float)
+        self.assertIs(type(features[1]['geometry']['coordinates'][1][1]), float)
+        self.assertIs(type(features[1]['properties']['prop0'][0]), int)
+        self.assertEqual(features[2]['properties']['prop0'], u'\u00e9')
+    
+    def test_stream_items_once(self):
+        "Features should be built from one read of a stream, even one that can't seek"
+        class UnseekableBytesIO (BytesIO):
+            def seekable(self):
+                return False
+            def seek(self, *args):
+                raise io.UnsupportedOperation('seek')
+        
+        geojson_input = b'{"features": [{"type": "Feature"}, {"type": "Feature"}], "type": "FeatureCollection"}'
+        backend = ijson.backends.python
+        
+        with mock.patch.object(backend, 'parse', wraps=backend.parse) as parse:
+            features = list(sample._stream_geojson_items(UnseekableBytesIO(geojson_input), backend))
+        
+        self.assertEqual(features, [{'type': 'Feature'}, {'type': 'Feature'}])
+        self.assertEqual(parse.call_count, 1)
+    
+    def test_stream_root(self):
+        "Both ways of streaming should accept and reject the same roots"
+        def stream_items(stream):
+            return sample._stream_geojson_items(stream, ijson.backends.python)
+        
+        valid_inputs = [
+            b'{"type": "FeatureCollection", "crs": {"type": "name"}, "features": [{"type": "Feature"}]}',
+            b'{"features": [{"type": "Feature"}], "fields": [{"type": "esriFieldTypeOID"}]}',
+            b'{"features": [{"type": "Feature"}], "type": "FeatureCollection"}',
+            b'{"type": "Feature", "features": [{"type": "Feature"}]}',
+            ]
+        
+        invalid_inputs = [
+            b'[{"type": "FeatureCollection", "features": [{"type": "Feature"}]}]',
+            b'{"type": null, "features": [{"type": "Feature"}]}',
+            b'{"features": [{"type": "Feature"}], "type": null}',
+            b'{"crs": {"type": {}}, "features": [{"type": "Feature"}]}',
+            b'{"type": "FeatureCollection", "features": {"type": "Feature"}}',
+            ]
+        
+        for stream_features in (sample._stream_geojson_events, stream_items):
+            for geojson_input in valid_inputs:
+                features = list(stream_features(BytesIO(geojson_input)))
+                self.assertEqual(features, [{'type': 'Feature'}])
+        
+            # A lone feature has no features to stream
+            features = list(stream_features(BytesIO(b'{"type": "Feature", "geometry": null}')))
+            self.assertEqual(features, [])
+        
+            for geojson_input in invalid_inputs:
+                with self.assertRaises(ValueError):
+                    list(stream_features(BytesIO(geojson_input)))
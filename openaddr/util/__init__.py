@@ -4,6 +4,7 @@ from urllib.parse import urlparse, parse_qsl, urljoin
 from datetime import datetime, timedelta, date
 from os.path import join, basename, splitext, dirname, exists
 from operator import attrgetter
+from contextlib import contextmanager
 from tempfile import mkstemp
 from os import close, getpid
 import glob, collections
@@ -57,15 +58,41 @@ def set_autoscale_capacity(autoscale, cloudwatch, cloudwatch_ns, capacity):
     if measure['Maximum'] > .9:
         group.set_capacity(capacity)
 
-def package_output(source, processed_path, website, license):
+def package_output(source, processed_path, website, license, columnar_path=None):
     ''' Write a zip archive to temp dir with processed data and optional .vrt.
+    
+        An optional columnar copy of processed data is included alongside.
     '''
     _, ext = splitext(processed_path)
     handle, zip_path = mkstemp(prefix='util-package_output-', suffix='.zip')
     close(handle)
     
     zip_file = zipfile.ZipFile(zip_path, mode='w', compression=zipfile.ZIP_DEFLATED)
+    write_package_extras(zip_file, source, ext, website, license)
+    zip_file.write(processed_path, source + ext)
+    
+    if columnar_path:
+        zip_file.write(columnar_path, source + splitext(columnar_path)[1])
+    
+    zip_file.close()
+    
+    return zip_path
+
+@contextmanager
+def package_output_stream(zip_path, source, website, license, ext='.csv'):
+    ''' Write a zip archive like package_output() to zip_path.
     
+        Yields a binary stream for processed data, which is deflated into
+        the archive as it's written instead of being read from a file.
+    '''
+    with zipfile.ZipFile(zip_path, mode='w', compression=zipfile.ZIP_DEFLATED) as zip_file:
+        write_package_extras(zip_file, source, ext, website, license)
+        with zip_file.open(source + ext, mode='w', force_zip64=True) as stream:
+            yield stream
+
+def write_package_extras(zip_file, source, ext, website, license):
+    ''' Write README and optional .vrt for processed data to an open zip file.
+    '''
     template = join(dirname(__file__), 'templates', 'README.txt')
     with io.open(template, encoding='utf8') as file:
         content = file.read().format(website=website, license=license, date=date.today())
@@ -78,11 +105,6 @@ def package_output(source, processed_path, website, license):
         with io.open(template, encoding='utf8') as file:
             content = file.read().format(source=basename(source))
             zip_file.writestr(source + '.vrt', content.encode('utf8'))
-    
-    zip_file.write(processed_path, source + ext)
-    zip_file.close()
-    
-    return zip_path
 
 def summarize_result_licenses(results):
     '''
@@ -59,7 +59,7 @@ setup(
     },
     test_suite = 'openaddr.tests',
     install_requires = [
-        'boto == 2.43.0', 'dateutils == 0.6.6', 'ijson == 2.3',
+        'boto == 2.43.0', 'dateutils == 0.6.6', 'ijson == 3.6.0',
         
         # Honcho (imported for worker) requires Jinja2 < 2.8.
         'Jinja2 == 2.7.3',
@@ -21,8 +21,12 @@ from openaddr import jobs
 
 from openaddr.tests import TestOA, TestState, TestPackage
 from openaddr.tests.sample import TestSample
-from openaddr.tests.cache import TestCacheExtensionGuessing, TestCacheEsriDownload
+from openaddr.tests.cache import TestCacheExtensionGuessing, TestCacheEsriDownload, TestCacheURLDownload
 from openaddr.tests.conform import TestConformCli, TestConformTransforms, TestConformMisc, TestConformCsv, TestConformLicense, TestConformTests
+from openaddr.tests.conform_cache import TestConformCache
+from openaddr.tests.columnar import TestColumnar
+from openaddr.tests.benchmarks import TestBenchmarks
+from openaddr.tests.http_session import TestHTTPSession
 from openaddr.tests.render import TestRender
 from openaddr.tests.dotmap import TestDotmap
 from openaddr.tests.preview import TestPreview